@@ -0,0 +1,16 @@
+"""
+Performance benchmarks for the document catalogue hot paths.
+
+Run from the project root:  python -m benchmarks --help
+"""
+
+# Catalogue sizes (number of documents) and tree shapes (depth, fan-out)
+SIZES = {
+    "1k": 1000,
+    "100k": 100 * 1000,
+    "1m": 1000 * 1000,
+}
+SHAPES = {
+    "shallow": (1, 50),
+    "deep": (6, 3),
+}
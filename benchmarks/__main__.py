@@ -0,0 +1,118 @@
+"""
+Benchmark the document catalogue views against a synthetic catalogue in a throw-away test database.
+
+    python -m benchmarks --size 100k --shape deep --iterations 100
+    python -m benchmarks --documents 5000 --depth 3 --fanout 4 --json > bench.json
+    python -m benchmarks --throughput --requests 500 --concurrency 20
+"""
+import argparse
+import os
+import sys
+import time
+
+from . import SHAPES, SIZES
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks", description=__doc__.strip().splitlines()[0]
+    )
+    parser.add_argument(
+        "--settings",
+        default=os.environ.get("DJANGO_SETTINGS_MODULE", "tests.settings.private"),
+        help="Django settings module (default: %(default)s)",
+    )
+    parser.add_argument("--size", choices=SIZES, default="1k")
+    parser.add_argument("--shape", choices=SHAPES, default="shallow")
+    parser.add_argument("--documents", type=int, help="overrides --size")
+    parser.add_argument("--depth", type=int, help="overrides --shape tree depth")
+    parser.add_argument("--fanout", type=int, help="overrides --shape tree fan-out")
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--only", nargs="+", metavar="SCENARIO", help="run only the named scenarios"
+    )
+    parser.add_argument(
+        "--no-edits", action="store_true", help="skip upload / delete scenarios"
+    )
+    parser.add_argument(
+        "--throughput",
+        action="store_true",
+        help="also compare search throughput under the WSGI and ASGI handlers",
+    )
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--json", action="store_true", help="output results as JSON")
+    args = parser.parse_args(argv)
+
+    depth, fanout = SHAPES[args.shape]
+    args.documents = args.documents or SIZES[args.size]
+    args.depth = args.depth or depth
+    args.fanout = args.fanout or fanout
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    os.environ["DJANGO_SETTINGS_MODULE"] = args.settings
+
+    import django
+
+    django.setup()
+
+    from django.db import connection
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    from . import catalogue, runner
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        start = time.perf_counter()
+        user, categories = catalogue.build_catalogue(
+            args.documents, args.depth, args.fanout, seed=args.seed
+        )
+        build_time = time.perf_counter() - start
+        results = runner.run_benchmarks(
+            user,
+            runner.default_scenarios(user, categories, include_edits=not args.no_edits),
+            iterations=args.iterations,
+            warmup=args.warmup,
+            only=args.only,
+        )
+        throughput = (
+            runner.run_throughput(user, args.requests, args.concurrency)
+            if args.throughput
+            else []
+        )
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+    metadata = dict(
+        settings=args.settings,
+        vendor=connection.vendor,
+        documents=args.documents,
+        categories=len(categories),
+        depth=args.depth,
+        fanout=args.fanout,
+        iterations=args.iterations,
+    )
+    if args.json:
+        print(runner.format_json(results, throughput, **metadata))
+    else:
+        print(
+            "{documents} documents in {categories} categories "
+            "(depth {depth}, fan-out {fanout}) on {vendor}".format(**metadata),
+            "- built in %.1fs" % build_time,
+            file=sys.stderr,
+        )
+        print(runner.format_report(results))
+        if throughput:
+            print()
+            print(runner.format_throughput_report(throughput))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+"""
+    Build synthetic catalogues of configurable size and shape for benchmarking
+"""
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Permission
+
+from document_catalogue.management.commands.generate_catalogue import (
+    WORDS,
+    CatalogueGenerator,
+)
+
+__all__ = ["WORDS", "build_catalogue", "create_benchmark_user"]
+
+
+def create_benchmark_user(username="benchmark"):
+    """Return a user with all document permissions, creating it if necessary"""
+    user, created = get_user_model().objects.get_or_create(username=username)
+    if created:
+        user.set_password("password")
+        user.save()
+        user.user_permissions.set(
+            Permission.objects.filter(content_type__app_label="document_catalogue")
+        )
+    return user
+
+
+def build_catalogue(documents=1000, depth=2, fanout=5, seed=0):
+    """Build a synthetic catalogue and return (user, categories) used to drive benchmarks"""
+    user = create_benchmark_user()
+    generator = CatalogueGenerator(
+        user,
+        depth=depth,
+        fanout=fanout,
+        prefix="category",
+        seed=seed,
+        save_files=False,
+    )
+    categories, _ = generator.generate(documents)
+    return user, categories
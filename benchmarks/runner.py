@@ -0,0 +1,366 @@
+"""
+    Time catalogue views against a synthetic catalogue and report latency, query counts and bytes rendered
+    Compare the throughput of the search endpoint served by Django's WSGI and ASGI handlers
+"""
+import asyncio
+import json
+import math
+import time
+import types
+from concurrent.futures import ThreadPoolExecutor
+from itertools import cycle, islice
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.db.models import Max
+from django.test import AsyncClient, Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import include, path, reverse
+
+from document_catalogue import models, views
+
+from .catalogue import WORDS
+
+AJAX = {"HTTP_X_REQUESTED_WITH": "XMLHttpRequest"}
+# AsyncClient (Django < 5.0) takes extra request headers by name, rather than as META keys
+ASYNC_AJAX = {"X-Requested-With": "XMLHttpRequest"}
+
+PERCENTILES = (50, 90, 99)
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a non-empty sequence of values"""
+    ordered = sorted(values)
+    rank = max(math.ceil(pct / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def response_size(response):
+    """Return number of bytes in response body, consuming streaming responses"""
+    if response.streaming:
+        return sum(len(chunk) for chunk in response.streaming_content)
+    return len(response.content)
+
+
+class Result:
+    """Timings, query counts and response sizes collected for one scenario"""
+
+    def __init__(self, name):
+        self.name = name
+        self.timings = []
+        self.queries = []
+        self.sizes = []
+        self.errors = 0
+
+    def record(self, elapsed, queries, size, status_code):
+        self.timings.append(elapsed)
+        self.queries.append(queries)
+        self.sizes.append(size)
+        if status_code >= 400:
+            self.errors += 1
+
+    def summary(self):
+        n = len(self.timings)
+        summary = {"scenario": self.name, "n": n, "errors": self.errors}
+        for pct in PERCENTILES:
+            summary["p%s_ms" % pct] = percentile(self.timings, pct) * 1000
+        summary.update(
+            {
+                "max_ms": max(self.timings) * 1000,
+                "queries": sum(self.queries) / n,
+                "max_queries": max(self.queries),
+                "bytes": sum(self.sizes) / n,
+            }
+        )
+        return summary
+
+
+class Scenario:
+    """
+    A named request to benchmark.
+    prepare(iterations) returns one argument per iteration, each passed to request(client, arg)
+    cleanup() is called once the scenario has completed.
+    """
+
+    def __init__(self, name, request, prepare=None, cleanup=None):
+        self.name = name
+        self.request = request
+        self.prepare = prepare or (lambda iterations: [None] * iterations)
+        self.cleanup = cleanup or (lambda: None)
+
+    def run(self, client, iterations, warmup=0):
+        result = Result(self.name)
+        args = self.prepare(warmup + iterations)
+        for i, arg in enumerate(args):
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                response = self.request(client, arg)
+                size = response_size(response)
+                elapsed = time.perf_counter() - start
+            if i >= warmup:
+                result.record(elapsed, len(queries), size, response.status_code)
+        self.cleanup()
+        return result
+
+
+def _get(url, **extra):
+    return lambda client, arg: client.get(url, **extra)
+
+
+def _created_documents_cleanup():
+    """Return a cleanup function that removes documents (and files) created after this call"""
+    last_pk = models.Document.objects.aggregate(last=Max("pk"))["last"] or 0
+
+    def cleanup():
+        for document in models.Document.objects.filter(pk__gt=last_pk):
+            document.file.delete(save=False)
+            document.delete()
+
+    return cleanup
+
+
+def upload_scenario(category):
+    url = reverse("document_catalogue:api_post", kwargs={"slug": category.slug})
+
+    def request(client, i):
+        upload = SimpleUploadedFile("benchmark-%s.txt" % i, b"Benchmark upload")
+        return client.post(url, {"file": upload}, **AJAX)
+
+    return Scenario(
+        "api_post", request, prepare=range, cleanup=_created_documents_cleanup()
+    )
+
+
+def batch_upload_scenario(category, batch_size=20):
+    url = reverse("document_catalogue:api_post_batch", kwargs={"slug": category.slug})
+
+    def request(client, i):
+        uploads = [
+            SimpleUploadedFile("benchmark-%s-%s.txt" % (i, n), b"Benchmark upload")
+            for n in range(batch_size)
+        ]
+        return client.post(url, {"file": uploads}, **AJAX)
+
+    return Scenario(
+        "api_post_batch",
+        request,
+        prepare=range,
+        cleanup=_created_documents_cleanup(),
+    )
+
+
+def delete_scenario(category, user):
+    def prepare(iterations):
+        return [
+            models.Document.objects.create(
+                category=category,
+                user=user,
+                title="Benchmark delete %s" % i,
+                is_published=True,
+                file="benchmark-delete.txt",
+            ).pk
+            for i in range(iterations)
+        ]
+
+    def request(client, pk):
+        url = reverse("document_catalogue:api_delete", kwargs={"pk": pk})
+        return client.delete(url, **AJAX)
+
+    return Scenario("api_delete", request, prepare=prepare)
+
+
+def search_scenario():
+    url = reverse("document_catalogue:api_search")
+    terms = cycle(WORDS)
+
+    def request(client, arg):
+        return client.get(url, {"q": next(terms)}, **AJAX)
+
+    return Scenario("api_search", request)
+
+
+def default_scenarios(user, categories, include_edits=True):
+    """Return the standard list of benchmark scenarios for the given catalogue"""
+    top = categories[0]
+    deepest = max(categories, key=lambda c: c.level)
+    document = models.Document.published.order_by("pk").first()
+
+    def category_url(category):
+        return reverse(
+            "document_catalogue:category_list", kwargs={"slug": category.slug}
+        )
+
+    def document_url(name):
+        return reverse("document_catalogue:%s" % name, kwargs={"pk": document.pk})
+
+    scenarios = [
+        Scenario("catalogue_list", _get(reverse("document_catalogue:catalogue_list"))),
+        Scenario("category_list_top", _get(category_url(top))),
+        Scenario("category_list_deep", _get(category_url(deepest))),
+        Scenario("document_detail", _get(document_url("document_detail"))),
+        Scenario("document_download", _get(document_url("document_download"))),
+        search_scenario(),
+        Scenario(
+            "api_search_recent", _get(reverse("document_catalogue:api_search"), **AJAX)
+        ),
+    ]
+    if include_edits and models.appConfig.settings.ENABLE_EDIT_URLS:
+        scenarios += [
+            upload_scenario(deepest),
+            batch_upload_scenario(deepest),
+            delete_scenario(deepest, user),
+        ]
+    return scenarios
+
+
+def run_benchmarks(user, scenarios, iterations=50, warmup=5, only=None):
+    """Run each scenario as the given user, return list of Result objects"""
+    client = Client()
+    client.force_login(user)
+    return [
+        scenario.run(client, iterations, warmup=warmup)
+        for scenario in scenarios
+        if not only or scenario.name in only
+    ]
+
+
+def format_report(results):
+    """Return a plain-text table summarising the given results"""
+    header = ("scenario", "n", "err") + tuple("p%s ms" % p for p in PERCENTILES)
+    header += ("max ms", "queries", "max q", "bytes")
+    rows = [header]
+    for result in results:
+        s = result.summary()
+        row = [s["scenario"], s["n"], s["errors"]]
+        row += ["%.2f" % s["p%s_ms" % p] for p in PERCENTILES]
+        row += ["%.2f" % s["max_ms"], "%.1f" % s["queries"], s["max_queries"]]
+        row += ["%d" % s["bytes"]]
+        rows.append(row)
+    widths = [max(len(str(row[i])) for row in rows) for i in range(len(header))]
+    return "\n".join(
+        "  ".join(str(value).rjust(width) for value, width in zip(row, widths))
+        for row in rows
+    )
+
+
+def format_json(results, throughput=(), **metadata):
+    return json.dumps(
+        {
+            **metadata,
+            "results": [result.summary() for result in results],
+            "throughput": [result.summary() for result in throughput],
+        },
+        indent=2,
+    )
+
+
+ASYNC_SEARCH_PATH = "benchmark/async/search/"
+
+
+class Throughput:
+    """Completed requests per second for a batch of concurrent requests"""
+
+    def __init__(self, name, concurrency, responses, elapsed):
+        self.name = name
+        self.concurrency = concurrency
+        self.requests = len(responses)
+        self.errors = sum(1 for response in responses if response.status_code >= 400)
+        self.elapsed = elapsed
+
+    def summary(self):
+        return {
+            "scenario": self.name,
+            "concurrency": self.concurrency,
+            "n": self.requests,
+            "errors": self.errors,
+            "seconds": self.elapsed,
+            "rps": self.requests / self.elapsed,
+        }
+
+
+def wsgi_search(cookies, url, terms, concurrency):
+    """Send a search request for each term through the WSGI handler, from concurrency threads"""
+
+    def request(term):
+        client = Client()
+        client.cookies = cookies
+        return client.get(url, {"q": term}, **AJAX)
+
+    with ThreadPoolExecutor(concurrency) as pool:
+        return list(pool.map(request, terms))
+
+
+def asgi_search(cookies, url, terms, concurrency):
+    """Send a search request for each term through the ASGI handler, with up to concurrency in flight"""
+
+    async def run():
+        client = AsyncClient()
+        client.cookies = cookies
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def request(term):
+            async with semaphore:
+                return await client.get(url, {"q": term}, **ASYNC_AJAX)
+
+        return await asyncio.gather(*(request(term) for term in terms))
+
+    return asyncio.run(run())
+
+
+def async_search_urlconf():
+    """Return a URLconf with the project's URLs, plus the async search view at ASYNC_SEARCH_PATH"""
+    urlconf = types.ModuleType("benchmarks.async_search_urls")
+    urlconf.urlpatterns = [
+        path(ASYNC_SEARCH_PATH, views.DocumentAsyncSearchAPI.as_view()),
+        path("", include(settings.ROOT_URLCONF)),
+    ]
+    return urlconf
+
+
+def run_throughput(user, requests=200, concurrency=10):
+    """
+    Return a Throughput for the search endpoint served by WSGI (sync view), and by ASGI with the sync
+        and the async view, each handling the same requests, as the given user.
+    """
+    client = Client()
+    client.force_login(user)
+    terms = list(islice(cycle(WORDS), requests))
+    with override_settings(ROOT_URLCONF=async_search_urlconf()):
+        search_url = reverse("document_catalogue:api_search")
+        async_url = "/" + ASYNC_SEARCH_PATH
+        handlers = (
+            ("wsgi", wsgi_search, search_url),
+            ("asgi_sync_view", asgi_search, search_url),
+            ("asgi_async_view", asgi_search, async_url),
+        )
+        results = []
+        for name, send, url in handlers:
+            send(client.cookies, url, terms[:concurrency], concurrency)  # warm up
+            start = time.perf_counter()
+            responses = send(client.cookies, url, terms, concurrency)
+            elapsed = time.perf_counter() - start
+            results.append(Throughput(name, concurrency, responses, elapsed))
+    return results
+
+
+def format_throughput_report(results):
+    """Return a plain-text table summarising the given throughput results"""
+    rows = [("handler", "concurrency", "n", "err", "seconds", "req/s")]
+    for result in results:
+        s = result.summary()
+        rows.append(
+            (
+                s["scenario"],
+                s["concurrency"],
+                s["n"],
+                s["errors"],
+                "%.2f" % s["seconds"],
+                "%.1f" % s["rps"],
+            )
+        )
+    widths = [max(len(str(row[i])) for row in rows) for i in range(len(rows[0]))]
+    return "\n".join(
+        "  ".join(str(value).rjust(width) for value, width in zip(row, widths))
+        for row in rows
+    )
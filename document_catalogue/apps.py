@@ -48,6 +48,37 @@ class BaseCatalogueConfig(AppConfig):
         MAX_FILESIZE=getattr(
             django.conf.settings, "DOCUMENT_CATALOGUE_MAX_FILESIZE", 10 * 1024 * 1024
         ),
+        # With private-files, validate uploads by the content type sniffed from their first bytes (with python-magic),
+        #   rather than the content type declared by the client.  Public files are always sniffed.
+        SNIFF_UPLOAD_CONTENT_TYPE=getattr(
+            django.conf.settings, "DOCUMENT_CATALOGUE_SNIFF_UPLOAD_CONTENT_TYPE", False
+        ),
+        # Abort an upload as soon as its content type shows it isn't in the whitelist, rather than once it is received
+        ABORT_DISALLOWED_UPLOADS=getattr(
+            django.conf.settings, "DOCUMENT_CATALOGUE_ABORT_DISALLOWED_UPLOADS", False
+        ),
+        # Staging directory for chunked uploads, while their chunks arrive
+        # None for a sub-directory of FILE_UPLOAD_TEMP_DIR, or the system temp. directory
+        CHUNKED_UPLOAD_DIR=getattr(
+            django.conf.settings, "DOCUMENT_CATALOGUE_CHUNKED_UPLOAD_DIR", None
+        ),
+        # Seconds after its last chunk is received before an incomplete chunked upload is discarded
+        CHUNKED_UPLOAD_EXPIRY=getattr(
+            django.conf.settings,
+            "DOCUMENT_CATALOGUE_CHUNKED_UPLOAD_EXPIRY",
+            24 * 60 * 60,
+        ),
+        # Max. total size in bytes of the incomplete chunked uploads each user may have staged at once, None for no limit
+        CHUNKED_UPLOAD_USER_LIMIT=getattr(
+            django.conf.settings,
+            "DOCUMENT_CATALOGUE_CHUNKED_UPLOAD_USER_LIMIT",
+            100 * 1024 * 1024,
+        ),
+        # Store document files by the SHA-256 of their content, so identical uploads share one stored file (blob)
+        # Each blob is deleted once no document refers to it.  Files stored before this is enabled are unaffected.
+        CONTENT_ADDRESSED_STORAGE=getattr(
+            django.conf.settings, "DOCUMENT_CATALOGUE_CONTENT_ADDRESSED_STORAGE", False
+        ),
         # Plugin Classes used to inject behaviours into standard document list views
         # Define plugins by extending the ABC: document_catalogue.plugins.AbstractViewPlugin
         # Inject them by customizing this setting
@@ -56,8 +87,63 @@ class BaseCatalogueConfig(AppConfig):
             "DOCUMENT_CATALOGUE_LIST_VIEW_PLUGINS",
             ("document_catalogue.plugins.SessionOrderedViewPlugin",),
         ),
+        # Search backend used by the document search API
+        # Value is a dotted path to a class that extends document_catalogue.search.BaseSearchBackend
+        # None to use the full-text search backend for your database (PostgreSQL or SQLite), or icontains search
+        SEARCH_BACKEND=getattr(
+            django.conf.settings, "DOCUMENT_CATALOGUE_SEARCH_BACKEND", None
+        ),
+        # How document downloads are served, after the catalogue's download permission check
+        # None to redirect to the file's URL;  'nginx' (X-Accel-Redirect) or 'apache' (X-Sendfile) to have the web
+        #   server send the file;  or a dotted path to a class that extends document_catalogue.downloads.BaseDownloadServer
+        DOWNLOAD_SERVER=getattr(
+            django.conf.settings, "DOCUMENT_CATALOGUE_DOWNLOAD_SERVER", None
+        ),
+        # URL prefix of the nginx internal location that maps to the root of the document file storage
+        DOWNLOAD_INTERNAL_URL=getattr(
+            django.conf.settings,
+            "DOCUMENT_CATALOGUE_DOWNLOAD_INTERNAL_URL",
+            "/document-catalogue-internal/",
+        ),
+        # Serve search and downloads with async views, for ASGI deployments
+        ASYNC_VIEWS=getattr(
+            django.conf.settings, "DOCUMENT_CATALOGUE_ASYNC_VIEWS", False
+        ),
+        # Expose counters and histograms for catalogue operations at the metrics URL, in Prometheus text format
+        METRICS=getattr(django.conf.settings, "DOCUMENT_CATALOGUE_METRICS", False),
+        # Bearer token that lets a scraper read the metrics - staff users may always read them
+        METRICS_TOKEN=getattr(
+            django.conf.settings, "DOCUMENT_CATALOGUE_METRICS_TOKEN", None
+        ),
+        # Let staff users profile catalogue requests on demand, with the ?profile= request param
+        PROFILING=getattr(django.conf.settings, "DOCUMENT_CATALOGUE_PROFILING", False),
+        # Directory where each profile is saved as a .prof file;  None to only return profiles in the response
+        PROFILING_DIR=getattr(
+            django.conf.settings, "DOCUMENT_CATALOGUE_PROFILING_DIR", None
+        ),
+        # Log queries made by catalogue views that take at least this many seconds, with their EXPLAIN plan
+        SLOW_QUERY_THRESHOLD=getattr(
+            django.conf.settings, "DOCUMENT_CATALOGUE_SLOW_QUERY_THRESHOLD", None
+        ),
+        # Cache (alias from CACHES setting) for data shared between requests, like the category tree
+        CACHE=getattr(django.conf.settings, "DOCUMENT_CATALOGUE_CACHE", "default"),
+        # Number of search results returned per request by the document search API
+        # Clients may request fewer (or more) with the limit request param, up to the max. page size
+        SEARCH_PAGE_SIZE=getattr(
+            django.conf.settings, "DOCUMENT_CATALOGUE_SEARCH_PAGE_SIZE", 20
+        ),
+        SEARCH_MAX_PAGE_SIZE=getattr(
+            django.conf.settings, "DOCUMENT_CATALOGUE_SEARCH_MAX_PAGE_SIZE", 100
+        ),
+        # Max. number of search results returned from any one category - the number of matches in each category is reported
+        SEARCH_RESULTS_PER_CATEGORY=getattr(
+            django.conf.settings, "DOCUMENT_CATALOGUE_SEARCH_RESULTS_PER_CATEGORY", 5
+        ),
     )
 
+    def ready(self):
+        from . import signals  # noqa: F401  -- connect signal receivers
+
 
 class PrivateCatalogueConfig(BaseCatalogueConfig):
     verbose_name = "Private Catalogue"
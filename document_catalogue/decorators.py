@@ -1,8 +1,12 @@
+import asyncio
 from importlib import import_module
 
+from asgiref.sync import sync_to_async
 from django.apps import apps
 from django.core.exceptions import PermissionDenied
 
+from .permission_resolver import has_permission
+
 appConfig = apps.get_app_config("document_catalogue")
 
 permissions = import_module(appConfig.settings.PERMISSIONS)
@@ -11,7 +15,8 @@ permissions = import_module(appConfig.settings.PERMISSIONS)
 def permission_required(permission_fn):
     """
     Constructs a CBV decorator that checks permission_fn(view.request.user, view.kwargs) before calling
-      view.dispatch to test if request.user has a given (object) permission.
+      view.dispatch to test if request.user has a given (object) permission - the result is memoised for the request.
+    For async views, permission_fn runs in a worker thread, as it may query the database (e.g., to load the user).
     Usage:  @permission_required("permission_function_name")  class MyViewClass: ...
     """
 
@@ -19,11 +24,21 @@ def permission_required(permission_fn):
         _dispatch = view_class.dispatch
 
         def dispatch(self, request, *args, **kwargs):
-            if not permission_fn(request.user, **self.kwargs):
+            if not has_permission(request.user, permission_fn, **self.kwargs):
                 raise PermissionDenied()
             return _dispatch(self, request, *args, **kwargs)
 
-        view_class.dispatch = dispatch
+        async def async_dispatch(self, request, *args, **kwargs):
+            if not await sync_to_async(has_permission)(
+                request.user, permission_fn, **self.kwargs
+            ):
+                raise PermissionDenied()
+            return await _dispatch(self, request, *args, **kwargs)
+
+        if asyncio.iscoroutinefunction(_dispatch):
+            view_class.dispatch = async_dispatch
+        else:
+            view_class.dispatch = dispatch
         return view_class
 
     return decorator
@@ -0,0 +1,258 @@
+"""
+Download servers send a Document's file in response to a download request, after the catalogue's permission check.
+
+By default, the download view redirects to the file's URL.  For private files, that URL is served by Django
+    (private-storage), which ties up a worker for the whole transfer.  To hand the transfer off to the web server
+    instead, use one of the web server backends with setting:  DOCUMENT_CATALOGUE_DOWNLOAD_SERVER
+        'nginx'  -  X-Accel-Redirect to an internal location, see DOCUMENT_CATALOGUE_DOWNLOAD_INTERNAL_URL
+        'apache' -  X-Sendfile with the file's path (requires mod_xsendfile)
+    or stream the file through Django, with support for resumed / partial downloads (HTTP Range requests):
+        'django' -  streams from any storage in fixed-size chunks, without buffering the file
+    or a dotted path to your own class that extends BaseDownloadServer.
+
+Async views (see DOCUMENT_CATALOGUE_ASYNC_VIEWS) call aserve().  The streaming server then reads each chunk in a
+    worker thread, so a long download does not block the event loop - on Django 4.2+, which accepts async iterators
+    for streaming responses.  Earlier versions can only stream from a sync iterator.
+"""
+import hashlib
+import mimetypes
+import os
+import re
+from functools import lru_cache
+from urllib.parse import quote
+
+import django
+from asgiref.sync import sync_to_async
+from django.apps import apps
+from django.core.exceptions import ImproperlyConfigured
+from django.http import HttpResponse, HttpResponseRedirect, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, parse_http_date_safe
+from django.utils.module_loading import import_string
+
+appConfig = apps.get_app_config("document_catalogue")
+
+# StreamingHttpResponse accepts async iterators from Django 4.2
+ASYNC_STREAMING = django.VERSION >= (4, 2)
+
+
+class BaseDownloadServer:
+    """Defines the API for a download server"""
+
+    def serve(self, request, document):
+        """Return a response that sends the document's file"""
+        raise NotImplementedError
+
+    async def aserve(self, request, document):
+        """Async variant of serve, for async views - by default, serve runs in a worker thread"""
+        return await sync_to_async(self.serve)(request, document)
+
+    @staticmethod
+    def content_type(document):
+        content_type, encoding = mimetypes.guess_type(document.file.name)
+        return content_type or "application/octet-stream"
+
+    @staticmethod
+    def content_disposition(document):
+        """Return a Content-Disposition that keeps the document's file name, as when redirected to the file's URL"""
+        return "inline; filename*=UTF-8''%s" % quote(document.filename())
+
+
+class RedirectDownloadServer(BaseDownloadServer):
+    """Redirect to the file's URL - the file is served by whatever serves the storage's URLs"""
+
+    def serve(self, request, document):
+        return HttpResponseRedirect(document.file.url)
+
+
+class HeaderDownloadServer(BaseDownloadServer):
+    """
+    Return an empty response with a header that tells the web server which file to send.
+    The response must not be cached by the browser or proxies, as that would by-pass the permission check.
+    """
+
+    header = None
+
+    def get_header_value(self, document):
+        raise NotImplementedError
+
+    def serve(self, request, document):
+        response = HttpResponse(content_type=self.content_type(document))
+        response[self.header] = self.get_header_value(document)
+        response["Content-Disposition"] = self.content_disposition(document)
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+
+class XSendfileDownloadServer(HeaderDownloadServer):
+    """Apache mod_xsendfile (also lighttpd) - sends the file at the given filesystem path"""
+
+    header = "X-Sendfile"
+
+    def get_header_value(self, document):
+        return document.file.path
+
+
+class XAccelRedirectDownloadServer(HeaderDownloadServer):
+    """
+    Nginx - sends the file from an internal location that maps to the root of the document file storage, e.g.:
+        location /document-catalogue-internal/ {
+            internal;
+            alias /path/to/private/media/;
+        }
+    """
+
+    header = "X-Accel-Redirect"
+
+    def get_header_value(self, document):
+        internal_url = appConfig.settings.DOWNLOAD_INTERNAL_URL
+        return quote(os.path.join(internal_url, document.file.name))
+
+
+class StreamingDownloadServer(BaseDownloadServer):
+    """
+    Stream the file from its storage through Django, in fixed-size chunks.
+    Supports a single byte range (Range / If-Range) with 206 Partial Content, so interrupted downloads can be
+        resumed, and conditional requests (If-None-Match / If-Modified-Since) with 304 Not Modified.
+    Requests for multiple ranges are answered with the whole file, as permitted by RFC 7233.
+    """
+
+    chunk_size = 64 * 1024
+    range_re = re.compile(r"^bytes=(?P<start>\d*)-(?P<end>\d*)$")
+
+    @staticmethod
+    def get_etag(document, size):
+        """Return a strong ETag, which changes whenever the document's file is replaced or updated"""
+        data = (document.file.name, size, document.update_date.isoformat())
+        return '"%s"' % hashlib.md5(repr(data).encode("utf-8")).hexdigest()
+
+    def get_range(self, request, size, etag, last_modified):
+        """
+        Return the (start, end) of the requested byte range, inclusive;  None to send the whole file;
+            or raise ValueError if the range can't be satisfied.
+        """
+        range_header = request.META.get("HTTP_RANGE", "")
+        match = self.range_re.match(range_header.replace(" ", ""))
+        if not match or not self.if_range_matches(request, etag, last_modified):
+            return None
+        start, end = match.group("start"), match.group("end")
+        if not start:  # suffix range:  the last end bytes
+            if not end or int(end) == 0:
+                raise ValueError("Unsatisfiable range")
+            return max(size - int(end), 0), size - 1
+        start = int(start)
+        end = min(int(end), size - 1) if end else size - 1
+        if start >= size or start > end:
+            raise ValueError("Unsatisfiable range")
+        return start, end
+
+    @staticmethod
+    def if_range_matches(request, etag, last_modified):
+        """Return True iff there is no If-Range header, or it matches the current version of the file"""
+        if_range = request.META.get("HTTP_IF_RANGE")
+        if not if_range:
+            return True
+        if if_range.startswith('"'):
+            return if_range == etag
+        return parse_http_date_safe(if_range) == last_modified
+
+    def stream(self, file, start, length):
+        """Yield length bytes from file, starting at start, one chunk at a time"""
+        try:
+            file.seek(start)
+            while length > 0:
+                chunk = file.read(min(self.chunk_size, length))
+                if not chunk:
+                    break
+                length -= len(chunk)
+                yield chunk
+        finally:
+            file.close()
+
+    async def astream(self, file, start, length):
+        """Async variant of stream:  each read runs in a worker thread, so it doesn't block the event loop"""
+
+        def run(fn):
+            return sync_to_async(fn, thread_sensitive=False)
+
+        try:
+            await run(file.seek)(start)
+            while length > 0:
+                chunk = await run(file.read)(min(self.chunk_size, length))
+                if not chunk:
+                    break
+                length -= len(chunk)
+                yield chunk
+        finally:
+            await run(file.close)()
+
+    async def aserve(self, request, document):
+        stream = self.astream if ASYNC_STREAMING else self.stream
+        return await sync_to_async(self.serve)(request, document, stream=stream)
+
+    def serve(self, request, document, stream=None):
+        """Return a response that streams the document's file, using the given stream function (default: stream)"""
+        size = document.file.size
+        etag = self.get_etag(document, size)
+        last_modified = int(document.update_date.timestamp())
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            response = self.serve_range(
+                request, document, size, etag, last_modified, stream or self.stream
+            )
+        response["Accept-Ranges"] = "bytes"
+        response["Content-Disposition"] = self.content_disposition(document)
+        response["ETag"] = etag
+        response["Last-Modified"] = http_date(last_modified)
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+    def serve_range(self, request, document, size, etag, last_modified, stream):
+        try:
+            byte_range = self.get_range(request, size, etag, last_modified)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response["Content-Range"] = "bytes */%d" % size
+            return response
+        start, end = byte_range or (0, size - 1)
+        length = end - start + 1 if size else 0
+        if request.method == "HEAD":
+            response = HttpResponse(content_type=self.content_type(document))
+        else:
+            file = document.file.storage.open(document.file.name, "rb")
+            response = StreamingHttpResponse(
+                stream(file, start, length),
+                content_type=self.content_type(document),
+            )
+        if byte_range:
+            response.status_code = 206
+            response["Content-Range"] = "bytes %d-%d/%d" % (start, end, size)
+        response["Content-Length"] = str(length)
+        return response
+
+
+DOWNLOAD_SERVERS = {
+    "redirect": RedirectDownloadServer,
+    "nginx": XAccelRedirectDownloadServer,
+    "apache": XSendfileDownloadServer,
+    "django": StreamingDownloadServer,
+}
+
+
+@lru_cache()
+def get_download_server_class(name):
+    if name in DOWNLOAD_SERVERS:
+        return DOWNLOAD_SERVERS[name]
+    if "." in name:
+        return import_string(name)
+    raise ImproperlyConfigured(
+        "DOCUMENT_CATALOGUE_DOWNLOAD_SERVER should be one of %s, or a python class path."
+        % ", ".join("'%s'" % server for server in DOWNLOAD_SERVERS)
+    )
+
+
+def get_download_server():
+    """Return an instance of the configured download server"""
+    return get_download_server_class(appConfig.settings.DOWNLOAD_SERVER or "redirect")()
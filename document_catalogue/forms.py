@@ -2,16 +2,48 @@ from django import forms
 
 from document_catalogue.fields import ClearableFileWidget
 
-from . import models
-
-
-class DocumentUploadForm(forms.ModelForm):
+from . import models, uploads
+
+
+class MeasuredUploadFormMixin:
+    """
+    Validate a file measured as it was uploaded (see uploads.DocumentUploadHandler) from its measurements,
+        rather than have the model field's validation read the file again.
+    upload_error - the reason the upload handler aborted the upload, reported as the file field's error
+    """
+
+    def __init__(self, *args, upload_error=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.upload_error = upload_error
+
+    def clean(self):
+        if self.upload_error:
+            # replaces e.g. "required" - the file was not received because its upload was aborted
+            self.errors.pop("file", None)
+            self.add_error("file", self.upload_error)
+        return super().clean()
+
+    def clean_file(self):
+        file = self.cleaned_data.get("file")
+        if uploads.is_measured(file):
+            uploads.validate_measured_file(file)
+        return file
+
+    def _get_validation_exclusions(self):
+        exclude = super()._get_validation_exclusions()
+        if uploads.is_measured(self.cleaned_data.get("file")):
+            # a list before Django 4.1, a set after
+            exclude = type(exclude)([*exclude, "file"])
+        return exclude
+
+
+class DocumentUploadForm(MeasuredUploadFormMixin, forms.ModelForm):
     class Meta:
         model = models.Document
         fields = ("file",)
 
 
-class DocumentEditForm(forms.ModelForm):
+class DocumentEditForm(MeasuredUploadFormMixin, forms.ModelForm):
     file = forms.FileField(widget=ClearableFileWidget())
 
     class Meta:
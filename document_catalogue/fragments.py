@@ -0,0 +1,74 @@
+"""
+Versioned cache for rendered template fragments that list a category's documents.
+
+Each category has a generation, which is bumped whenever a Document in the category is saved, deleted or moved
+    to / from it (see signals).  Rendered fragments are cached under a key composed of the category, its current
+    generation, and a variant identifying everything else the rendering depends on (e.g., ordering and user
+    permissions), so a fragment is re-used until one of the category's documents changes.
+Stale fragments are never deleted - they are simply no longer looked up, and expire from the cache.
+Documents updated in bulk (bypassing signals) must call bump_generation() explicitly.
+
+Use the cache with setting:  DOCUMENT_CATALOGUE_CACHE
+"""
+import hashlib
+import uuid
+
+from django.apps import apps
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.utils.safestring import mark_safe
+
+appConfig = apps.get_app_config("document_catalogue")
+
+GENERATION_KEY = "document_catalogue.documents.{category}.generation"
+FRAGMENT_KEY = "document_catalogue.documents.{category}.{generation}.{variant}"
+
+
+def get_cache():
+    return caches[appConfig.settings.CACHE]
+
+
+def get_generation(category_id):
+    """Return the current generation of the category's documents, starting one if there is none"""
+    cache = get_cache()
+    key = GENERATION_KEY.format(category=category_id)
+    generation = cache.get(key)
+    if generation is None:
+        cache.add(key, uuid.uuid4().hex, timeout=None)
+        generation = cache.get(key)
+    return generation
+
+
+def _new_generation(category_id):
+    get_cache().set(
+        GENERATION_KEY.format(category=category_id), uuid.uuid4().hex, timeout=None
+    )
+
+
+def bump_generation(category_id, using=DEFAULT_DB_ALIAS):
+    """
+    Start a new generation for the category's documents, so fragments are re-rendered on next use.
+    Within a transaction, the generation is bumped again on commit, discarding any fragment rendered by another
+        process before the change was visible to it.
+    """
+    _new_generation(category_id)
+    if transaction.get_connection(using).in_atomic_block:
+        transaction.on_commit(lambda: _new_generation(category_id), using=using)
+
+
+def variant_key(*parts):
+    """Return a short, cache-safe key identifying the given parts, which must have a stable repr"""
+    return hashlib.md5(repr(parts).encode("utf-8")).hexdigest()
+
+
+def get_or_render(category_id, variant, render):
+    """Return the fragment for category and variant from the cache, or render() it, cache it, and return it"""
+    cache = get_cache()
+    key = FRAGMENT_KEY.format(
+        category=category_id, generation=get_generation(category_id), variant=variant
+    )
+    fragment = cache.get(key)
+    if fragment is None:
+        fragment = str(render())
+        cache.set(key, fragment)
+    return mark_safe(fragment)
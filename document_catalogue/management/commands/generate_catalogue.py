@@ -0,0 +1,253 @@
+"""
+Bulk-generate a synthetic document catalogue to reproduce production-scale load locally.
+
+    python manage.py generate_catalogue --depth 4 --fanout 5 --documents 1000000
+"""
+import random
+import time
+from collections import defaultdict
+from itertools import count
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max
+
+from document_catalogue import search, tree
+from document_catalogue.models import CategorySortOrder, Document, DocumentCategory
+
+WORDS = (
+    "annual report policy safety manual handbook procedure standard guideline "
+    "budget minutes agenda contract invoice drawing specification inspection "
+    "training schedule summary review plan audit memo checklist form"
+).split()
+
+
+class CatalogueGenerator:
+    """
+    Generates a complete DocumentCategory tree and bulk inserts Documents into it.
+
+    The tree is laid out in memory first, so MPTT fields (tree_id, lft, rght, level) are known up front and
+      each tree level is written with a single bulk_create -- no per-node save() or MPTT tree updates.
+    Documents are written with bulk_create in batches, with sort_order allocated per category in memory,
+      so no per-row sort_order query is issued.
+    """
+
+    def __init__(
+        self,
+        user,
+        depth=3,
+        fanout=5,
+        prefix="generated",
+        seed=0,
+        batch_size=5000,
+        unpublished=0.0,
+        save_files=True,
+    ):
+        self.user = user
+        self.depth = depth
+        self.fanout = fanout
+        self.prefix = prefix
+        self.batch_size = batch_size
+        self.unpublished = unpublished
+        self.save_files = save_files
+        self.rng = random.Random(seed)
+
+    def random_title(self, words=3):
+        return " ".join(self.rng.choice(WORDS) for _ in range(words)).capitalize()
+
+    # Categories
+
+    def layout_tree(self):
+        """Return a list of tree levels, each a list of (category, parent_slug) with MPTT fields assigned"""
+        levels = [[] for _ in range(self.depth)]
+        last_tree_id = DocumentCategory.objects.aggregate(last=Max("tree_id"))["last"]
+        width = len(str(self.fanout - 1))
+        for i in range(self.fanout):
+            slug = "{prefix}-{i:0{width}}".format(prefix=self.prefix, i=i, width=width)
+            tree_id = (last_tree_id or 0) + i + 1
+            self._layout_node(levels, slug, None, tree_id, 0, count(1))
+        return levels
+
+    def _layout_node(self, levels, slug, parent_slug, tree_id, level, counter):
+        path = slug[len(self.prefix) + 1 :].replace("-", ".")
+        node = DocumentCategory(
+            name="{title} {path}".format(title=self.random_title(2), path=path),
+            slug=slug,
+            description=self.random_title(10),
+            tree_id=tree_id,
+            level=level,
+            lft=next(counter),
+        )
+        levels[level].append((node, parent_slug))
+        if level + 1 < self.depth:
+            width = len(str(self.fanout - 1))
+            for i in range(self.fanout):
+                child_slug = "{slug}-{i:0{width}}".format(slug=slug, i=i, width=width)
+                self._layout_node(levels, child_slug, slug, tree_id, level + 1, counter)
+        node.rght = next(counter)
+
+    def create_categories(self):
+        """Bulk insert the category tree, one level at a time, return list of saved categories"""
+        categories = []
+        parents = {}
+        for level in self.layout_tree():
+            nodes = []
+            for node, parent_slug in level:
+                node.parent = parents.get(parent_slug)
+                nodes.append(node)
+            DocumentCategory.objects.bulk_create(nodes, batch_size=self.batch_size)
+            created = DocumentCategory.objects.in_bulk(
+                [node.slug for node in nodes], field_name="slug"
+            )
+            parents.update(created)
+            categories += created.values()
+        return categories
+
+    # Documents
+
+    def placeholder_files(self, categories, save=True):
+        """Return map of category pk to a placeholder file name, saving one small file per category if save"""
+        file_field = Document._meta.get_field("file")
+        files = {}
+        for category in categories:
+            name = file_field.generate_filename(
+                Document(category=category), "placeholder.txt"
+            )
+            if save:
+                content = ContentFile(b"Placeholder for generated documents")
+                name = file_field.storage.save(name, content)
+            files[category.pk] = name
+        return files
+
+    def create_documents(self, categories, documents, progress=None):
+        """Bulk insert documents spread randomly over the given categories, return number created"""
+        last_pk = Document.objects.aggregate(last=Max("pk"))["last"] or 0
+        files = self.placeholder_files(categories, save=self.save_files)
+        sort_orders = defaultdict(int)
+        created = 0
+        while created < documents:
+            batch = [
+                self.make_document(self.rng.choice(categories), sort_orders, files)
+                for _ in range(min(self.batch_size, documents - created))
+            ]
+            Document.objects.bulk_create(batch)
+            created += len(batch)
+            if progress:
+                progress(created)
+        # continue each category's sort_order sequence from the documents generated here
+        CategorySortOrder.objects.bulk_create(
+            CategorySortOrder(category_id=pk, last_sort_order=last)
+            for pk, last in sort_orders.items()
+        )
+        # bulk_create sends no signals, so index the new documents for search in one pass
+        search.get_search_backend().index_documents(
+            Document.objects.filter(pk__gt=last_pk)
+        )
+        return created
+
+    def make_document(self, category, sort_orders, files):
+        sort_orders[category.pk] += 1
+        return Document(
+            category=category,
+            user=self.user,
+            sort_order=sort_orders[category.pk],
+            title=self.random_title(),
+            description=self.random_title(12),
+            is_published=self.rng.random() >= self.unpublished,
+            file=files[category.pk],
+        )
+
+    @transaction.atomic
+    def generate(self, documents, progress=None):
+        """Generate the catalogue, return (categories, number of documents created)"""
+        categories = self.create_categories()
+        created = self.create_documents(categories, documents, progress)
+        tree.invalidate()  # bulk_create sends no signals
+        return categories, created
+
+
+class Command(BaseCommand):
+    help = "Bulk-generate a synthetic category tree and documents for load testing."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--depth", type=int, default=3, help="Tree depth")
+        parser.add_argument(
+            "--fanout", type=int, default=5, help="Number of children per category"
+        )
+        parser.add_argument(
+            "--documents", type=int, default=1000, help="Number of documents"
+        )
+        parser.add_argument(
+            "--prefix", default="generated", help="Slug prefix for generated categories"
+        )
+        parser.add_argument(
+            "--username", help="Owner of generated documents (default: a superuser)"
+        )
+        parser.add_argument(
+            "--unpublished",
+            type=float,
+            default=0.0,
+            help="Fraction of documents left unpublished",
+        )
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument(
+            "--no-files",
+            action="store_true",
+            help="Don't write placeholder files to storage",
+        )
+
+    def get_user(self, username):
+        users = get_user_model().objects.order_by("pk")
+        user = (
+            users.filter(username=username).first()
+            if username
+            else users.filter(is_superuser=True).first()
+        )
+        if not user:
+            raise CommandError(
+                "No user found to own generated documents: specify --username."
+            )
+        return user
+
+    def handle(self, *args, **options):
+        if options["depth"] < 1 or options["fanout"] < 1:
+            raise CommandError("--depth and --fanout must be at least 1.")
+        slug_length = len(options["prefix"]) + options["depth"] * (
+            len(str(options["fanout"] - 1)) + 1
+        )
+        if slug_length > DocumentCategory._meta.get_field("slug").max_length:
+            raise CommandError("Tree is too deep for slugs: use a shorter --prefix.")
+        if DocumentCategory.objects.filter(
+            slug__startswith=options["prefix"] + "-"
+        ).exists():
+            raise CommandError(
+                "Categories with prefix '%s' already exist: choose another --prefix."
+                % options["prefix"]
+            )
+        generator = CatalogueGenerator(
+            self.get_user(options["username"]),
+            depth=options["depth"],
+            fanout=options["fanout"],
+            prefix=options["prefix"],
+            seed=options["seed"],
+            batch_size=options["batch_size"],
+            unpublished=options["unpublished"],
+            save_files=not options["no_files"],
+        )
+        start = time.perf_counter()
+
+        def progress(created):
+            self.stdout.write("  %d documents..." % created, ending="\r")
+
+        categories, documents = generator.generate(
+            options["documents"], progress=progress if options["verbosity"] else None
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                "Generated %d categories and %d documents in %.1fs."
+                % (len(categories), documents, time.perf_counter() - start)
+            )
+        )
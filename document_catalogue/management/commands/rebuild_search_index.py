@@ -0,0 +1,26 @@
+"""
+Rebuild the document full-text search index, e.g., after bulk loading documents.
+
+    python manage.py rebuild_search_index
+"""
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from document_catalogue import search
+
+
+class Command(BaseCommand):
+    help = "Rebuild the document search index."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--database", default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        backend = search.get_search_backend(options["database"])
+        with transaction.atomic(using=options["database"]):
+            backend.rebuild()
+        self.stdout.write(
+            self.style.SUCCESS(
+                "Rebuilt search index with %s." % backend.__class__.__name__
+            )
+        )
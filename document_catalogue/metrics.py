@@ -0,0 +1,434 @@
+"""
+Counters and histograms for catalogue operations, exposed in the Prometheus text format - no client library or
+    external service is required.
+
+Enable with setting:  DOCUMENT_CATALOGUE_METRICS
+The metrics URL (name 'metrics') then serves the current values to staff users, or to scrapers that send
+    the bearer token in setting DOCUMENT_CATALOGUE_METRICS_TOKEN.
+
+Metrics are kept in memory, per process:  with several worker processes, scrape each process, or aggregate.
+"""
+import asyncio
+import hmac
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+
+from django.apps import apps
+from django.core.exceptions import BadRequest, PermissionDenied, SuspiciousOperation
+from django.db import connection
+from django.http import Http404
+from django.http.multipartparser import MultiPartParserError
+
+from .plugins import ViewPluginManager
+
+appConfig = apps.get_app_config("document_catalogue")
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Histogram buckets:  seconds, counts and bytes
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+RESULT_COUNT_BUCKETS = (0, 1, 5, 10, 20, 50, 100)
+BYTES_BUCKETS = tuple(1024**2 * mb for mb in (0.01, 0.1, 1, 10, 100, 1000))
+
+
+def is_enabled():
+    return appConfig.settings.METRICS
+
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+
+    def escape(value):
+        return str(value).replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n")
+
+    return "{%s}" % ",".join('%s="%s"' % (k, escape(v)) for k, v in labels)
+
+
+class Metric:
+    """A named metric, with a value for each combination of its labels"""
+
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}  # label values tuple -> value
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(
+                "%s takes labels %s, not %s"
+                % (self.name, self.labelnames, tuple(labels))
+            )
+        return tuple(labels[name] for name in self.labelnames)
+
+    def samples(self):
+        """Yield (suffix, labels, value) for each sample of the metric"""
+        raise NotImplementedError
+
+    def expose(self):
+        lines = [
+            "# HELP %s %s" % (self.name, self.documentation),
+            "# TYPE %s %s" % (self.name, self.type),
+        ]
+        for suffix, labels, value in self.samples():
+            lines.append(
+                "%s%s%s %s"
+                % (self.name, suffix, format_labels(labels), format_value(value))
+            )
+        return "\n".join(lines)
+
+    def clear(self):
+        with self._lock:
+            self._values = {}
+
+
+class Counter(Metric):
+    """A value that only goes up"""
+
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            yield "_total", zip(self.labelnames, key), value
+
+
+class Histogram(Metric):
+    """Counts of observed values in cumulative buckets, with their sum and count"""
+
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DURATION_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the time taken by the block, in seconds"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def get_count(self, **labels):
+        counts, total = self._values.get(self._key(labels), ([0], 0))
+        return counts[-1]
+
+    def get_sum(self, **labels):
+        return self._values.get(self._key(labels), (None, 0))[1]
+
+    def samples(self):
+        with self._lock:
+            values = sorted((key, (list(c), s)) for key, (c, s) in self._values.items())
+        for key, (counts, total) in values:
+            labels = list(zip(self.labelnames, key))
+            for bound, count in zip(self.buckets, counts):
+                yield "_bucket", labels + [("le", format_value(bound))], count
+            yield "_sum", labels, total
+            yield "_count", labels, counts[-1]
+
+
+class Registry:
+    """The metrics exposed by the metrics view, plus collectors:  callables that update metrics just before exposition"""
+
+    def __init__(self):
+        self.metrics = {}
+        self.collectors = []
+
+    def register(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError("Duplicate metric: %s" % metric.name)
+        self.metrics[metric.name] = metric
+        return metric
+
+    def add_collector(self, collector):
+        self.collectors.append(collector)
+
+    def expose(self):
+        """Return the metrics in the Prometheus text exposition format"""
+        for collector in self.collectors:
+            collector()
+        return "".join(metric.expose() + "\n" for metric in self.metrics.values())
+
+    def clear(self):
+        for metric in self.metrics.values():
+            metric.clear()
+
+
+registry = Registry()
+
+view_duration = registry.register(
+    Histogram(
+        "document_catalogue_view_duration_seconds",
+        "Time to respond to catalogue requests, by URL name",
+        ("url_name",),
+    )
+)
+view_responses = registry.register(
+    Counter(
+        "document_catalogue_view_responses",
+        "Responses to catalogue requests, by URL name and status code",
+        ("url_name", "status"),
+    )
+)
+view_queries = registry.register(
+    Histogram(
+        "document_catalogue_view_queries",
+        "Database queries made by each catalogue request, by URL name (sync views only)",
+        ("url_name",),
+        buckets=QUERY_COUNT_BUCKETS,
+    )
+)
+search_duration = registry.register(
+    Histogram(
+        "document_catalogue_search_duration_seconds",
+        "Time to search the catalogue",
+    )
+)
+search_results = registry.register(
+    Histogram(
+        "document_catalogue_search_results",
+        "Number of documents on each page of search results",
+        buckets=RESULT_COUNT_BUCKETS,
+    )
+)
+upload_bytes = registry.register(
+    Histogram(
+        "document_catalogue_upload_bytes",
+        "Size of each file received",
+        buckets=BYTES_BUCKETS,
+    )
+)
+upload_duration = registry.register(
+    Histogram(
+        "document_catalogue_upload_duration_seconds",
+        "Time to receive each file, from its first to its last byte",
+    )
+)
+uploads_aborted = registry.register(
+    Counter(
+        "document_catalogue_uploads_aborted",
+        "Uploads aborted while they were received, by reason",
+        ("reason",),
+    )
+)
+downloads = registry.register(
+    Counter(
+        "document_catalogue_downloads",
+        "Download responses, by download server and status code",
+        ("server", "status"),
+    )
+)
+plugin_calls = registry.register(
+    Counter(
+        "document_catalogue_plugin_calls",
+        "Calls to each view plugin hook",
+        ("plugin", "hook"),
+    )
+)
+plugin_seconds = registry.register(
+    Counter(
+        "document_catalogue_plugin_seconds",
+        "Time spent in each view plugin hook",
+        ("plugin", "hook"),
+    )
+)
+
+
+def inc(counter, amount=1, **labels):
+    """Increment the counter, if metrics are enabled"""
+    if is_enabled():
+        counter.inc(amount, **labels)
+
+
+def observe(histogram, value, **labels):
+    """Observe the value, if metrics are enabled"""
+    if is_enabled():
+        histogram.observe(value, **labels)
+
+
+def timed(histogram, **labels):
+    """Return a context manager that observes the time taken by its block, if metrics are enabled"""
+    return histogram.time(**labels) if is_enabled() else nullcontext()
+
+
+class QueryCounter:
+    """A database execute wrapper that counts the queries made through it"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+# Statuses of the responses Django makes for exceptions raised by views - any other exception is a server error
+EXCEPTION_STATUS = (
+    (Http404, 404),
+    (PermissionDenied, 403),
+    (BadRequest, 400),
+    (MultiPartParserError, 400),
+    (SuspiciousOperation, 400),
+)
+
+
+def get_exception_status(exception):
+    """Return the status code of the response Django makes for the exception raised by a view"""
+    for exception_class, status in EXCEPTION_STATUS:
+        if isinstance(exception, exception_class):
+            return status
+    return 500
+
+
+def is_lazy(response):
+    """Return True iff the response is a template response that hasn't been rendered yet"""
+    return callable(getattr(response, "render", None)) and not response.is_rendered
+
+
+class ViewRecorder:
+    """
+    Records one request to a view:  its latency, response status and, with a counter, the number of queries made.
+    A template response is recorded once it is rendered, so middleware may still change its template or context.
+    """
+
+    def __init__(self, url_name, counter=None):
+        self.url_name = url_name
+        self.counter = counter
+        self.start = time.perf_counter()
+
+    def counting(self):
+        """Return a context manager that counts the queries made in its block, if there is a counter"""
+        if self.counter is None:
+            return nullcontext()
+        return connection.execute_wrapper(self.counter)
+
+    def record(self, status):
+        if self.counter is not None:
+            view_queries.observe(self.counter.count, url_name=self.url_name)
+        view_duration.observe(time.perf_counter() - self.start, url_name=self.url_name)
+        view_responses.inc(url_name=self.url_name, status=status)
+
+    def record_exception(self, exception):
+        self.record(get_exception_status(exception))
+
+    def record_response(self, response):
+        """Record the response, or wrap its render to record it once rendered, and return it"""
+        if not is_lazy(response):
+            self.record(response.status_code)
+            return response
+        render = response.render
+
+        def recorded_render():
+            del response.render  # recorded once, however often it is rendered
+            try:
+                with self.counting():
+                    rendered = render()
+            except Exception as e:
+                self.record_exception(e)
+                raise
+            self.record(rendered.status_code)
+            return rendered
+
+        response.render = recorded_render  # template responses are rendered lazily
+        return response
+
+
+def instrument_view(view, url_name):
+    """
+    Return the view function wrapped to record its latency and response status, and for sync views the number of
+        queries made on the default database.  Template responses are recorded once rendered, so their rendering
+        is included, and exceptions are recorded with the status of the response Django makes for them.
+        The time to stream a response's content is not included.
+    """
+    if asyncio.iscoroutinefunction(view):
+
+        async def instrumented_view(request, *args, **kwargs):
+            recorder = ViewRecorder(url_name)
+            try:
+                response = await view(request, *args, **kwargs)
+            except Exception as e:
+                recorder.record_exception(e)
+                raise
+            return recorder.record_response(response)
+
+    else:
+
+        def instrumented_view(request, *args, **kwargs):
+            recorder = ViewRecorder(url_name, QueryCounter())
+            try:
+                with recorder.counting():
+                    response = view(request, *args, **kwargs)
+            except Exception as e:
+                recorder.record_exception(e)
+                raise
+            return recorder.record_response(response)
+
+    return wraps(view)(instrumented_view)
+
+
+def instrument_urlpatterns(urlpatterns):
+    """Instrument the view of each named URL pattern, in place, and return the urlpatterns"""
+    for pattern in urlpatterns:
+        if getattr(pattern, "name", None):
+            pattern.callback = instrument_view(pattern.callback, pattern.name)
+    return urlpatterns
+
+
+def enable_plugin_metrics():
+    """Time the view plugins' hooks, and expose their PluginTimer counters as the plugin metrics"""
+    timer = ViewPluginManager.enable_plugin_timer()
+
+    def collect():
+        counters = timer.get_counters()
+        for metric, index in ((plugin_calls, 0), (plugin_seconds, 1)):
+            with metric._lock:
+                metric._values = {
+                    key: values[index] for key, values in counters.items()
+                }
+
+    registry.add_collector(collect)
+    return timer
+
+
+def is_authorized(request):
+    """Return True iff the request may read the metrics:  from a staff user, or with the METRICS_TOKEN bearer token"""
+    if request.user.is_staff:
+        return True
+    token = appConfig.settings.METRICS_TOKEN
+    authorization = request.META.get("HTTP_AUTHORIZATION", "")
+    return bool(token) and hmac.compare_digest(
+        authorization.encode(), ("Bearer %s" % token).encode()
+    )
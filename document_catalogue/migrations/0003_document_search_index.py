@@ -0,0 +1,79 @@
+# Full-text search index for documents - see document_catalogue.search
+
+from django.db import migrations
+from django.db.utils import OperationalError
+
+FTS_TABLE = "document_catalogue_document_fts"
+
+
+def postgresql_forwards(schema_editor):
+    schema_editor.execute(
+        "ALTER TABLE document_catalogue_document ADD COLUMN search_vector tsvector"
+    )
+    schema_editor.execute(
+        "CREATE INDEX document_catalogue_document_search_idx "
+        "ON document_catalogue_document USING GIN (search_vector)"
+    )
+    schema_editor.execute(
+        "UPDATE document_catalogue_document AS d SET search_vector = "
+        "setweight(to_tsvector('english', coalesce(d.title, '')), 'A') || "
+        "setweight(to_tsvector('english', coalesce(c.name, '')), 'B') || "
+        "setweight(to_tsvector('english', coalesce(d.description, '')), 'C') "
+        "FROM document_catalogue_documentcategory AS c WHERE c.id = d.category_id"
+    )
+
+
+def postgresql_backwards(schema_editor):
+    schema_editor.execute(
+        "ALTER TABLE document_catalogue_document DROP COLUMN search_vector"
+    )
+
+
+def sqlite_forwards(schema_editor):
+    try:
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE {fts} USING fts5(title, category, description)".format(
+                fts=FTS_TABLE
+            )
+        )
+    except OperationalError:
+        # SQLite compiled without FTS5 - search falls back to icontains
+        return
+    schema_editor.execute(
+        "INSERT INTO {fts} (rowid, title, category, description) "
+        "SELECT d.id, d.title, c.name, coalesce(d.description, '') "
+        "FROM document_catalogue_document AS d "
+        "JOIN document_catalogue_documentcategory AS c ON c.id = d.category_id".format(
+            fts=FTS_TABLE
+        )
+    )
+
+
+def sqlite_backwards(schema_editor):
+    schema_editor.execute("DROP TABLE IF EXISTS {fts}".format(fts=FTS_TABLE))
+
+
+def forwards(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "postgresql":
+        postgresql_forwards(schema_editor)
+    elif vendor == "sqlite":
+        sqlite_forwards(schema_editor)
+
+
+def backwards(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "postgresql":
+        postgresql_backwards(schema_editor)
+    elif vendor == "sqlite":
+        sqlite_backwards(schema_editor)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("document_catalogue", "0002_auto_20200522_2247"),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards, backwards),
+    ]
@@ -0,0 +1,59 @@
+# Per-category sort_order sequence for documents - see CategorySortOrder
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def start_sequences(apps, schema_editor):
+    """Start each category's sequence after its last document"""
+    Document = apps.get_model("document_catalogue", "Document")
+    CategorySortOrder = apps.get_model("document_catalogue", "CategorySortOrder")
+    db_alias = schema_editor.connection.alias
+    last_sort_orders = (
+        Document.objects.using(db_alias)
+        .order_by()
+        .values("category_id")
+        .annotate(last=Max("sort_order"))
+    )
+    CategorySortOrder.objects.using(db_alias).bulk_create(
+        CategorySortOrder(category_id=row["category_id"], last_sort_order=row["last"])
+        for row in last_sort_orders
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("document_catalogue", "0003_document_search_index"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="document",
+            name="sort_order",
+            field=models.PositiveIntegerField(default=0, verbose_name="Order"),
+        ),
+        migrations.AddIndex(
+            model_name="document",
+            index=models.Index(
+                fields=["category", "sort_order"], name="document_category_order_idx"
+            ),
+        ),
+        migrations.CreateModel(
+            name="CategorySortOrder",
+            fields=[
+                (
+                    "category",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="+",
+                        serialize=False,
+                        to="document_catalogue.documentcategory",
+                    ),
+                ),
+                ("last_sort_order", models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(start_sequences, migrations.RunPython.noop),
+    ]
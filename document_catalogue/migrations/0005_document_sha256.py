@@ -0,0 +1,19 @@
+# SHA-256 of document files, for content-addressed storage - see Document.prepare_file
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("document_catalogue", "0004_document_sort_order_sequence"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="document",
+            name="sha256",
+            field=models.CharField(
+                blank=True, db_index=True, editable=False, max_length=64
+            ),
+        ),
+    ]
@@ -1,14 +1,65 @@
+import hashlib
 import os
 
 import django.conf
 import mptt.models
+import mptt.querysets
 from django.apps import apps
-from django.db import models
+from django.db import IntegrityError, models, router, transaction
+from django.db.models import F, Max, Q
 from django.urls import reverse
 
 appConfig = apps.get_app_config("document_catalogue")
 
 
+def subtree_q(categories, prefix=""):
+    """
+    Return a Q matching the given categories and all their descendants, by each category's lft / rght range.
+    prefix for lookups through a relation, e.g., subtree_q(categories, prefix="category__") to match Documents.
+    """
+    q = Q(pk__in=[])  # matches nothing, when there are no categories
+    for category in categories:
+        q |= Q(
+            **{
+                prefix + "tree_id": category.tree_id,
+                prefix + "lft__gte": category.lft,
+                prefix + "lft__lte": category.rght,
+            }
+        )
+    return q
+
+
+class DocumentCategoryQuerySet(mptt.querysets.TreeQuerySet):
+    """Custom query set for DocumentCategory model"""
+
+    def with_document_counts(self):
+        """
+        Annotate each category with the number of published documents it contains:
+            document_count - directly in the category;  cumulative_document_count - in the category and its descendants
+        Counts are sub-queries on the tree's lft / rght ranges, so the whole tree is counted in a single query.
+        """
+        published = dict(extra_filters={"is_published": True})
+        qs = self.model._tree_manager.add_related_count(
+            self, Document, "category", "document_count", **published
+        )
+        return self.model._tree_manager.add_related_count(
+            qs,
+            Document,
+            "category",
+            "cumulative_document_count",
+            cumulative=True,
+            **published,
+        )
+
+    def in_subtrees(self, categories):
+        """Categories that are any of the given categories, or one of their descendants"""
+        return self.filter(subtree_q(categories))
+
+    def exclude_subtrees(self, categories):
+        """Categories that are neither any of the given categories, nor one of their descendants"""
+        return self.exclude(subtree_q(categories))
+
+
 class DocumentCategory(mptt.models.MPTTModel):
     """
     A hierarchical category system for assets
@@ -22,7 +73,7 @@ class DocumentCategory(mptt.models.MPTTModel):
         "self", on_delete=models.CASCADE, null=True, blank=True, related_name="children"
     )
 
-    objects = mptt.models.TreeManager()
+    objects = mptt.models.TreeManager.from_queryset(DocumentCategoryQuerySet)()
 
     class MPTTMeta:
         order_insertion_by = ["slug"]
@@ -60,6 +111,18 @@ class DocumentQueryset(models.QuerySet):
     def in_category(self, category_slug):
         return self.filter(category__slug=category_slug)
 
+    def in_category_tree(self, category):
+        """Documents in the given category or any of its descendants"""
+        return self.in_category_trees((category,))
+
+    def in_category_trees(self, categories):
+        """Documents in any of the given categories or their descendants"""
+        return self.filter(subtree_q(categories, prefix="category__"))
+
+    def exclude_category_trees(self, categories):
+        """Documents in none of the given categories or their descendants"""
+        return self.exclude(subtree_q(categories, prefix="category__"))
+
 
 BaseDocumentManager = models.Manager.from_queryset(DocumentQueryset)
 
@@ -78,8 +141,33 @@ class PublishedDocumentManager(DocumentManager):
         return super().get_queryset().published()
 
 
+def content_address(sha256, filename):
+    """Return the path of the stored blob with the given SHA-256 hash, keeping the filename's extension"""
+    extension = os.path.splitext(filename)[1].lower()
+    return "%scas/%s/%s%s" % (
+        appConfig.settings.MEDIA_ROOT,
+        sha256[:2],
+        sha256,
+        extension,
+    )
+
+
+def is_content_addressed(name):
+    return name.startswith("%scas/" % appConfig.settings.MEDIA_ROOT)
+
+
+def file_sha256(file):
+    """Return the hex SHA-256 digest of the file's content, read in chunks"""
+    digest = hashlib.sha256()
+    for chunk in file.chunks():
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
 def document_upload_path_callback(instance, filename):
     """Dynamic upload path based on file instance"""
+    if appConfig.settings.CONTENT_ADDRESSED_STORAGE and instance.sha256:
+        return content_address(instance.sha256, filename)
     path = "%s%s/%s" % (appConfig.settings.MEDIA_ROOT, instance.category.slug, filename)
     return path
 
@@ -91,7 +179,7 @@ class Document(models.Model):
 
     category = models.ForeignKey(DocumentCategory, on_delete=models.CASCADE)
 
-    sort_order = models.PositiveSmallIntegerField(default=0, verbose_name="Order")
+    sort_order = models.PositiveIntegerField(default=0, verbose_name="Order")
 
     user = models.ForeignKey(
         django.conf.settings.AUTH_USER_MODEL, on_delete=models.SET(1)
@@ -128,11 +216,21 @@ class Document(models.Model):
             if appConfig.settings.MAX_FILESIZE
             else 0,
         )
+
+    # SHA-256 of the file's content, computed when the file is uploaded - blank for files added otherwise
+    sha256 = models.CharField(max_length=64, blank=True, db_index=True, editable=False)
+
     objects = DocumentManager()
     published = PublishedDocumentManager()
 
     class Meta:
         ordering = ("sort_order",)
+        indexes = [
+            models.Index(
+                fields=["category", "sort_order"],
+                name="document_category_order_idx",
+            ),
+        ]
 
     def __str__(self):
         return self.title
@@ -168,8 +266,154 @@ class Document(models.Model):
     def filename(self):
         return os.path.basename(self.file.name)
 
+    def prepare_file(self):
+        """
+        Hash a newly uploaded file.  With content-addressed storage, refer to the stored blob if the same content is
+            already stored, otherwise store the file now, so identical files later in the same batch can share it.
+        Called on save - call explicitly before bulk_create, and keep_shared_blob after it, or discard_upload
+            if the insert is rolled back.
+        """
+        self._stores_upload = False
+        if not self.file or self.file._committed:
+            return
+        # stored by the insert, or below - unless it shares a stored blob
+        self._stores_upload = True
+        # hashed as it was uploaded, if received by uploads.DocumentUploadHandler
+        self.sha256 = getattr(self.file.file, "sha256", None) or file_sha256(self.file)
+        if not appConfig.settings.CONTENT_ADDRESSED_STORAGE:
+            return
+        name = content_address(self.sha256, self.file.name)
+        if self.file.storage.exists(name):
+            # kept in case the blob is released before this document is committed - see keep_shared_blob
+            self._shared_upload = self.file.file
+            self._stores_upload = False
+            self.file = name
+        else:
+            self.file.save(self.file.name, self.file.file, save=False)
+
+    def keep_shared_blob(self, using=None):
+        """
+        Once the document is committed, store its content-addressed blob again if it was released (deleted)
+            after prepare_file found it, but before this document was committed as a reference to it.
+        Called on save, after the insert - call explicitly after bulk_create.
+        """
+        upload = getattr(self, "_shared_upload", None)
+        if upload is None:
+            return
+        self._shared_upload = None
+        name, storage = self.file.name, self.file.storage
+
+        def restore_blob():
+            if not storage.exists(name):
+                stored = storage.save(name, upload)
+                if stored != name:  # stored again concurrently, by another document
+                    storage.delete(stored)
+
+        transaction.on_commit(restore_blob, using=using)
+
+    def discard_upload(self, using=None):
+        """
+        Delete the file stored for a new upload, once its insert is rolled back:  no document refers to it.
+        A content-addressed blob is released instead, once the enclosing transaction (if any) commits, since
+            a document saved meanwhile may share it.
+        Called on save - call explicitly if a bulk_create is rolled back.
+        """
+        if not getattr(self, "_stores_upload", False) or not self.file._committed:
+            return
+        self._stores_upload = False
+        name, storage = self.file.name, self.file.storage
+        if is_content_addressed(name):
+            transaction.on_commit(
+                lambda: Document.release_file(name, storage, using), using=using
+            )
+        else:
+            storage.delete(name)
+
+    @classmethod
+    def release_file(cls, name, storage, using=None):
+        """Delete a content-addressed blob from storage once no Document refers to it - its reference count is 0"""
+        if not name or not is_content_addressed(name):
+            return
+        sha256 = os.path.basename(name)[:64]  # the hash indexes the lookup
+        if not cls.objects.using(using).filter(sha256=sha256, file=name).exists():
+            storage.delete(name)
+
+    def remember_previous(self, using):
+        """
+        Record the category and file the document has in the database, before it is saved:  a document moved to
+            a new category must be removed from its old category's fragments too, and a replaced file may no longer
+            be referenced by any document - see signals
+        """
+        previous = None
+        if self.pk:
+            previous = (
+                Document.objects.using(using)
+                .filter(pk=self.pk)
+                .values_list("category_id", "file")
+                .first()
+            )
+        self._previous_category_id, self._previous_file = previous or (None, None)
+
+    def is_moved(self):
+        """Return True iff the document is being saved to a different category - see remember_previous"""
+        return self._previous_category_id not in (None, self.category_id)
+
     def save(self, *args, **kwargs):
-        if not self.sort_order:
-            last = Document.objects.order_by("sort_order").values("sort_order").last()
-            self.sort_order = last["sort_order"] + 1 if last else 1
-        super().save(*args, **kwargs)
+        using = kwargs.get("using") or router.db_for_write(Document, instance=self)
+        self.remember_previous(using)
+        try:
+            with transaction.atomic(using=using):
+                self.prepare_file()
+                # sort_order is allocated in the same transaction as the insert, so an aborted save doesn't waste it
+                # a moved document goes to the end of its new category, so it can't share a sort_order there
+                if not self.sort_order or self.is_moved():
+                    self.sort_order = CategorySortOrder.allocate(
+                        self.category_id, using=using
+                    )
+                super().save(*args, **kwargs)
+                self.keep_shared_blob(using)
+        except Exception:
+            self.discard_upload(using)
+            raise
+
+
+class CategorySortOrder(models.Model):
+    """
+    The last sort_order allocated to a Document in each category - a per-category sequence.
+    Allocation increments the category's row with a single atomic UPDATE, which locks the row until the
+        transaction ends, so concurrent uploads to a category always get distinct sort_order values,
+        and costs a primary key lookup no matter how many documents are in the catalogue.
+    """
+
+    category = models.OneToOneField(
+        DocumentCategory, on_delete=models.CASCADE, primary_key=True, related_name="+"
+    )
+    last_sort_order = models.PositiveIntegerField(default=0)
+
+    @classmethod
+    def allocate(cls, category_id, count=1, using=None):
+        """Allocate count consecutive sort_order values in the category and return the first one"""
+        using = using or router.db_for_write(cls)
+        with transaction.atomic(using=using):
+            sequence = cls.objects.using(using).filter(pk=category_id)
+            if not sequence.update(last_sort_order=F("last_sort_order") + count):
+                cls._create(category_id, using)
+                sequence.update(last_sort_order=F("last_sort_order") + count)
+            last = sequence.values_list("last_sort_order", flat=True).get()
+        return last - count + 1
+
+    @classmethod
+    def _create(cls, category_id, using):
+        """Start the category's sequence after its last document (e.g., documents that pre-date the sequence)"""
+        last = (
+            Document.objects.using(using)
+            .filter(category_id=category_id)
+            .aggregate(last=Max("sort_order"))["last"]
+        )
+        try:
+            with transaction.atomic(using=using):
+                cls.objects.using(using).create(
+                    category_id=category_id, last_sort_order=last or 0
+                )
+        except IntegrityError:
+            pass  # created by a concurrent allocation, which now holds the lock on its row
@@ -0,0 +1,167 @@
+"""
+Memoised permission checks, so each permission is evaluated at most once per request.
+
+The resolver is stored on the user object, which Django's authentication middleware loads afresh for each
+    request, so results never outlive the request - views, the permission_required decorator and the `can`
+    template filter all share it through request.user.
+Permission functions are looked up in the configured permissions module once, when this module is imported.
+
+The resolver also applies the permissions module's filter_viewable_ queryset hooks.  A user restricted by either hook
+    sees a copy of the category tree, with their own document counts, and their own cached document lists.
+"""
+from functools import partial
+from importlib import import_module
+
+from django.apps import apps
+from django.db.models import Count, Max, Sum
+from django.utils.functional import cached_property
+
+from . import fragments, tree
+from .models import Document, DocumentCategory
+
+appConfig = apps.get_app_config("document_catalogue")
+
+permissions = import_module(appConfig.settings.PERMISSIONS)
+
+
+def get_permission_functions(module):
+    """Return a dict of the public callables in the permissions module, by name - all are exposed to templates"""
+    return {
+        name: getattr(module, name)
+        for name in dir(module)
+        if not name.startswith("_") and callable(getattr(module, name))
+    }
+
+
+PERMISSION_FUNCTIONS = get_permission_functions(permissions)
+# Permissions that identify what the user may do in templates, see get_state
+STATE_PERMISSIONS = tuple(
+    name for name in sorted(PERMISSION_FUNCTIONS) if name.startswith("user_can_")
+)
+
+RESOLVER_ATTR = "_document_catalogue_permissions"
+
+
+class PermissionResolver:
+    """The results of permission functions for one user, computed on first use"""
+
+    def __init__(self, user):
+        self.user = user
+        self._results = {}
+        self._contexts = {}
+
+    def check(self, permission_fn, **kwargs):
+        """Return permission_fn(user, **kwargs) - kwargs are the view's kwargs, and must be hashable"""
+        key = (permission_fn, tuple(sorted(kwargs.items())))
+        try:
+            return self._results[key]
+        except KeyError:
+            result = self._results[key] = permission_fn(self.user, **kwargs)
+            return result
+
+    def has_perm(self, name, **kwargs):
+        """Return True iff the named permission function grants permission - False if there's no such function"""
+        permission_fn = PERMISSION_FUNCTIONS.get(name)
+        return bool(self.check(permission_fn, **kwargs)) if permission_fn else False
+
+    def get_context(self, **kwargs):
+        """Return a dictionary of permissions (partials that can be called with no arguments) for templates"""
+        key = tuple(sorted(kwargs.items()))
+        if key not in self._contexts:
+            self._contexts[key] = {
+                name: partial(self.check, fn, **kwargs)
+                for name, fn in PERMISSION_FUNCTIONS.items()
+            }
+        return self._contexts[key]
+
+    def get_state(self, **kwargs):
+        """Return a tuple of (name, result) for each user_can_ permission - identifies what the user may do in templates"""
+        return tuple(
+            (name, bool(self.check(PERMISSION_FUNCTIONS[name], **kwargs)))
+            for name in STATE_PERMISSIONS
+        )
+
+    def _filter(self, hook_name, queryset):
+        """Return (queryset filtered by the named hook, True iff the hook restricted it)"""
+        hook = getattr(permissions, hook_name, None)
+        filtered = hook(self.user, queryset) if hook else queryset
+        return filtered, filtered is not queryset
+
+    @cached_property
+    def restricts_categories(self):
+        return self._filter(
+            "filter_viewable_categories", DocumentCategory.objects.all()
+        )[1]
+
+    @cached_property
+    def restricts_documents(self):
+        restricted = self._filter("filter_viewable_documents", Document.objects.all())[
+            1
+        ]
+        return restricted or self.restricts_categories
+
+    def filter_categories(self, queryset):
+        """Return the DocumentCategory queryset restricted to the categories the user may view"""
+        return self._filter("filter_viewable_categories", queryset)[0]
+
+    def filter_documents(self, queryset):
+        """Return the Document queryset restricted to the documents the user may view, in categories they may view"""
+        queryset = self._filter("filter_viewable_documents", queryset)[0]
+        if self.restricts_categories:
+            categories = self.filter_categories(DocumentCategory.objects.all())
+            queryset = queryset.filter(category__in=categories.values("pk"))
+        return queryset
+
+    @cached_property
+    def visible_documents(self):
+        """
+        {category pk: (count, last update, sum of pks)} for the published documents the user may view, by category
+            - identifies which documents are visible, and their versions, with a single GROUP BY query
+        """
+        rows = (
+            self.filter_documents(Document.published.order_by())
+            .values_list("category")
+            .annotate(Count("pk"), Max("update_date"), Sum("pk"))
+        )
+        return {category: tuple(aggregates) for category, *aggregates in rows}
+
+    @cached_property
+    def category_tree(self):
+        """The category tree, with the categories and document counts the user may view"""
+        category_tree = tree.get_category_tree()
+        if not self.restricts_documents:
+            return category_tree  # the shared snapshot
+        category_pks = None
+        if self.restricts_categories:
+            categories = self.filter_categories(DocumentCategory.objects.all())
+            category_pks = set(categories.values_list("pk", flat=True))
+        counts = {pk: count for pk, (count, *_) in self.visible_documents.items()}
+        return category_tree.restrict(category_pks, counts)
+
+    def get_visibility_key(self):
+        """
+        Return None if the user may view every category and document, otherwise a key identifying the user and
+            what they may view - cached content is only shared between users who are not restricted.
+        The key changes whenever a document is shown or hidden, even if the number visible stays the same.
+        """
+        if not self.restricts_documents:
+            return None
+        visible = sorted(
+            (node.pk, self.visible_documents.get(node.pk))
+            for node in self.category_tree.nodes
+        )
+        return self.user.pk, fragments.variant_key(visible)
+
+
+def get_permission_resolver(user):
+    """Return the PermissionResolver for the given user, creating it on first use"""
+    resolver = getattr(user, RESOLVER_ATTR, None)
+    if resolver is None:
+        resolver = PermissionResolver(user)
+        setattr(user, RESOLVER_ATTR, resolver)
+    return resolver
+
+
+def has_permission(user, permission_fn, **kwargs):
+    """Return True iff permission_fn(user, **kwargs), memoised for the user"""
+    return bool(get_permission_resolver(user).check(permission_fn, **kwargs))
@@ -7,6 +7,13 @@ Defaults use django's built in content_type permissions for the Document model.
 
 Each function takes the request use and the view's kwargs as arguments,
     returns True iff user has the required permission for the given object(s).
+
+The filter_viewable_ functions restrict querysets to the objects a user may view, in SQL, and are applied to every
+    list, search and count of categories and documents.  To restrict whole category subtrees, use the lft / rght
+    range lookups of DocumentCategory.objects.in_subtrees / exclude_subtrees and Document.objects.in_category_trees /
+    exclude_category_trees.  Documents in categories the user may not view are always excluded.
+Return the queryset itself, unchanged, when the user may view everything:  users who are not restricted share the
+    catalogue's cached category tree, counts and rendered document lists.
 """
 from django.apps import apps
 
@@ -36,3 +43,13 @@ def user_can_post_document(user, **kwargs):
 def user_can_delete_document(user, **kwargs):
     """Return True iff the given user can delete documents from the catalogue"""
     return user.is_staff or user.has_perm("document_catalogue.delete_document")
+
+
+def filter_viewable_categories(user, queryset):
+    """Return the DocumentCategory queryset restricted to the categories the given user may view"""
+    return queryset
+
+
+def filter_viewable_documents(user, queryset):
+    """Return the Document queryset restricted to the documents the given user may view"""
+    return queryset
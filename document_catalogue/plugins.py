@@ -7,6 +7,7 @@ Dependency Injection Micro-Framework using Plugins
 
 """
 
+import time
 from abc import ABCMeta
 from itertools import chain
 
@@ -35,10 +36,7 @@ class PluginManager:
     def apply_plugins(cls, f):
         """Apply f to each plugin.  f must be a callable that takes a single plugin parameter"""
         for plugin in cls.plugins:
-            try:
-                f(plugin)
-            except AttributeError:
-                pass
+            f(plugin)
 
 
 class RegisterPlugins:
@@ -61,25 +59,166 @@ class RegisterPlugins:
 #########################
 
 
+class PluginTimer:
+    """Counts the calls to, and time spent in, each plugin's hooks - for profiling"""
+
+    def __init__(self):
+        self.counters = {}  # (plugin class name, hook name) -> [calls, seconds]
+
+    @staticmethod
+    def plugin_name(plugin):
+        return "{module}.{name}".format(
+            module=type(plugin).__module__, name=type(plugin).__qualname__
+        )
+
+    def wrap(self, plugin, hook_name, hook):
+        """Return hook wrapped to count its calls and time"""
+        counter = self.counters.setdefault(
+            (self.plugin_name(plugin), hook_name), [0, 0.0]
+        )
+
+        def timed_hook(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return hook(*args, **kwargs)
+            finally:
+                counter[0] += 1
+                counter[1] += time.perf_counter() - start
+
+        return timed_hook
+
+    def get_counters(self):
+        """Return a dict {(plugin class name, hook name): (calls, seconds)}"""
+        return {key: tuple(counter) for key, counter in self.counters.items()}
+
+    def reset(self):
+        for counter in self.counters.values():
+            counter[:] = [0, 0.0]
+
+
 class ViewPluginManager(PluginManager):
-    """Encapsulates logic specific to applying AbstractViewPlugin plugins.  Intended as View mixin"""
+    """
+    Encapsulates logic specific to applying AbstractViewPlugin plugins.  Intended as View mixin
+    The hooks each plugin implements are compiled when plugins are registered, so applying them to a request is a
+        loop over the hooks - default (no-op) AbstractViewPlugin hooks are skipped.  Sub-classes that inherit the
+        plugins inherit, or are re-compiled with, the hooks;  hooks are only re-compiled on a request after the
+        plugin timer is enabled or disabled.
+    The plugins' cache keys compose a key for the view's cached output - it can't be cached if any plugin that
+        changes the queryset or context doesn't supply one.
+    Enable a PluginTimer to count the calls to, and time spent in, each plugin hook.
+    """
+
+    HOOKS = ("apply", "extend_qs", "get_context", "get_cache_key")
+
+    plugin_timer = None
+    # incremented whenever the plugin timer is enabled or disabled, so hooks are re-compiled with or without it
+    _timer_generation = 0
+    # (timer generation, {hook name: tuple of callables}), per class that registers plugins
+    _compiled_hooks = (None, None)
+
+    @classmethod
+    def add_plugins(cls, plugins):
+        super().add_plugins(plugins)
+        cls.compile_hooks()
+
+    @classmethod
+    def compile_hooks(cls):
+        """Compile the plugins' hooks for this class, and for its sub-classes that inherit its plugins"""
+        cls._compiled_hooks = (
+            ViewPluginManager._timer_generation,
+            cls.compile_plugin_hooks(),
+        )
+        for subclass in cls.__subclasses__():
+            if "plugins" not in subclass.__dict__:
+                subclass.compile_hooks()
+
+    @staticmethod
+    def plugin_implements(plugin, name):
+        """Return True iff plugin has the named hook, other than the default AbstractViewPlugin hook"""
+        hook = getattr(plugin, name, None)
+        default = getattr(AbstractViewPlugin, name)
+        return hook is not None and getattr(hook, "__func__", None) is not default
+
+    @classmethod
+    def plugin_is_cacheable(cls, plugin):
+        """Return True iff plugin supplies a cache key, or doesn't change the queryset or context"""
+        if cls.plugin_implements(plugin, "get_cache_key"):
+            return True
+        return not any(
+            cls.plugin_implements(plugin, name) for name in ("extend_qs", "get_context")
+        )
+
+    @classmethod
+    def compile_plugin_hooks(cls):
+        """
+        Return {hook name: tuple of the plugins' callables that implement the hook}, and for key 'cacheable':
+            True iff every plugin is cacheable.
+        """
+        hooks = {}
+        for name in cls.HOOKS:
+            callables = []
+            for plugin in cls.plugins:
+                if not cls.plugin_implements(plugin, name):
+                    continue
+                hook = getattr(plugin, name)
+                if cls.plugin_timer:
+                    hook = cls.plugin_timer.wrap(plugin, name, hook)
+                callables.append(hook)
+            hooks[name] = tuple(callables)
+        hooks["cacheable"] = all(cls.plugin_is_cacheable(p) for p in cls.plugins)
+        return hooks
+
+    @classmethod
+    def get_plugin_hooks(cls, name):
+        """Return a tuple of the plugins' callables that implement the named hook"""
+        generation, hooks = cls._compiled_hooks
+        if generation != ViewPluginManager._timer_generation:
+            cls.compile_hooks()  # the plugin timer was enabled or disabled
+            generation, hooks = cls._compiled_hooks
+        return hooks[name]
+
+    @classmethod
+    def enable_plugin_timer(cls, timer=None):
+        """Time every plugin hook of this class and its sub-classes, return the PluginTimer"""
+        cls.plugin_timer = timer or PluginTimer()
+        ViewPluginManager._timer_generation += 1
+        return cls.plugin_timer
+
+    @classmethod
+    def disable_plugin_timer(cls):
+        cls.plugin_timer = None
+        ViewPluginManager._timer_generation += 1
+
+    @classmethod
+    def plugins_apply(cls, request):
+        """Apply each plugin to the given request"""
+        for hook in cls.get_plugin_hooks("apply"):
+            hook(request)
 
     @classmethod
     def plugins_extend_qs(cls, request, qs):
         """Apply each plugin to the given queryset, in sequence, return resulting queryset"""
-        for plugin in cls.plugins:
-            try:
-                qs = plugin.extend_qs(request, qs)
-            except AttributeError:
-                pass
+        for hook in cls.get_plugin_hooks("extend_qs"):
+            qs = hook(request, qs)
         return qs
 
     @classmethod
     def plugins_get_context(cls, request):
         context = {}
-        cls.apply_plugins(lambda plugin: context.update(plugin.get_context(request)))
+        for hook in cls.get_plugin_hooks("get_context"):
+            context.update(hook(request))
         return context
 
+    @classmethod
+    def plugins_get_cache_key(cls, request):
+        """
+        Return a tuple of the plugins' cache keys for the given request, in registration order - identical for
+            requests the plugins treat identically.  None if the view's output can't be cached.
+        """
+        if not cls.get_plugin_hooks("cacheable"):
+            return None
+        return tuple(hook(request) for hook in cls.get_plugin_hooks("get_cache_key"))
+
 
 class AbstractViewPlugin(metaclass=ABCMeta):
     """Defines the API for a plugin that injects behaviour into a View class"""
@@ -96,6 +235,14 @@ class AbstractViewPlugin(metaclass=ABCMeta):
         """Return a dictionary to be added to the View's context"""
         return {}
 
+    def get_cache_key(self, request):
+        """
+        Return a value, with a stable repr, that identifies this plugin's effect on the view for the given request
+            (e.g., the ordering applied), so output for requests with the same key can be cached and re-used.
+        Plugins that override extend_qs or get_context must override this, or the view's output is never cached.
+        """
+        return None
+
 
 class OrderedViewPlugin(AbstractViewPlugin):
     """Applies ordering to view's queryset based on URL query argument found in request.GET"""
@@ -133,6 +280,9 @@ class OrderedViewPlugin(AbstractViewPlugin):
             qs = qs.order_by(ordering)
         return qs
 
+    def get_cache_key(self, request):
+        return self.get_ordering_key(request)
+
     def get_context(self, request):
         return {
             self.query_param: self.get_ordering_key(request),
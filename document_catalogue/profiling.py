@@ -0,0 +1,172 @@
+"""
+On-demand profiling of catalogue requests, for staff users - to find where a slow page spends its time:
+    database queries (e.g., MPTT lookups), template rendering (e.g., recursetree), plugins or permissions.
+
+Enable with setting:  DOCUMENT_CATALOGUE_PROFILING
+Then a staff user profiles a request by adding the ?profile= request param, or the X-Catalogue-Profile header:
+    profile=1       -  respond with a text report:  the SQL queries, slowest first, and the cProfile stats
+    profile=pstats  -  respond with the cProfile stats, to download and explore with pstats or snakeviz
+The view runs, and its template is rendered, under cProfile while every database query is timed.  A template
+    response is rendered when Django renders it, after middleware, and the profile then replaces it.
+With setting DOCUMENT_CATALOGUE_PROFILING_DIR, each profile is also saved there as a .prof file.
+
+When the setting is disabled, views are not wrapped, so profiling adds no overhead.  Async views are not profiled.
+"""
+import asyncio
+import cProfile
+import io
+import marshal
+import os
+import pstats
+import time
+from functools import wraps
+
+from django.apps import apps
+from django.db import connection
+from django.http import HttpResponse
+
+appConfig = apps.get_app_config("document_catalogue")
+
+PROFILE_PARAM = "profile"
+PROFILE_HEADER = "HTTP_X_CATALOGUE_PROFILE"
+PSTATS_FORMAT = "pstats"
+REPORT_FUNCTIONS = 50  # functions listed in the text report, by cumulative time
+
+
+class QueryTimer:
+    """A database execute wrapper that records each query made through it, with its duration in seconds"""
+
+    def __init__(self):
+        self.queries = []  # (sql, seconds)
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, time.perf_counter() - start))
+
+    @property
+    def total(self):
+        return sum(seconds for sql, seconds in self.queries)
+
+
+def get_profile_format(request):
+    """Return the profile format requested, or None unless a staff user requested a profile"""
+    profile_format = request.GET.get(PROFILE_PARAM) or request.META.get(PROFILE_HEADER)
+    if not profile_format or not request.user.is_staff:
+        return None
+    return profile_format
+
+
+class RequestProfile:
+    """The cProfile stats and SQL queries for one request to a view"""
+
+    def __init__(self, request, url_name):
+        self.request = request
+        self.url_name = url_name
+        self.profiler = cProfile.Profile()
+        self.query_timer = QueryTimer()
+        self.duration = 0.0
+
+    def run(self, function, *args, **kwargs):
+        """Return the result of calling function, profiled and with its queries timed - may be called again"""
+        start = time.perf_counter()
+        with connection.execute_wrapper(self.query_timer):
+            self.profiler.enable()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.profiler.disable()
+                self.duration += time.perf_counter() - start
+
+    def get_stats(self):
+        return pstats.Stats(self.profiler, stream=io.StringIO())
+
+    def save(self, directory):
+        """Save the cProfile stats to a .prof file in the given directory, return its path"""
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(
+            directory, "%s-%s.prof" % (self.url_name, time.strftime("%Y%m%d-%H%M%S"))
+        )
+        self.get_stats().dump_stats(path)
+        return path
+
+    def report(self, response):
+        """Return a text report of the request's SQL queries, slowest first, and its cProfile stats"""
+        lines = [
+            "Profile of %s %s  (%s)"
+            % (self.request.method, self.request.get_full_path(), self.url_name),
+            "Status: %s  Time: %.1f ms  SQL queries: %d (%.1f ms)"
+            % (
+                response.status_code,
+                self.duration * 1000,
+                len(self.query_timer.queries),
+                self.query_timer.total * 1000,
+            ),
+            "",
+            "SQL queries, slowest first:",
+        ]
+        for sql, seconds in sorted(self.query_timer.queries, key=lambda q: -q[1]):
+            lines.append("%8.2f ms  %s" % (seconds * 1000, sql))
+        stats = self.get_stats()
+        stats.sort_stats("cumulative").print_stats(REPORT_FUNCTIONS)
+        lines += ["", stats.stream.getvalue()]
+        return "\n".join(lines)
+
+    def get_response(self, response, profile_format):
+        """Return the profile, in the requested format, in place of the view's response"""
+        if profile_format == PSTATS_FORMAT:
+            profile = HttpResponse(
+                marshal.dumps(self.get_stats().stats),
+                content_type="application/octet-stream",
+            )
+            profile["Content-Disposition"] = (
+                'attachment; filename="%s.prof"' % self.url_name
+            )
+        else:
+            profile = HttpResponse(
+                self.report(response), content_type="text/plain; charset=utf-8"
+            )
+        profile["Cache-Control"] = "private, no-store"
+        return profile
+
+
+def profile_view(view, url_name):
+    """Return the sync view function wrapped to profile requests from staff users, on demand"""
+
+    @wraps(view)
+    def profiled_view(request, *args, **kwargs):
+        profile_format = get_profile_format(request)
+        if profile_format is None:
+            return view(request, *args, **kwargs)
+        profile = RequestProfile(request, url_name)
+
+        def get_profile(response):
+            if appConfig.settings.PROFILING_DIR:
+                profile.save(appConfig.settings.PROFILING_DIR)
+            return profile.get_response(response, profile_format)
+
+        response = profile.run(view, request, *args, **kwargs)
+        render = getattr(response, "render", None)
+        if not callable(render) or response.is_rendered:
+            return get_profile(response)
+
+        def profiled_render():
+            del response.render  # the profile is the rendered response
+            return get_profile(profile.run(render))
+
+        response.render = profiled_render  # template responses are rendered lazily
+        return response
+
+    return profiled_view
+
+
+def profile_urlpatterns(urlpatterns):
+    """Wrap the view of each named URL pattern with a sync view for profiling, in place, and return the urlpatterns"""
+    for pattern in urlpatterns:
+        if getattr(pattern, "name", None) and not asyncio.iscoroutinefunction(
+            pattern.callback
+        ):
+            pattern.callback = profile_view(pattern.callback, pattern.name)
+    return urlpatterns
@@ -0,0 +1,471 @@
+"""
+Pluggable search backends for the document search API.
+
+A search backend filters a Document queryset to those matching a search term and annotates each result
+    with a search_rank (higher is more relevant).
+Full-text backends use the database's native full-text index over document title, category name and
+    description, which is maintained as Documents and DocumentCategories are saved and deleted (see signals).
+
+Default backend is selected by database vendor, falling back to a simple icontains search.
+Swap in your own backend with setting:  DOCUMENT_CATALOGUE_SEARCH_BACKEND
+
+Search results are grouped by category, with the top few results from each category, and returned one page
+    at a time (see paginate).  Each page carries a signed cursor that identifies the position of its last result,
+    so the next page is a bounded keyset query.
+"""
+import re
+from collections import namedtuple
+from itertools import groupby
+from operator import attrgetter
+
+from django.apps import apps
+from django.core import signing
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import BooleanField, F, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+appConfig = apps.get_app_config("document_catalogue")
+
+# Full-text index table (SQLite) and column (PostgreSQL) created by migration 0003_document_search_index
+FTS_TABLE = "document_catalogue_document_fts"
+SEARCH_VECTOR_COLUMN = "search_vector"
+
+CURSOR_SALT = "document_catalogue.search.cursor"
+
+# Databases whose SQL dialect grouped_results_sql is written for - others group search results in python
+GROUPED_SQL_VENDORS = ("postgresql", "sqlite")
+
+
+def search_tokens(term):
+    """Return the list of words in a search term - punctuation is never passed through to a full-text query"""
+    return re.findall(r"\w+", term or "")
+
+
+class BaseSearchBackend:
+    """Defines the API for a document search backend"""
+
+    def __init__(self, using=DEFAULT_DB_ALIAS):
+        self.using = using
+
+    @property
+    def connection(self):
+        return connections[self.using]
+
+    @classmethod
+    def is_available(cls, connection):
+        """Return True iff this backend can be used with the given database connection"""
+        return True
+
+    def search(self, queryset, term):
+        """Filter the Document queryset to documents matching term, annotated with search_rank"""
+        raise NotImplementedError
+
+    def no_results(self, queryset):
+        """Return an empty queryset, annotated like search results"""
+        return queryset.annotate(
+            search_rank=Value(0.0, output_field=FloatField())
+        ).none()
+
+    def index_documents(self, queryset):
+        """Add or update the search index entries for all Documents in the given queryset"""
+        pass
+
+    def remove_documents(self, pks):
+        """Remove search index entries for the given Document pks"""
+        pass
+
+    def index_category(self, category):
+        """Update the search index entries for all Documents in the given category (e.g., after rename)"""
+        self.index_documents(
+            self.document_model.objects.using(self.using).filter(category=category)
+        )
+
+    def rebuild(self):
+        """Rebuild the search index for all Documents"""
+        self.index_documents(self.document_model.objects.using(self.using).all())
+
+    @property
+    def document_model(self):
+        return apps.get_model("document_catalogue", "Document")
+
+    @property
+    def category_table(self):
+        return self.document_model._meta.get_field(
+            "category"
+        ).related_model._meta.db_table
+
+    def _pk_subquery(self, queryset):
+        """Return (sql, params) for a sub-query selecting the pks of the Documents in the given queryset"""
+        query = queryset.order_by().values("pk").query
+        return query.get_compiler(using=self.using).as_sql()
+
+
+class IContainsSearchBackend(BaseSearchBackend):
+    """
+    Fallback search: case-insensitive substring match on document title or category name.
+    No index is used or maintained - every search is a sequential scan.
+    """
+
+    def search(self, queryset, term):
+        filter = Q(title__icontains=term) | Q(category__name__icontains=term)
+        return queryset.filter(filter).annotate(
+            search_rank=Value(0.0, output_field=FloatField())
+        )
+
+
+class PostgresSearchBackend(BaseSearchBackend):
+    """
+    PostgreSQL full-text search over a weighted tsvector column on the Document table, with a GIN index.
+    Results are ranked by ts_rank, with title matches weighted over category name over description.
+    Words are prefix-matched, so results are returned while a word is still being typed.
+    """
+
+    config = "english"
+
+    @classmethod
+    def is_available(cls, connection):
+        return connection.vendor == "postgresql"
+
+    def tsquery(self, term):
+        return " & ".join("{word}:*".format(word=word) for word in search_tokens(term))
+
+    def search(self, queryset, term):
+        tsquery = self.tsquery(term)
+        if not tsquery:
+            return self.no_results(queryset)
+        column = "{table}.{column}".format(
+            table=self.connection.ops.quote_name(self.document_model._meta.db_table),
+            column=SEARCH_VECTOR_COLUMN,
+        )
+        query_sql = "to_tsquery(%s::regconfig, %s)"
+        return queryset.annotate(
+            search_match=RawSQL(
+                "{column} @@ {query}".format(column=column, query=query_sql),
+                (self.config, tsquery),
+                output_field=BooleanField(),
+            ),
+            search_rank=RawSQL(
+                "ts_rank({column}, {query})".format(column=column, query=query_sql),
+                (self.config, tsquery),
+                output_field=FloatField(),
+            ),
+        ).filter(search_match=True)
+
+    def index_documents(self, queryset):
+        document_table = self.document_model._meta.db_table
+        pk_sql, pk_params = self._pk_subquery(queryset)
+        vector = " || ".join(
+            "setweight(to_tsvector(%s::regconfig, coalesce({field}, '')), '{weight}')".format(
+                field=field, weight=weight
+            )
+            for field, weight in (
+                ("d.title", "A"),
+                ("c.name", "B"),
+                ("d.description", "C"),
+            )
+        )
+        sql = (
+            "UPDATE {document_table} AS d SET {column} = {vector} "
+            "FROM {category_table} AS c "
+            "WHERE c.id = d.category_id AND d.id IN ({pk_sql})"
+        ).format(
+            document_table=document_table,
+            category_table=self.category_table,
+            column=SEARCH_VECTOR_COLUMN,
+            vector=vector,
+            pk_sql=pk_sql,
+        )
+        with self.connection.cursor() as cursor:
+            cursor.execute(sql, (self.config,) * 3 + tuple(pk_params))
+
+
+class SQLiteSearchBackend(BaseSearchBackend):
+    """
+    SQLite full-text search using an FTS5 virtual table keyed on Document id.
+    Results are ranked by bm25, with title matches weighted over category name over description.
+    Words are prefix-matched, so results are returned while a word is still being typed.
+    """
+
+    weights = (10.0, 5.0, 1.0)  # title, category, description
+
+    @classmethod
+    def is_available(cls, connection):
+        if connection.vendor != "sqlite":
+            return False
+        return FTS_TABLE in connection.introspection.table_names()
+
+    def match_query(self, term):
+        return " ".join('"{word}"*'.format(word=word) for word in search_tokens(term))
+
+    def search(self, queryset, term):
+        match = self.match_query(term)
+        if not match:
+            return self.no_results(queryset)
+        document_id = "{table}.{column}".format(
+            table=self.connection.ops.quote_name(self.document_model._meta.db_table),
+            column=self.connection.ops.quote_name("id"),
+        )
+        # Join the index table (rather than a correlated sub-query per row) so bm25 statistics
+        #   are computed once per search, not once per matching document.
+        rank_sql = "-bm25({fts}, {weights})".format(
+            fts=FTS_TABLE, weights=", ".join(str(w) for w in self.weights)
+        )
+        return queryset.extra(
+            tables=[FTS_TABLE],
+            where=[
+                "{fts} MATCH %s".format(fts=FTS_TABLE),
+                "{fts}.rowid = {document_id}".format(
+                    fts=FTS_TABLE, document_id=document_id
+                ),
+            ],
+            params=[match],
+        ).annotate(search_rank=RawSQL(rank_sql, (), output_field=FloatField()))
+
+    def index_documents(self, queryset):
+        pk_sql, pk_params = self._pk_subquery(queryset)
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                "DELETE FROM {fts} WHERE rowid IN ({pk_sql})".format(
+                    fts=FTS_TABLE, pk_sql=pk_sql
+                ),
+                pk_params,
+            )
+            cursor.execute(
+                (
+                    "INSERT INTO {fts} (rowid, title, category, description) "
+                    "SELECT d.id, d.title, c.name, coalesce(d.description, '') "
+                    "FROM {document_table} AS d JOIN {category_table} AS c ON c.id = d.category_id "
+                    "WHERE d.id IN ({pk_sql})"
+                ).format(
+                    fts=FTS_TABLE,
+                    document_table=self.document_model._meta.db_table,
+                    category_table=self.category_table,
+                    pk_sql=pk_sql,
+                ),
+                pk_params,
+            )
+
+    def remove_documents(self, pks):
+        pks = list(pks)
+        if not pks:
+            return
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                "DELETE FROM {fts} WHERE rowid IN ({params})".format(
+                    fts=FTS_TABLE, params=", ".join(["%s"] * len(pks))
+                ),
+                pks,
+            )
+
+    def rebuild(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute("DELETE FROM {fts}".format(fts=FTS_TABLE))
+        super().rebuild()
+
+
+# Full-text backends, in order of preference, used when no backend is configured
+FULL_TEXT_BACKENDS = (PostgresSearchBackend, SQLiteSearchBackend)
+
+_backends = {}
+
+
+def get_search_backend(using=DEFAULT_DB_ALIAS):
+    """Return the configured search backend, or best available backend for the database, for using db"""
+    if using not in _backends:
+        if appConfig.settings.SEARCH_BACKEND:
+            backend_class = import_string(appConfig.settings.SEARCH_BACKEND)
+        else:
+            connection = connections[using]
+            backend_class = next(
+                (b for b in FULL_TEXT_BACKENDS if b.is_available(connection)),
+                IContainsSearchBackend,
+            )
+        _backends[using] = backend_class(using=using)
+    return _backends[using]
+
+
+class InvalidCursor(Exception):
+    """Raised when a search cursor token has been tampered with or does not belong to the search term"""
+
+    pass
+
+
+def page_size(limit=None):
+    """Return the number of results per page for requested limit, capped by the DOCUMENT_CATALOGUE_SEARCH_MAX_PAGE_SIZE setting"""
+    try:
+        limit = int(limit)
+    except (TypeError, ValueError):
+        limit = appConfig.settings.SEARCH_PAGE_SIZE
+    return max(1, min(limit, appConfig.settings.SEARCH_MAX_PAGE_SIZE))
+
+
+def make_cursor(term, result):
+    """Return a signed token for the position of the given SearchResult, to fetch the results that follow it"""
+    position = (term, result.category_rank, result.category_id, result.search_position)
+    return signing.dumps(position, salt=CURSOR_SALT, compress=True)
+
+
+def read_cursor(term, cursor):
+    """Return the (category_rank, category_id, search_position) position encoded in the cursor token for term"""
+    try:
+        cursor_term, *position = signing.loads(cursor, salt=CURSOR_SALT)
+        category_rank, category_id, search_position = position
+    except (signing.BadSignature, TypeError, ValueError):
+        raise InvalidCursor("Invalid search cursor")
+    if cursor_term != term:
+        raise InvalidCursor("Search cursor does not match search term")
+    return category_rank, category_id, search_position
+
+
+# One search hit, as selected by grouped_results_sql - Documents and DocumentCategories are never hydrated.
+SearchResult = namedtuple(
+    "SearchResult",
+    (
+        "pk",
+        "title",
+        "category_id",
+        "category_name",
+        "category_total",
+        "category_rank",
+        "search_position",
+    ),
+)
+
+# A page of search hits from a single category.  total is the number of hits in the category, on all pages.
+SearchGroup = namedtuple("SearchGroup", ("category_id", "name", "total", "results"))
+
+
+def groups_in_database(connection):
+    """Return True iff search results are grouped by grouped_results_sql on the database, see GROUPED_SQL_VENDORS"""
+    if connection.vendor not in GROUPED_SQL_VENDORS:
+        return False
+    return connection.features.supports_over_clause
+
+
+def grouped_results_sql(results, per_category, cursor_position=None, limit=None):
+    """
+    Return (sql, params) selecting the top per_category SearchResults in each category, grouped by category.
+    Categories are ordered by their best match, and results within each category by relevance.
+    Written for the databases in GROUPED_SQL_VENDORS:  it uses window functions and a named WINDOW clause.
+    Matches are selected by the ORM in an inner query;  the window functions are computed over it in a raw
+        middle query, as some full-text rank functions (e.g., SQLite bm25) can't be used within a window,
+        and the top-N are filtered in a raw outer query because the ORM can't filter on window expressions.
+    category_rank is cast to double precision, so the value in a cursor round-trips exactly through python and
+        still compares equal - PostgreSQL's ts_rank returns a (single precision) real.
+    """
+    matches = results.order_by().values(
+        "pk",
+        "title",
+        "sort_order",
+        "category_id",
+        "search_rank",
+        category_name=F("category__name"),
+    )
+    matches_sql, params = matches.query.get_compiler(using=results.db).as_sql()
+    windows_sql = (
+        "SELECT id, title, category_id, category_name, "
+        "COUNT(*) OVER by_category AS category_total, "
+        "CAST(MAX(search_rank) OVER by_category AS DOUBLE PRECISION) AS category_rank, "
+        "ROW_NUMBER() OVER (by_category ORDER BY search_rank DESC, sort_order, id) AS search_position "
+        "FROM ({matches}) matches WINDOW by_category AS (PARTITION BY category_id)"
+    ).format(matches=matches_sql)
+    where = ["search_position <= %s"]
+    params = list(params) + [per_category]
+    if cursor_position:
+        category_rank, category_id, search_position = cursor_position
+        where.append(
+            "(category_rank < %s OR (category_rank = %s AND category_id > %s) "
+            "OR (category_rank = %s AND category_id = %s AND search_position > %s))"
+        )
+        params += [
+            category_rank,
+            category_rank,
+            category_id,
+            category_rank,
+            category_id,
+            search_position,
+        ]
+    sql = (
+        "SELECT id, title, category_id, category_name, category_total, category_rank, search_position "
+        "FROM ({windows}) search_results WHERE {where} "
+        "ORDER BY category_rank DESC, category_id, search_position"
+    ).format(windows=windows_sql, where=" AND ".join(where))
+    if limit is not None:
+        sql += " LIMIT %s"
+        params.append(limit)
+    return sql, params
+
+
+def group_results(results, per_category):
+    """Return the top per_category SearchResults in each category, in python - every match is fetched"""
+    matches = results.order_by("-search_rank", "sort_order", "pk").values_list(
+        "pk", "title", "category_id", "category__name", "search_rank"
+    )
+    categories = {}
+    for match in matches:
+        categories.setdefault(match[2], []).append(match)
+    grouped = []
+    for category_id, category_matches in categories.items():
+        category_rank = category_matches[0][4]  # the best match comes first
+        grouped += [
+            SearchResult(
+                pk, title, category_id, name, len(category_matches), category_rank, i
+            )
+            for i, (pk, title, _, name, _) in enumerate(
+                category_matches[:per_category], 1
+            )
+        ]
+    return grouped
+
+
+def grouped_results(results, per_category, cursor_position=None, limit=None):
+    """
+    Return the SearchResults grouped_results_sql selects, grouped in python - for databases it isn't written for.
+    Every match is fetched, so this suits small catalogues, as searched by IContainsSearchBackend.
+    """
+
+    def position(result):
+        """The result's place in the order of grouped_results_sql"""
+        return -result.category_rank, result.category_id, result.search_position
+
+    page = sorted(group_results(results, per_category), key=position)
+    if cursor_position:
+        category_rank, category_id, search_position = cursor_position
+        after = (-category_rank, category_id, search_position)
+        page = [result for result in page if position(result) > after]
+    return page[:limit]
+
+
+def paginate(results, term, cursor=None, limit=None, per_category=None):
+    """
+    Return (groups, next_cursor) for a search results queryset, starting after the position encoded in cursor.
+    groups is a list of SearchGroup, with at most page_size(limit) SearchResults in total and at most
+        per_category results from any one category;  next_cursor is None when there are no more results.
+    A category's results may be split over consecutive pages, in which case it starts the next page.
+    Raises InvalidCursor if the cursor is not valid for the search term.
+    """
+    limit = page_size(limit)
+    per_category = per_category or appConfig.settings.SEARCH_RESULTS_PER_CATEGORY
+    position = read_cursor(term, cursor) if cursor else None
+    connection = connections[results.db]
+    if groups_in_database(connection):
+        sql, params = grouped_results_sql(results, per_category, position, limit + 1)
+        with connection.cursor() as db_cursor:
+            db_cursor.execute(sql, params)
+            page = [SearchResult(*row) for row in db_cursor.fetchall()]
+    else:
+        page = grouped_results(results, per_category, position, limit + 1)
+    next_cursor = None
+    if len(page) > limit:
+        page = page[:limit]
+        next_cursor = make_cursor(term, page[-1])
+    groups = []
+    for category_id, rows in groupby(page, attrgetter("category_id")):
+        rows = list(rows)
+        groups.append(
+            SearchGroup(
+                category_id, rows[0].category_name, rows[0].category_total, rows
+            )
+        )
+    return groups, next_cursor
@@ -0,0 +1,70 @@
+"""
+Signal receivers that keep derived data (search index, cached category tree and fragments) and content-addressed
+    files in sync with the catalogue.
+Connected when the app is ready - see apps.BaseCatalogueConfig.ready
+"""
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from mptt.signals import node_moved
+
+from . import fragments, search, tree
+from .models import Document, DocumentCategory
+
+
+@receiver(post_save, sender=Document)
+def index_document(sender, instance, using, **kwargs):
+    backend = search.get_search_backend(using)
+    backend.index_documents(Document.objects.using(using).filter(pk=instance.pk))
+
+
+@receiver(post_delete, sender=Document)
+def unindex_document(sender, instance, using, **kwargs):
+    search.get_search_backend(using).remove_documents([instance.pk])
+
+
+@receiver(post_save, sender=DocumentCategory)
+def index_category_documents(sender, instance, created, using, **kwargs):
+    if not created:  # category name is indexed with each document
+        search.get_search_backend(using).index_category(instance)
+
+
+@receiver(post_save, sender=DocumentCategory)
+@receiver(post_delete, sender=DocumentCategory)
+@receiver(node_moved, sender=DocumentCategory)
+@receiver(post_save, sender=Document)
+@receiver(post_delete, sender=Document)
+def invalidate_category_tree(sender, instance, **kwargs):
+    # document saves may change category document counts held in the tree
+    tree.invalidate(kwargs.get("using") or instance._state.db)
+
+
+@receiver(post_save, sender=Document)
+@receiver(post_delete, sender=Document)
+def bump_document_fragments(sender, instance, using, **kwargs):
+    # a moved document is removed from its previous category's fragments - see Document.remember_previous
+    categories = {
+        instance.category_id,
+        getattr(instance, "_previous_category_id", None),
+    }
+    for category_id in categories - {None}:
+        fragments.bump_generation(category_id, using)
+
+
+def _release_file(name, storage, using):
+    # after the change is committed, when the document no longer counts as a reference to the file
+    transaction.on_commit(
+        lambda: Document.release_file(name, storage, using), using=using
+    )
+
+
+@receiver(post_save, sender=Document)
+def release_replaced_file(sender, instance, using, **kwargs):
+    previous = getattr(instance, "_previous_file", None)
+    if previous and previous != instance.file.name:
+        _release_file(previous, instance.file.storage, using)
+
+
+@receiver(post_delete, sender=Document)
+def release_deleted_file(sender, instance, using, **kwargs):
+    _release_file(instance.file.name, instance.file.storage, using)
@@ -0,0 +1,148 @@
+"""
+Log slow database queries made by catalogue views, with their EXPLAIN plan and where they came from - to spot
+    missing indexes from the app, rather than from the database logs.
+
+Enable with setting:  DOCUMENT_CATALOGUE_SLOW_QUERY_THRESHOLD  (seconds)
+Each query made while a catalogue view runs, or its template response renders, that takes at least the threshold
+    is logged as a warning to the 'document_catalogue.slow_queries' logger, with:
+        the URL name of the view;  the innermost catalogue code that made it (file, line and function);
+        the view plugin, if any, whose hook made it;  and the database's EXPLAIN output for it.
+The extra attributes of each log record (duration, sql, url_name, origin, plugin, plan) are there for log handlers.
+
+When the setting is None, views are not wrapped, so there is no overhead.  Async views are not wrapped:  their
+    queries run in worker threads, on other connections.
+"""
+import asyncio
+import logging
+import os
+import sys
+import time
+from functools import wraps
+
+from django.apps import apps
+from django.db import DatabaseError, NotSupportedError, connection, transaction
+
+from .plugins import AbstractViewPlugin, PluginTimer
+
+appConfig = apps.get_app_config("document_catalogue")
+
+logger = logging.getLogger("document_catalogue.slow_queries")
+
+MODULE_FILE = os.path.abspath(__file__)
+PACKAGE_DIR = os.path.dirname(MODULE_FILE)
+# Statements explained - EXPLAIN without ANALYZE doesn't run the statement
+EXPLAINABLE = ("SELECT", "UPDATE", "DELETE")
+
+
+def is_catalogue_code(filename):
+    """Return True iff the source file is part of the catalogue - but not this module"""
+    return filename.startswith(PACKAGE_DIR) and filename != MODULE_FILE
+
+
+def get_origin(frame):
+    """Return (origin, plugin) for the stack from frame:  the innermost catalogue code, and view plugin, on the stack"""
+    origin = plugin = None
+    while frame and not (origin and plugin):
+        filename = os.path.abspath(frame.f_code.co_filename)
+        if origin is None and is_catalogue_code(filename):
+            origin = "%s:%d in %s" % (
+                os.path.relpath(filename, os.path.dirname(PACKAGE_DIR)),
+                frame.f_lineno,
+                frame.f_code.co_name,
+            )
+        if plugin is None and isinstance(
+            frame.f_locals.get("self"), AbstractViewPlugin
+        ):
+            plugin = PluginTimer.plugin_name(frame.f_locals["self"])
+        frame = frame.f_back
+    return origin, plugin
+
+
+class SlowQueryLogger:
+    """A database execute wrapper that logs each query made through it that takes at least threshold seconds"""
+
+    def __init__(self, url_name, threshold):
+        self.url_name = url_name
+        self.threshold = threshold
+        self.explaining = False
+
+    def __call__(self, execute, sql, params, many, context):
+        if self.explaining:  # the EXPLAIN query itself
+            return execute(sql, params, many, context)
+        start = time.perf_counter()
+        result = execute(sql, params, many, context)
+        duration = time.perf_counter() - start
+        if duration >= self.threshold:
+            self.log(sql, params, many, context["connection"], duration)
+        return result
+
+    def explain(self, sql, params, many, db):
+        """Return the database's query plan for the statement, or a note of why there is none"""
+        if many or not sql.lstrip().upper().startswith(EXPLAINABLE):
+            return "(not explained)"
+        self.explaining = True
+        try:
+            with transaction.atomic(using=db.alias), db.cursor() as cursor:
+                cursor.execute("%s %s" % (db.ops.explain_query_prefix(), sql), params)
+                return "\n".join(
+                    " ".join(str(column) for column in row) for row in cursor.fetchall()
+                )
+        except (DatabaseError, NotSupportedError) as e:
+            return "(EXPLAIN failed: %s)" % e
+        finally:
+            self.explaining = False
+
+    def log(self, sql, params, many, db, duration):
+        origin, plugin = get_origin(sys._getframe(1))
+        plan = self.explain(sql, params, many, db)
+        logger.warning(
+            "Slow query (%.1f ms) in view %s, from %s%s:\n%s\nEXPLAIN:\n%s",
+            duration * 1000,
+            self.url_name,
+            origin or "(unknown)",
+            ", plugin %s" % plugin if plugin else "",
+            sql,
+            plan,
+            extra={
+                "duration": duration,
+                "sql": sql,
+                "url_name": self.url_name,
+                "origin": origin,
+                "plugin": plugin,
+                "plan": plan,
+            },
+        )
+
+
+def log_slow_queries(view, url_name):
+    """Return the sync view function wrapped to log its slow queries, including those made rendering its response"""
+
+    @wraps(view)
+    def logged_view(request, *args, **kwargs):
+        threshold = appConfig.settings.SLOW_QUERY_THRESHOLD
+        if threshold is None:
+            return view(request, *args, **kwargs)
+        query_logger = SlowQueryLogger(url_name, threshold)
+        with connection.execute_wrapper(query_logger):
+            response = view(request, *args, **kwargs)
+        render = getattr(response, "render", None)
+        if callable(render) and not response.is_rendered:
+
+            def logged_render():
+                with connection.execute_wrapper(query_logger):
+                    return render()
+
+            response.render = logged_render  # template responses are rendered lazily
+        return response
+
+    return logged_view
+
+
+def log_urlpatterns(urlpatterns):
+    """Wrap the view of each named URL pattern to log its slow queries, in place, and return the urlpatterns"""
+    for pattern in urlpatterns:
+        if getattr(pattern, "name", None) and not asyncio.iscoroutinefunction(
+            pattern.callback
+        ):
+            pattern.callback = log_slow_queries(pattern.callback, pattern.name)
+    return urlpatterns
@@ -102,24 +102,98 @@ $(document).ready(function() {
      *  - uploads are configured only when a #DocumentCatalogueManager DOM element is present
      *  - uploads are configured on DOM elements with:  class='dc-dropzone'
      *  - data-url='/absolute/url/for/upload/post'  MUST be supplied in DOM
+ *  - data-upload-multiple='true' to post many files per request, with data-url for the batch upload API
+ *  - data-chunking='true' to upload large files in chunks (data-chunk-size in bytes), with data-chunked-url
+ *      for the chunked upload API - posts one file per request, so overrides data-upload-multiple
+ *      An interrupted upload is resumed when the same file is dropped again:  only the chunks missing are sent.
      * Any dropzone options can be added over overridden via:  data-optionName=optionValue
      *    on either #DocumentCatalogueManager element or .dc-dropzone elements
      */
     let DocumentCatalogueManager = {
 
+        // A stable id for a chunked upload of the file, so an interrupted upload of the same file is resumed
+        //   - hex digits in uuid form, as the chunked upload API requires
+        chunked_upload_id: function (file, chunk_size) {
+            let hex = '';
+            for (let part = 0; part < 4; part++) {  // 32 bits of FNV-1a hash per part
+                let key = [part, file.name, file.size, file.lastModified, chunk_size].join('/');
+                let hash = 0x811c9dc5;
+                for (let i = 0; i < key.length; i++) {
+                    hash = Math.imul(hash ^ key.charCodeAt(i), 0x01000193) >>> 0;
+                }
+                hex += ('0000000' + hash.toString(16)).slice(-8);
+            }
+            return [hex.slice(0, 8), hex.slice(8, 12), hex.slice(12, 16), hex.slice(16, 20), hex.slice(20)].join('-');
+        },
+
         base_dropzone_options: {
             // url option MUST be supplied for the upload manager to do anything useful...
             url: '',
             // base option default values:
-            paramName: 'file',                      // must match form field name on backend!
+            // must match form field name on backend!  Used as-is for every file when uploadMultiple (batch) is set.
+            paramName: function () { return 'file'; },
             headers: AjaxCSRFtokenManager.getRequestHeader(),
+            // a chunked upload is identified by the file, and resumed with the chunks the server hasn't received
+            accept: function (file, done) {
+                if (!file.upload.chunked)
+                    return done();
+                file.upload.uuid = DocumentCatalogueManager.chunked_upload_id(file, this.options.chunkSize);
+                file.upload.received_chunks = [];
+                $.ajax({
+                    url: this.options.url,
+                    method: 'GET',
+                    data: {dzuuid: file.upload.uuid},
+                    success: function (response) {
+                        if (response.total_chunks === file.upload.totalChunkCount)
+                            file.upload.received_chunks = response.received;
+                        done();
+                    },
+                    error: function () { done(); }  // upload every chunk
+                });
+            },
+            // all chunks of a chunked upload were received - ask the server to assemble them into the document
+            chunksUploaded: function (file, done) {
+                let dropzone = this;
+                $.ajax({
+                    url: dropzone.options.url,
+                    method: 'POST',
+                    headers: AjaxCSRFtokenManager.getRequestHeader(),
+                    data: {dzuuid: file.upload.uuid},
+                    success: function (response) {
+                        file.document_item = response.document_item;
+                        done();
+                    },
+                    error: function (xhr) {
+                        dropzone._errorProcessing([file], xhr.responseText || 'Upload failed', xhr);
+                    }
+                });
+            },
             init: function () {
+                // skip the chunks the server received before the upload was interrupted, see accept
+                let upload_data = this._uploadData;
+                this._uploadData = function (files, data_blocks) {
+                    let upload = files[0].upload;
+                    let index = data_blocks[0].chunkIndex;
+                    if (upload.chunked && (upload.received_chunks || []).indexOf(index) >= 0) {
+                        return upload.finishedChunkUpload(upload.chunks[index]);
+                    }
+                    return upload_data.call(this, files, data_blocks);
+                };
+                let add_documents = function (file, document_items) {
+                    let target = $(file.previewTemplate).closest('.dc-category-list').find('> .dc-document-list');
+                    let items = $($.parseHTML($.trim([].concat(document_items).join('')))).filter('.dc-document-item');
+                    target.append(items);
+                    items.find('.dc-document-link').addClass('text-success');
+                };
                 this.on("success", function (file, response) {
                     // console.log(response);  // sanity check
-                    let document_item = response.document_item;
-                    let target = $(file.previewTemplate).closest('.dc-category-list').find('> .dc-document-list');
-                    target.append(document_item);
-                    target.find('.dc-document-item:last-child .dc-document-link').addClass('text-success');
+                    if (this.options.uploadMultiple)
+                        return;  // batch response is added once for all its files, on successmultiple
+                    // a chunked upload's document is returned when its chunks are assembled, see chunksUploaded
+                    add_documents(file, file.document_item || response.document_item);
+                });
+                this.on("successmultiple", function (files, response) {
+                    add_documents(files[0], response.document_items);
                 });
             }
         },
@@ -130,7 +204,13 @@ $(document).ready(function() {
         _get_dropzone_options: function(element) {
             // Grab dropzone option values for given DOM element or selector
             let element_options = $(element).data();
-            return $.extend(this.default_dropzone_options, element_options);
+            let options = $.extend({}, this.default_dropzone_options, element_options);
+            if (options.chunking) {
+                // chunked uploads are posted one file at a time, to the chunked upload API
+                options.url = options.chunkedUrl || options.url;
+                options.uploadMultiple = false;
+            }
+            return options;
         },
 
         configure_dropzone_uploads: function() {
@@ -167,14 +247,25 @@ $(document).ready(function() {
         DocumentCatalogueManager.configure();
 
     // Select2 Ajax Search
+    let search_cursor = null;  // cursor for the next page of search results, supplied by the search API
     $('.select2-ajax-search').select2({
         placeholder: 'Start typing to find Document',
         ajax: {
             url:  $('.select2-ajax-search').data('url'),
+            delay: 250,
+            data: function (params) {
+                // select2 counts pages from 1 - fetch subsequent pages from the cursor returned with the previous page
+                return {
+                    q: params.term,
+                    cursor: (params.page || 1) > 1 ? search_cursor : null
+                };
+            },
             processResults: function (data) {
                 // Transforms the top-level key of the response object from 'items' to 'results'
+                search_cursor = data.pagination.cursor;
                 return {
-                    results: data.options
+                    results: data.options,
+                    pagination: {more: data.pagination.more}
                 };
             }
         },
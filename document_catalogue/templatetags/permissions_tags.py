@@ -1,21 +1,15 @@
 from __future__ import unicode_literals
 
-from importlib import import_module
-
 from django import template
-from django.apps import apps
-
-appConfig = apps.get_app_config("document_catalogue")
 
-# import Plugin Permissions module
-permissions = import_module(appConfig.settings.PERMISSIONS)
+from ..permission_resolver import get_permission_resolver
 
 register = template.Library()
 
 
 def has_permission(user, perm):
-    check_perm = getattr(permissions, perm, lambda user: False)
-    return check_perm(user) if callable(check_perm) else False
+    """Return True iff the named permission function grants user permission, memoised for the request"""
+    return get_permission_resolver(user).has_perm(perm)
 
 
 @register.filter(name="can")
@@ -0,0 +1,157 @@
+"""
+Cached snapshot of the whole DocumentCategory tree.
+
+Rendering a catalogue page needs the category being viewed, its ancestors and its descendants.  Rather than query
+    the tree for each of these on every request, the whole tree (annotated with document counts) is loaded once,
+    stored in the cache, and navigated in memory.
+
+The snapshot is versioned:  a new version is started whenever a category or document is saved, deleted or moved
+    (see signals), so all processes sharing the cache see the change.  Each process also keeps the last snapshot
+    it loaded, so a warm request costs a single cache lookup for the current version.
+Categories and documents updated in bulk (bypassing signals) must call invalidate() explicitly.
+
+Use the cache with setting:  DOCUMENT_CATALOGUE_CACHE
+"""
+import copy
+import uuid
+
+from django.apps import apps
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+appConfig = apps.get_app_config("document_catalogue")
+
+VERSION_KEY = "document_catalogue.tree.version"
+SNAPSHOT_KEY = "document_catalogue.tree.{version}"
+
+
+class CategoryTree:
+    """
+    In-memory snapshot of the category tree, with nodes in tree order.
+    Nodes returned are shallow copies, so callers (e.g., mptt's recursetree, which caches children on each node)
+        never modify the shared snapshot.
+    """
+
+    def __init__(self, categories):
+        self.nodes = list(categories)
+        self.by_pk = {node.pk: node for node in self.nodes}
+        self.by_slug = {node.slug: node for node in self.nodes}
+        self.position = {node.pk: i for i, node in enumerate(self.nodes)}
+
+    @staticmethod
+    def _copy(nodes):
+        return [copy.copy(node) for node in nodes]
+
+    def all(self):
+        """Return all nodes in tree order"""
+        return self._copy(self.nodes)
+
+    def get(self, slug):
+        """Return the node with the given slug, or None"""
+        node = self.by_slug.get(slug)
+        return copy.copy(node) if node else None
+
+    def get_ancestors(self, node):
+        """Return the ancestors of node, from the root down"""
+        ancestors = []
+        parent = self.by_pk.get(node.parent_id)
+        while parent:
+            ancestors.append(parent)
+            parent = self.by_pk.get(parent.parent_id)
+        return self._copy(reversed(ancestors))
+
+    def get_descendants(self, node):
+        """Return the descendants of node, in tree order"""
+        if node.pk not in self.position:
+            return []
+        start = end = self.position[node.pk] + 1
+        # descendants follow the node, up to the first node outside its lft / rght range
+        while end < len(self.nodes) and self._contains(node, self.nodes[end]):
+            end += 1
+        return self._copy(self.nodes[start:end])
+
+    @staticmethod
+    def _contains(node, other):
+        return other.tree_id == node.tree_id and node.lft < other.lft < node.rght
+
+    def restrict(self, category_pks=None, document_counts=None):
+        """
+        Return a new CategoryTree with only the categories in category_pks, omitting any category whose parent is
+            omitted, and counts of the documents in each from document_counts, a dict {category pk: count}.
+        None to keep all the categories, or the counts, of this tree.
+        """
+        nodes, included = [], set()
+        for node in self.nodes:
+            omitted_parent = node.parent_id and node.parent_id not in included
+            if category_pks is not None and (
+                node.pk not in category_pks or omitted_parent
+            ):
+                continue
+            included.add(node.pk)
+            nodes.append(copy.copy(node))
+        if document_counts is not None:
+            ancestors = []
+            for node in nodes:
+                while ancestors and not self._contains(ancestors[-1], node):
+                    ancestors.pop()
+                node.document_count = document_counts.get(node.pk, 0)
+                node.cumulative_document_count = node.document_count
+                for ancestor in ancestors:
+                    ancestor.cumulative_document_count += node.document_count
+                ancestors.append(node)
+        return CategoryTree(nodes)
+
+
+def get_cache():
+    return caches[appConfig.settings.CACHE]
+
+
+_memo = (None, None)  # (version, CategoryTree) last loaded by this process
+
+
+def get_version():
+    """Return the current snapshot version, starting one if there is none"""
+    cache = get_cache()
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, uuid.uuid4().hex, timeout=None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def load_tree():
+    """Return a CategoryTree for the current state of the database"""
+    DocumentCategory = apps.get_model("document_catalogue", "DocumentCategory")
+    return CategoryTree(DocumentCategory.objects.with_document_counts())
+
+
+def get_category_tree():
+    """Return the current CategoryTree, from this process's memo or the cache, loading it if necessary"""
+    global _memo
+    version = get_version()
+    memo_version, tree = _memo
+    if memo_version == version:
+        return tree
+    cache = get_cache()
+    key = SNAPSHOT_KEY.format(version=version)
+    tree = cache.get(key)
+    if tree is None:
+        tree = load_tree()
+        cache.set(key, tree)
+    _memo = (version, tree)
+    return tree
+
+
+def _new_version():
+    get_cache().set(VERSION_KEY, uuid.uuid4().hex, timeout=None)
+
+
+def invalidate(using=DEFAULT_DB_ALIAS):
+    """
+    Start a new snapshot version, so the tree is re-loaded on next use.
+    Within a transaction, the version is bumped again on commit, discarding any snapshot loaded by another process
+        before the change was visible to it.
+    """
+    _new_version()
+    if transaction.get_connection(using).in_atomic_block:
+        transaction.on_commit(_new_version, using=using)
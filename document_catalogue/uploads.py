@@ -0,0 +1,415 @@
+"""
+Receiving document uploads:  measuring uploads as they stream in, and chunked, resumable uploads for large documents.
+
+DocumentUploadHandler streams each uploaded file to a temporary file, computing its SHA-256 hash, size and content
+    type (sniffed from its first bytes) on the way, so the file is validated and hashed without being read again,
+    and an invalid upload is aborted as soon as it crosses the max. file size - or, optionally, shows a content type
+    not allowed.  Views that receive documents install it with UploadHandlerViewMixin, see views.
+Measured uploads are validated as the Document file field would validate them:  by the content type declared by
+    the client for private storage (unless DOCUMENT_CATALOGUE_SNIFF_UPLOAD_CONTENT_TYPE), or by the content type
+    sniffed from as many bytes as the field reads for public storage, see sniffs_content_type.
+
+Chunked uploads:
+
+The client splits the file into chunks and posts each chunk separately, identified by an upload id, chunk index and
+    total number of chunks - e.g., with dropzone's chunking option, which posts:
+        dzuuid, dzchunkindex, dztotalchunkcount, dztotalfilesize  (and dzchunksize, dzchunkbyteoffset)
+Chunks are stored in a staging area, one file per chunk, so they may arrive in any order, and a chunk that is
+    re-sent simply replaces the earlier copy.  An interrupted upload is resumed by asking which chunks were received
+    and sending only the missing ones.  Once all chunks are received, they are assembled into a single file,
+    streaming each chunk in turn so the whole file is never held in memory, which is then validated and saved
+    like any other upload.
+    The catalogue's javascript resumes an upload of the same file with the same upload id, derived from the file.
+Abandoned uploads are removed from the staging area once they expire.  Until then, each user may stage uploads
+    totalling at most DOCUMENT_CATALOGUE_CHUNKED_UPLOAD_USER_LIMIT bytes.
+
+Configure the chunked upload staging area with settings:  DOCUMENT_CATALOGUE_CHUNKED_UPLOAD_DIR, DOCUMENT_CATALOGUE_CHUNKED_UPLOAD_EXPIRY
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+import uuid
+
+import django.conf
+from django.apps import apps
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import StopUpload, TemporaryFileUploadHandler
+from django.template.defaultfilters import filesizeformat
+from django.utils.functional import cached_property
+
+from . import metrics
+
+appConfig = apps.get_app_config("document_catalogue")
+
+COPY_BUFFER_SIZE = 64 * 1024
+# bytes from the start of a file used to identify its content type, unless the Document file field says otherwise
+SNIFF_LENGTH = 4096
+MULTIPART_OVERHEAD = (
+    64 * 1024
+)  # allowance for form fields and multipart framing sent with each file
+
+
+class InvalidChunk(Exception):
+    pass
+
+
+def get_staging_root():
+    """Return the directory where uploads are staged while their chunks arrive"""
+    return appConfig.settings.CHUNKED_UPLOAD_DIR or os.path.join(
+        django.conf.settings.FILE_UPLOAD_TEMP_DIR or tempfile.gettempdir(),
+        "document_catalogue_uploads",
+    )
+
+
+def get_file_field():
+    Document = apps.get_model("document_catalogue", "Document")
+    return Document._meta.get_field("file")
+
+
+def get_max_upload_size():
+    """Return the max. size of a document file in bytes, as enforced by the Document file field, or None"""
+    field = get_file_field()
+    # private-storage and constrainedfilefield name their limit differently
+    return getattr(field, "max_file_size", None) or getattr(
+        field, "max_upload_size", None
+    )
+
+
+def get_sniff_length():
+    """Return the number of bytes from the start of a file used to sniff its content type - as the Document file field"""
+    return getattr(get_file_field(), "mime_lookup_length", SNIFF_LENGTH)
+
+
+def sniffs_content_type():
+    """
+    Return True iff uploads are validated by their sniffed content type, rather than the one declared by the client:
+        constrainedfilefield (public storage) sniffs, private-storage doesn't, unless SNIFF_UPLOAD_CONTENT_TYPE
+    """
+    settings = appConfig.settings
+    return not settings.USE_PRIVATE_FILES or settings.SNIFF_UPLOAD_CONTENT_TYPE
+
+
+def sniff_content_type(head):
+    """
+    Return the content type identified from the first bytes of a file, or None if there is no content type whitelist
+        or uploads are not sniffed - python-magic is only required when it is.
+    """
+    if not (appConfig.settings.CONTENT_TYPE_WHITELIST and sniffs_content_type()):
+        return None
+    import magic
+
+    return magic.from_buffer(head, mime=True)
+
+
+class UploadMeter:
+    """Measures a file as its content is received:  hash, size and the first bytes, to sniff its content type"""
+
+    def __init__(self):
+        self.digest = hashlib.sha256()
+        self.size = 0
+        self.head = b""
+        self.sniff_length = get_sniff_length()
+        self.start = time.perf_counter()
+
+    def update(self, data):
+        self.digest.update(data)
+        self.size += len(data)
+        if len(self.head) < self.sniff_length:
+            self.head += data[: self.sniff_length - len(self.head)]
+
+    def is_sniffable(self):
+        """Return True once enough of the file has been received to sniff its content type"""
+        return len(self.head) >= self.sniff_length
+
+    @cached_property
+    def content_type(self):
+        """The sniffed content type - only once the file is complete, or is_sniffable"""
+        return sniff_content_type(self.head)
+
+    def measure(self, file):
+        """Record the measurements on the given uploaded file, and return it"""
+        file.sha256 = self.digest.hexdigest()
+        file.sniffed_content_type = self.content_type
+        return file
+
+
+def is_measured(file):
+    """Return True iff the uploaded file was measured as it was received, see UploadMeter"""
+    return getattr(file, "sha256", None) is not None
+
+
+def validate_size(size):
+    """Raise ValidationError if size exceeds the max. file size enforced by the Document file field"""
+    max_size = get_max_upload_size()
+    if max_size and size > max_size:
+        raise ValidationError(
+            "File size exceeds limit: %(current_size)s. Limit is %(max_size)s.",
+            code="file_too_large",
+            params={
+                "current_size": filesizeformat(size),
+                "max_size": filesizeformat(max_size),
+            },
+        )
+
+
+def validate_content_type(content_type):
+    """Raise ValidationError if content_type is not in the CONTENT_TYPE_WHITELIST, if there is one"""
+    whitelist = appConfig.settings.CONTENT_TYPE_WHITELIST
+    if whitelist and content_type not in whitelist:
+        raise ValidationError(
+            "Unsupported file type: %(type)s. Allowed types are %(allowed)s.",
+            code="invalid_content_type",
+            params={"type": content_type, "allowed": whitelist},
+        )
+
+
+def validate_measured_file(file):
+    """
+    Validate a measured upload's size and content type, without reading it, against the same limits enforced by
+        the Document file field:  MAX_FILESIZE and CONTENT_TYPE_WHITELIST
+    """
+    validate_size(file.size)
+    validate_content_type(
+        file.sniffed_content_type if sniffs_content_type() else file.content_type
+    )
+
+
+class DocumentUploadHandler(TemporaryFileUploadHandler):
+    """
+    Streams each uploaded file to a temporary file, and measures it on the way, adding attributes to the file:
+        sha256 - hex digest of its content;  sniffed_content_type - None unless there is a content type whitelist
+    Aborts the upload as soon as it is known to be invalid, so an invalid file is never spooled to disk in full:
+        when the request's Content-Length shows it is too large, before any file is received;  when a file grows
+        larger than the max. file size;  or, with check_content_type, when a file's content type - declared, or
+        sniffed from its first bytes, see sniffs_content_type - isn't whitelisted.  Form fields received before the file are kept (e.g., the csrf token), the rest of
+        the request is not read, and the reason is recorded as error, a ValidationError, for the view to report.
+    max_files - number of files accepted per request, for the Content-Length check;  None for any number of files
+    """
+
+    def __init__(self, request=None, max_files=None, check_content_type=False):
+        super().__init__(request)
+        self.max_files = max_files
+        self.check_content_type = check_content_type
+        self.error = None
+
+    def abort(self, error):
+        self.error = error
+        metrics.inc(metrics.uploads_aborted, reason=error.code)
+        raise StopUpload(connection_reset=True)
+
+    def handle_raw_input(
+        self, input_data, META, content_length, boundary, encoding=None
+    ):
+        max_size = get_max_upload_size()
+        if not (self.max_files and max_size):
+            return
+        if content_length > self.max_files * (max_size + MULTIPART_OVERHEAD):
+            # aborted when the first file starts, after the fields that precede it are read
+            self.error = ValidationError(
+                "Upload exceeds limit: %(current_size)s. Limit is %(max_size)s per file.",
+                code="file_too_large",
+                params={
+                    "current_size": filesizeformat(content_length),
+                    "max_size": filesizeformat(max_size),
+                },
+            )
+
+    def new_file(self, *args, **kwargs):
+        if self.error:
+            self.abort(self.error)
+        super().new_file(*args, **kwargs)
+        self.meter = UploadMeter()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.meter.update(raw_data)
+        self.validate(complete=False)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        self.validate(complete=True)
+        metrics.observe(metrics.upload_bytes, self.meter.size)
+        metrics.observe(metrics.upload_duration, time.perf_counter() - self.meter.start)
+        return self.meter.measure(super().file_complete(file_size))
+
+    def validate(self, complete):
+        try:
+            validate_size(self.meter.size)
+            if not self.check_content_type:
+                return
+            if not sniffs_content_type():
+                validate_content_type(self.content_type)
+            elif complete or self.meter.is_sniffable():
+                validate_content_type(self.meter.content_type)
+        except ValidationError as e:
+            self.abort(e)
+
+
+def purge_expired(root=None, expiry=None):
+    """Remove uploads from the staging area that haven't received a chunk within the expiry time (seconds)"""
+    root = root or get_staging_root()
+    expiry = expiry if expiry is not None else appConfig.settings.CHUNKED_UPLOAD_EXPIRY
+    if not os.path.isdir(root):
+        return
+    cutoff = time.time() - expiry
+    for entry in os.scandir(root):
+        if entry.is_dir() and entry.stat().st_mtime < cutoff:
+            shutil.rmtree(entry.path, ignore_errors=True)
+
+
+def read_meta(path):
+    """Return the metadata of the upload staged in the directory at path, or None if there is none"""
+    try:
+        with open(os.path.join(path, ChunkedUpload.META_FILE)) as meta_file:
+            return json.load(meta_file)
+    except FileNotFoundError:
+        return None
+
+
+class ChunkedUpload:
+    """
+    A file upload, staged in its own directory as a chunk file per chunk received, plus a metadata file.
+    Uploads are private to the user who started them - the id is only unique together with the user.
+    """
+
+    META_FILE = "upload.json"
+
+    def __init__(self, upload_id, user, root=None):
+        try:
+            self.upload_id = str(uuid.UUID(str(upload_id)))
+        except (
+            ValueError
+        ):  # the id is part of a filesystem path - accept nothing but a uuid
+            raise InvalidChunk("Invalid upload id: %s" % upload_id)
+        self.root = root or get_staging_root()
+        self.user_prefix = "%s-" % user.pk
+        self.path = os.path.join(self.root, self.user_prefix + self.upload_id)
+
+    def chunk_path(self, index):
+        return os.path.join(self.path, "%08d.chunk" % index)
+
+    @property
+    def meta(self):
+        """Return the metadata recorded with the first chunk received, or None if there is none"""
+        return read_meta(self.path)
+
+    def staged_size(self):
+        """Return the total size of the user's other uploads in the staging area"""
+        if not os.path.isdir(self.root):
+            return 0
+        metas = (
+            read_meta(entry.path)
+            for entry in os.scandir(self.root)
+            if entry.name.startswith(self.user_prefix) and entry.path != self.path
+        )
+        return sum(meta["total_size"] for meta in metas if meta)
+
+    def start(self, name, content_type, total_chunks, total_size):
+        """Record the upload's metadata, unless it was started by an earlier chunk"""
+        if total_chunks < 1 or total_size < 0:
+            raise InvalidChunk("Invalid chunk count or file size")
+        max_size = get_max_upload_size()
+        if max_size and total_size > max_size:
+            raise InvalidChunk(
+                "File size exceeds limit: %s bytes. Limit is %s bytes."
+                % (total_size, max_size)
+            )
+        meta = self.meta
+        if meta is not None:
+            if (meta["total_chunks"], meta["total_size"]) != (total_chunks, total_size):
+                raise InvalidChunk("Chunk does not match the upload it belongs to")
+            return meta
+        user_limit = appConfig.settings.CHUNKED_UPLOAD_USER_LIMIT
+        if user_limit is not None and self.staged_size() + total_size > user_limit:
+            raise InvalidChunk(
+                "Incomplete uploads exceed limit: %s bytes. Finish or abandon an upload."
+                % user_limit
+            )
+        meta = dict(
+            name=name,
+            content_type=content_type,
+            total_chunks=total_chunks,
+            total_size=total_size,
+        )
+        os.makedirs(self.path, exist_ok=True)
+        self._write(
+            os.path.join(self.path, self.META_FILE), [json.dumps(meta).encode("utf-8")]
+        )
+        return meta
+
+    def _write(self, path, chunks):
+        """Write chunks of data to a temporary file, then move it into place - a partial write is never seen"""
+        descriptor, temp_path = tempfile.mkstemp(dir=self.path, suffix=".part")
+        try:
+            with os.fdopen(descriptor, "wb") as temp_file:
+                for data in chunks:
+                    temp_file.write(data)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+
+    def save_chunk(self, index, file):
+        """Stage the chunk at index from the given uploaded file"""
+        meta = self.meta
+        if not 0 <= index < meta["total_chunks"]:
+            raise InvalidChunk("Chunk index %s out of range" % index)
+        self._write(self.chunk_path(index), file.chunks())
+        received = sum(
+            os.path.getsize(self.chunk_path(i)) for i in self.received_chunks(meta)
+        )
+        if received > meta["total_size"]:
+            self.delete()
+            raise InvalidChunk("Chunks exceed the total file size")
+
+    def received_chunks(self, meta=None):
+        """Return the sorted list of chunk indexes received so far"""
+        meta = meta or self.meta
+        if meta is None:
+            return []
+        return [
+            index
+            for index in range(meta["total_chunks"])
+            if os.path.exists(self.chunk_path(index))
+        ]
+
+    def is_complete(self, meta=None):
+        meta = meta or self.meta
+        return (
+            meta is not None and len(self.received_chunks(meta)) == meta["total_chunks"]
+        )
+
+    def assemble(self):
+        """
+        Concatenate the chunks, in order, into a single file and return it as an UploadedFile.
+        The caller must close the file, then delete() the upload.
+        """
+        meta = self.meta
+        if not self.is_complete(meta):
+            raise InvalidChunk("Upload is incomplete")
+        path = os.path.join(self.path, "assembled")
+        meter = UploadMeter()  # measured as it is assembled, like any other upload
+        with open(path, "wb") as assembled:
+            for index in range(meta["total_chunks"]):
+                with open(self.chunk_path(index), "rb") as chunk:
+                    for data in iter(lambda: chunk.read(COPY_BUFFER_SIZE), b""):
+                        meter.update(data)
+                        assembled.write(data)
+        if meter.size != meta["total_size"]:
+            raise InvalidChunk(
+                "Assembled file is %s bytes, expected %s"
+                % (meter.size, meta["total_size"])
+            )
+        file = UploadedFile(
+            file=open(path, "rb"),
+            name=meta["name"],
+            content_type=meta["content_type"],
+            size=meter.size,
+        )
+        return meter.measure(file)
+
+    def delete(self):
+        shutil.rmtree(self.path, ignore_errors=True)
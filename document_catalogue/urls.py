@@ -1,12 +1,19 @@
 from django.apps import apps
 from django.urls import path
 
-from . import views
+from . import metrics, profiling, slow_queries, views
 
 appConfig = apps.get_app_config("document_catalogue")
 
 app_name = "document_catalogue"
 
+if appConfig.settings.ASYNC_VIEWS:
+    download_view = views.DocumentAsyncDownloadView
+    search_view = views.DocumentAsyncSearchAPI
+else:
+    download_view = views.DocumentDownloadView
+    search_view = views.DocumentAjaxAPI
+
 urlpatterns = [
     path("", view=views.DocumentCatalogueListView.as_view(), name="catalogue_list"),
     path(
@@ -21,11 +28,11 @@ urlpatterns = [
     ),
     path(
         "download/<int:pk>/",
-        view=views.DocumentDownloadView.as_view(),
+        view=download_view.as_view(),
         name="document_download",
     ),
     # AJAX API
-    path("search/", view=views.DocumentAjaxAPI.as_view(), name="api_search"),
+    path("search/", view=search_view.as_view(), name="api_search"),
 ]
 
 if appConfig.settings.ENABLE_EDIT_URLS:
@@ -44,7 +51,29 @@ if appConfig.settings.ENABLE_EDIT_URLS:
         path(
             "post/<slug:slug>/", view=views.DocumentAjaxAPI.as_view(), name="api_post"
         ),
+        path(
+            "post/<slug:slug>/batch/",
+            view=views.DocumentBatchAjaxAPI.as_view(),
+            name="api_post_batch",
+        ),
+        path(
+            "post/<slug:slug>/chunked/",
+            view=views.DocumentChunkedAjaxAPI.as_view(),
+            name="api_post_chunked",
+        ),
         path(
             "delete/<int:pk>/", view=views.DocumentAjaxAPI.as_view(), name="api_delete"
         ),
     ]
+
+if appConfig.settings.METRICS:
+    metrics.enable_plugin_metrics()
+    urlpatterns = metrics.instrument_urlpatterns(urlpatterns) + [
+        path("metrics/", view=views.MetricsView.as_view(), name="metrics"),
+    ]
+
+if appConfig.settings.SLOW_QUERY_THRESHOLD is not None:
+    urlpatterns = slow_queries.log_urlpatterns(urlpatterns)
+
+if appConfig.settings.PROFILING:
+    urlpatterns = profiling.profile_urlpatterns(urlpatterns)
@@ -1,21 +1,27 @@
-from functools import partial
 from importlib import import_module
-from itertools import groupby
 
+from asgiref.sync import sync_to_async
 from django.apps import apps
-from django.db.models import Q
-from django.http import Http404, HttpResponseForbidden
-from django.shortcuts import get_object_or_404
+from django.db import connection, connections, transaction
+from django.db.models import Count, Max
+from django.http import (
+    Http404,
+    HttpResponse,
+    HttpResponseBadRequest,
+    HttpResponseForbidden,
+)
 from django.template.loader import get_template
 from django.urls import reverse
 from django.utils.functional import cached_property
 from django.utils.module_loading import import_string
 from django.views import generic
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
 
-from . import forms, plugins
+from . import downloads, forms, fragments, metrics, plugins, search, tree, uploads
 from .decorators import permission_required
-from .models import Document, DocumentCategory
-from .views_generic import AjaxOnlyViewMixin
+from .models import CategorySortOrder, Document
+from .permission_resolver import get_permission_resolver, has_permission
+from .views_generic import AjaxOnlyViewMixin, AsyncViewMixin, ConditionalViewMixin
 
 appConfig = apps.get_app_config("document_catalogue")
 
@@ -30,12 +36,41 @@ list_view_plugin_classes = tuple(
 
 def get_permissions_context(view):
     """Return a dictionary of permissions (partials that can be called with no arguments)"""
-    context = {}
-    for name in dir(permissions):
-        fn = getattr(permissions, name)
-        if callable(fn):
-            context[name] = partial(fn, view.request.user, **view.kwargs)
-    return context
+    return get_permission_resolver(view.request.user).get_context(**view.kwargs)
+
+
+def get_permissions_state(view):
+    """Return a tuple of (name, result) for each user_can_ permission - identifies what the user may do in templates"""
+    return get_permission_resolver(view.request.user).get_state(**view.kwargs)
+
+
+def get_user_state(view):
+    """Return values identifying the user, and what they may view and do, for use in response validators"""
+    resolver = get_permission_resolver(view.request.user)
+    return (
+        view.request.user.pk,
+        get_permissions_state(view),
+        resolver.get_visibility_key(),
+    )
+
+
+def get_category_tree(view):
+    """Return the category tree the view's user may view - the cached category tree, unless they are restricted"""
+    return get_permission_resolver(view.request.user).category_tree
+
+
+def filter_viewable_documents(view, queryset):
+    """Return the Document queryset restricted to the documents the view's user may view"""
+    return get_permission_resolver(view.request.user).filter_documents(queryset)
+
+
+def get_category_tree_context(view, category):
+    """Return a dictionary with the category's ancestors and descendants, from the view's category tree"""
+    category_tree = get_category_tree(view)
+    return {
+        "category_ancestors": category_tree.get_ancestors(category),
+        "category_descendants": category_tree.get_descendants(category),
+    }
 
 
 @permission_required(permissions.user_can_view_document_catalogue)
@@ -64,7 +99,10 @@ class CategorySlugViewMixin:
 
     @cached_property
     def category(self):
-        return get_object_or_404(DocumentCategory, slug=self.category_slug)
+        category = get_category_tree(self).get(self.category_slug)
+        if category is None:
+            raise Http404("No DocumentCategory matches the given query.")
+        return category
 
 
 class DocumentPkMixin:
@@ -77,17 +115,34 @@ class DocumentPkMixin:
     @cached_property
     def document(self):
         try:
-            return Document.published.get(pk=self.document_pk)
+            return filter_viewable_documents(self, Document.published.all()).get(
+                pk=self.document_pk
+            )
         except Document.DoesNotExist:
             raise Http404
 
 
-class DocumentCatalogueListView(CatalogueViewMixin, generic.ListView):
+class DocumentCatalogueListView(
+    CatalogueViewMixin, ConditionalViewMixin, generic.ListView
+):
     """List all categories in the Catalogue"""
 
     template_name = "document_catalogue/categories_list.html"
 
-    queryset = DocumentCategory.objects.all()
+    def get_queryset(self):
+        return get_category_tree(self).all()
+
+    def get_etag_data(self):
+        return tree.get_version(), get_user_state(self)
+
+    def get_context_data(self, **kwargs):
+        ctx = super().get_context_data(**kwargs)
+        ctx.update(
+            {
+                "show_document_counts": True,
+            }
+        )
+        return ctx
 
 
 class CategoryContextViewMixin(generic.base.ContextMixin, CategorySlugViewMixin):
@@ -105,6 +160,8 @@ class CategoryListViewMixin(CategoryContextViewMixin):
         ctx.update(
             {
                 "category": self.category,
+                "show_document_counts": True,
+                **get_category_tree_context(self, self.category),
             }
         )
         return ctx
@@ -114,6 +171,7 @@ class BaseDocumentListView(
     plugins.ViewPluginManager,
     CatalogueViewMixin,
     CategoryContextViewMixin,
+    ConditionalViewMixin,
     generic.ListView,
 ):
     """
@@ -122,24 +180,77 @@ class BaseDocumentListView(
     """
 
     queryset = Document.published.all()
+    document_list_template = "document_catalogue/include/documents.html"
 
     def dispatch(self, request, *args, **kwargs):
         """Apply any plugins"""
-        self.apply_plugins(lambda plugin: plugin.apply(request))
+        self.plugins_apply(request)
         return super().dispatch(request, *args, **kwargs)
 
     def get_document_queryset(self):
-        qs = super().get_queryset()
+        qs = filter_viewable_documents(self, super().get_queryset())
         if self.category_slug:
-            qs = qs.filter(category__slug=self.category_slug)
+            qs = qs.filter(category=self.category)
         return self.plugins_extend_qs(self.request, qs)
 
     def get_queryset(self):
         return self.get_document_queryset()
 
+    def get_document_list_variant(self):
+        """
+        Return a key identifying everything, other than the category's documents, the rendered document list
+            depends on:  the plugins' cache keys (e.g., ordering), the user's permissions, and what they may view.
+        None if the list can't be cached, because a plugin doesn't supply a cache key.
+        """
+        plugin_key = self.plugins_get_cache_key(self.request)
+        if plugin_key is None:
+            return None
+        return fragments.variant_key(
+            plugin_key,
+            get_permissions_state(self),
+            get_permission_resolver(self.request.user).get_visibility_key(),
+        )
+
+    def render_document_list(self, context):
+        """Return the rendered document list, from the category's fragment cache when listing a category"""
+
+        def render():
+            template = get_template(self.document_list_template)
+            return template.render(context, self.request)
+
+        variant = self.get_document_list_variant() if self.category_slug else None
+        if variant is None:
+            return render()
+        return fragments.get_or_render(self.category.pk, variant, render)
+
+    @cached_property
+    def category_tree_stats(self):
+        """Number and last update of published documents in the category and its descendants"""
+        documents = Document.published.in_category_tree(self.category)
+        return filter_viewable_documents(self, documents).aggregate(
+            count=Count("pk"), last_modified=Max("update_date")
+        )
+
+    def get_etag_data(self):
+        variant = self.get_document_list_variant() if self.category_slug else None
+        if variant is None:
+            return None
+        # tree version covers changes to categories (e.g., renamed), stats cover bulk updates that bypass signals
+        # No Last-Modified:  no timestamp changes when a document is deleted, a category moved, or the user changes
+        return (
+            tree.get_version(),
+            self.category.pk,
+            self.category_tree_stats["count"],
+            self.category_tree_stats["last_modified"],
+            variant,
+            self.request.user.pk,
+        )
+
     def get_context_data(self, **kwargs):
         plugin_ctx = self.plugins_get_context(self.request)
-        return super().get_context_data(**plugin_ctx)
+        ctx = super().get_context_data(**plugin_ctx)
+        ctx["document_list_html"] = self.render_document_list(ctx)
+        return ctx
 
 
 @plugins.RegisterPlugins(*(plugin() for plugin in list_view_plugin_classes))
@@ -149,6 +260,44 @@ class CategoryDocumentListView(CategoryListViewMixin, BaseDocumentListView):
     template_name = "document_catalogue/category_document_list.html"
 
 
+class UploadHandlerViewMixin:
+    """
+    Mixin for views that receive document uploads - files are measured as they stream in, so they are never re-read,
+        see uploads.DocumentUploadHandler
+    Upload handlers can't be replaced once the request body is read, which CsrfViewMiddleware does to check the
+        token, so the view is exempt from the middleware and checks the token itself, after installing the handler.
+    The handler aborts invalid uploads as they stream in - the view must report upload_error.
+    With setting ABORT_DISALLOWED_UPLOADS, uploads with a content type not whitelisted are aborted too.
+    """
+
+    max_upload_files = 1  # number of files accepted per request, None for any number
+    # False if files don't start at their beginning, e.g., chunks
+    check_upload_content_type = True
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        return csrf_exempt(super().as_view(**initkwargs))
+
+    def setup(self, request, *args, **kwargs):
+        super().setup(request, *args, **kwargs)
+        abort_disallowed = appConfig.settings.ABORT_DISALLOWED_UPLOADS
+        self.upload_handler = uploads.DocumentUploadHandler(
+            request,
+            max_files=self.max_upload_files,
+            check_content_type=abort_disallowed and self.check_upload_content_type,
+        )
+        request.upload_handlers = [self.upload_handler]
+
+    @property
+    def upload_error(self):
+        """The ValidationError for which the upload handler aborted the request's upload, or None"""
+        self.request.FILES  # files are received, and may be aborted, when the request body is parsed
+        return self.upload_handler.error
+
+    def dispatch(self, request, *args, **kwargs):
+        return csrf_protect(super().dispatch)(request, *args, **kwargs)
+
+
 class DocumentViewMixin(generic.base.ContextMixin, DocumentPkMixin):
     """Mixins for views that display a document"""
 
@@ -158,6 +307,7 @@ class DocumentViewMixin(generic.base.ContextMixin, DocumentPkMixin):
             {
                 "document": self.document,
                 "category": self.document.category,
+                **get_category_tree_context(self, self.document.category),
             }
         )
         return ctx
@@ -166,30 +316,139 @@ class DocumentViewMixin(generic.base.ContextMixin, DocumentPkMixin):
         return self.request.build_absolute_uri(self.document.get_download_url())
 
 
-class DocumentDetailView(CatalogueViewMixin, DocumentViewMixin, generic.DetailView):
+class DocumentDetailView(
+    CatalogueViewMixin, DocumentViewMixin, ConditionalViewMixin, generic.DetailView
+):
     """Display detailed information about a single document"""
 
     template_name = "document_catalogue/document_detail.html"
     model = Document
 
+    def get_etag_data(self):
+        return (
+            self.document.pk,
+            self.document.update_date,
+            tree.get_version(),
+            get_user_state(self),
+        )
 
-@permission_required(permissions.user_can_view_document_catalogue)
-class DocumentDownloadView(DocumentPkMixin, generic.RedirectView):
-    """Redirect to the file URL"""
+    # No Last-Modified:  update_date doesn't change when the document's category or the user's permissions change
+
+    def get_object(self, queryset=None):
+        return self.document
+
+
+class DocumentSearchMixin:
+    """Mixin for views that answer Ajax searches, as select2 options"""
+
+    def search(self, request):
+        """
+        Ajax Search for documents matching search term in ?q= request param
+        Results are paged:  ?limit= results per page;  ?cursor= from previous page's pagination to get the next page.
+        """
+        search_term = request.GET.get("q", None)
+
+        def format_select2(document):
+            url = reverse(
+                "document_catalogue:document_detail", kwargs={"pk": document.pk}
+            )
+            return {"id": url, "text": document.title}
+
+        search_options = []
+        next_cursor = None
+        # Format options as select2 data objects
+        if search_term:  # retrieve search results, if a search_term is given
+            with metrics.timed(metrics.search_duration):
+                docs = search.get_search_backend().search(
+                    filter_viewable_documents(self, Document.published.all()),
+                    search_term,
+                )
+                try:
+                    groups, next_cursor = search.paginate(
+                        docs,
+                        search_term,
+                        cursor=request.GET.get("cursor", None),
+                        limit=request.GET.get("limit", None),
+                    )
+                except search.InvalidCursor as e:
+                    return HttpResponseBadRequest("Invalid request: %s" % e)
+
+            # total is the number of matches in the category - only the top few are listed
+            search_options = [
+                {
+                    "text": group.name,
+                    "total": group.total,
+                    "children": [format_select2(doc) for doc in group.results],
+                }
+                for group in groups
+            ]
+            metrics.observe(
+                metrics.search_results,
+                sum(len(option["children"]) for option in search_options),
+            )
+
+        else:  # Recently updated documents.
+            recently_updated = filter_viewable_documents(
+                self, Document.published.order_by("-update_date")
+            )[:10]
+            if recently_updated:
+                options = [format_select2(doc) for doc in recently_updated]
+                search_options = [
+                    {"text": "Recently Updated", "children": options},
+                ]
+
+        # pagination follows select2's infinite scrolling protocol, with the addition of the next page cursor
+        return self.render_to_json_response(
+            {
+                "options": search_options,
+                "pagination": {"more": bool(next_cursor), "cursor": next_cursor},
+            }
+        )
+
+
+def record_download(response):
+    """Count the download in the metrics, by download server and response status"""
+    metrics.inc(
+        metrics.downloads,
+        server=appConfig.settings.DOWNLOAD_SERVER or "redirect",
+        status=response.status_code,
+    )
+
+
+@permission_required(permissions.user_can_download_document)
+class DocumentDownloadView(DocumentPkMixin, generic.View):
+    """Send the document's file, using the configured download server - by default, redirect to the file URL"""
+
+    def get(self, request, *args, **kwargs):
+        response = downloads.get_download_server().serve(request, self.document)
+        record_download(response)
+        return response
+
+
+@permission_required(permissions.user_can_download_document)
+class DocumentAsyncDownloadView(AsyncViewMixin, DocumentPkMixin, generic.View):
+    """Async variant of DocumentDownloadView, for ASGI deployments - see DOCUMENT_CATALOGUE_ASYNC_VIEWS"""
 
-    def get_redirect_url(self, *args, **kwargs):
-        """Return the document's file download URL"""
-        return self.document.file.url
+    async def get(self, request, *args, **kwargs):
+        document = await sync_to_async(lambda: self.document)()
+        response = await downloads.get_download_server().aserve(request, document)
+        record_download(response)
+        return response
 
 
 @permission_required(permissions.user_can_edit_document)
-class DocumentEditView(CatalogueViewMixin, DocumentViewMixin, generic.UpdateView):
+class DocumentEditView(
+    UploadHandlerViewMixin, CatalogueViewMixin, DocumentViewMixin, generic.UpdateView
+):
     """Display detailed information about a single document"""
 
     template_name = "document_catalogue/document_edit.html"
     model = Document
     form_class = forms.DocumentEditForm
 
+    def get_form_kwargs(self):
+        return {**super().get_form_kwargs(), "upload_error": self.upload_error}
+
 
 @permission_required(permissions.user_can_delete_document)
 class DocumentDeleteView(CatalogueViewMixin, DocumentViewMixin, generic.DeleteView):
@@ -209,15 +468,20 @@ class DocumentDeleteView(CatalogueViewMixin, DocumentViewMixin, generic.DeleteVi
 
 
 class DocumentAjaxAPI(
-    CatalogueViewMixin, CategorySlugViewMixin, DocumentPkMixin, AjaxOnlyViewMixin
+    UploadHandlerViewMixin,
+    CatalogueViewMixin,
+    CategorySlugViewMixin,
+    DocumentPkMixin,
+    DocumentSearchMixin,
+    AjaxOnlyViewMixin,
 ):
     """
     Async API for document actions
     Plays nice with document_catalogue.js and dropzone
     """
 
-    def save_document(self):
-        file = self.request.FILES["file"]
+    def save_document(self, file=None):
+        file = file or self.request.FILES["file"]
         document = Document(
             user=self.request.user,
             title=file.name,
@@ -229,14 +493,18 @@ class DocumentAjaxAPI(
         return document
 
     def post(self, request, *args, **kwargs):
-        if not permissions.user_can_post_document(request.user, **self.kwargs):
+        if not has_permission(
+            request.user, permissions.user_can_post_document, **self.kwargs
+        ):
             return HttpResponseForbidden("Permission Denied")
 
         form_class = forms.DocumentUploadForm
         document_template = get_template("document_catalogue/include/documents.html")
 
         def get_form():
-            return form_class(data=request.POST, files=request.FILES)
+            return form_class(
+                data=request.POST, files=request.FILES, upload_error=self.upload_error
+            )
 
         # Use the Upload Form to validate the file (mime type and size)
         form = get_form()
@@ -261,7 +529,9 @@ class DocumentAjaxAPI(
             )
 
     def delete(self, request, *args, **kwargs):
-        if not permissions.user_can_delete_document(request.user, **self.kwargs):
+        if not has_permission(
+            request.user, permissions.user_can_delete_document, **self.kwargs
+        ):
             return HttpResponseForbidden("Permission Denied")
         if self.document:
             self.document.delete()
@@ -271,34 +541,242 @@ class DocumentAjaxAPI(
             return HttpResponseForbidden("Invalid request. Document NOT deleted.")
 
     def get(self, request, *args, **kwargs):
-        """Ajax Search for documents matching search term in ?q= request param"""
-        search_term = request.GET.get("q", None)
+        return self.search(request)
 
-        def format_select2(document):
-            return {"id": document.get_absolute_url(), "text": document.title}
 
-        search_options = []
-        # Format options as select2 data objects
-        if search_term:  # retrieve search results, if a search_term is given
-            filter = Q(title__icontains=search_term) | Q(
-                category__name__icontains=search_term
+@permission_required(permissions.user_can_view_document_catalogue)
+class DocumentAsyncSearchAPI(AsyncViewMixin, DocumentSearchMixin, AjaxOnlyViewMixin):
+    """
+    Async variant of the DocumentAjaxAPI search, for ASGI deployments - see DOCUMENT_CATALOGUE_ASYNC_VIEWS
+    Each search runs in a worker thread of its own, releasing the event loop, so searches run in parallel - unlike
+        Django's async queryset methods, which run every query in the process on one shared thread.
+        A search only reads, so it needn't share that thread's connection (or transaction):  it opens its own,
+        and closes it when done, as Django does at the end of a request.
+    """
+
+    http_method_names = ["get", "head"]
+    thread_sensitive = False  # True to search on Django's shared thread, e.g., to see a test's transaction
+
+    def search_in_thread(self, request):
+        try:
+            return self.search(request)
+        finally:
+            connections.close_all()  # the worker thread's connections
+
+    async def get(self, request, *args, **kwargs):
+        search = sync_to_async(
+            self.search_in_thread, thread_sensitive=self.thread_sensitive
+        )
+        return await search(request)
+
+
+class DocumentBatchAjaxAPI(DocumentAjaxAPI):
+    """
+    Async API to upload many documents to a category in a single request
+    Plays nice with dropzone's uploadMultiple option:  all files are posted with the same field name
+    Every file is validated before any is saved, then all are inserted in one query, so a batch
+        is saved completely or not at all.
+    """
+
+    http_method_names = ["post"]
+    max_upload_files = None
+
+    def save_documents(self, files):
+        """Bulk insert a document for each file, return the new documents in upload order"""
+        documents = [
+            Document(
+                user=self.request.user,
+                title=file.name,
+                category=self.category,
+                is_published=True,
+                file=file,
             )
-            docs = Document.published.filter(filter)
+            for file in files
+        ]
+        try:
+            with transaction.atomic():
+                return self.insert_documents(documents)
+        except Exception:
+            # files stored by prepare_file or bulk_create are referred to by no document
+            for document in documents:
+                document.discard_upload()
+            raise
+
+    def insert_documents(self, documents):
+        """Insert the documents in the current transaction, return them in upload order"""
+        first = CategorySortOrder.allocate(self.category.pk, count=len(documents))
+        sort_orders = range(first, first + len(documents))
+        in_block = Document.objects.filter(
+            category=self.category,
+            sort_order__range=(sort_orders[0], sort_orders[-1]),
+        )
+        returns_pks = connection.features.can_return_rows_from_bulk_insert
+        # documents given a sort_order in the block some other way, e.g. edited by hand, aren't in the batch
+        existing = [] if returns_pks else list(in_block.values_list("pk", flat=True))
+        for document, sort_order in zip(documents, sort_orders):
+            document.sort_order = sort_order
+            document.prepare_file()  # bulk_create doesn't call save()
+        Document.objects.bulk_create(documents)
+        for document in documents:
+            document.keep_shared_blob()
+        if returns_pks:
+            batch = Document.objects.filter(pk__in=[d.pk for d in documents])
+        else:  # fetch the batch by its block of sort_order
+            batch = in_block.exclude(pk__in=existing)
+        # bulk_create sends no signals, so update derived data for the whole batch here
+        search.get_search_backend().index_documents(batch)
+        tree.invalidate()
+        fragments.bump_generation(self.category.pk)
+        return list(batch)
 
-            search_options = [
-                {
-                    "text": category.name,
-                    "children": [format_select2(doc) for doc in group],
-                }
-                for category, group in groupby(docs, lambda d: d.category)
-            ]
+    def post(self, request, *args, **kwargs):
+        if not has_permission(
+            request.user, permissions.user_can_post_document, **self.kwargs
+        ):
+            return HttpResponseForbidden("Permission Denied")
+
+        if (
+            self.upload_error
+        ):  # the whole batch is rejected, like any batch with an invalid file
+            return HttpResponseForbidden(
+                "Invalid request: Form errors %s"
+                % ", ".join(self.upload_error.messages)
+            )
+        files = request.FILES.getlist("file")
+        if not files:
+            return HttpResponseForbidden("Invalid request: no files uploaded")
+
+        # Use the Upload Form to validate each file (mime type and size)
+        errors = []
+        for file in files:
+            form = forms.DocumentUploadForm(files={"file": file})
+            if not form.is_valid():
+                errors.append(
+                    "%s: %s"
+                    % (file.name, ", ".join(e.as_text() for e in form.errors.values()))
+                )
+        if (
+            errors
+        ):  # Common error handling is completed by dropzone -- this is a hard-fail fallback.
+            return HttpResponseForbidden(
+                "Invalid request: Form errors %s" % "; ".join(errors)
+            )
+
+        documents = self.save_documents(files)
+        document_template = get_template("document_catalogue/include/documents.html")
+        html = document_template.render(
+            {"document_list": documents, **get_permissions_context(self)}
+        )
+        return self.render_to_json_response(
+            {
+                "success": True,
+                "document_count": len(documents),
+                "document_items": html,
+            }
+        )
+
+
+class DocumentChunkedAjaxAPI(DocumentAjaxAPI):
+    """
+    Async API to upload a large document to a category in chunks, which may be resumed if interrupted
+    Plays nice with dropzone's chunking option:
+        POST each chunk with dropzone's dz* params, then POST just the dzuuid to assemble and save the document.
+        POST a file without dz* params to upload it whole, as dropzone does for files smaller than a chunk.
+        GET ?dzuuid= for the chunks received so far, to resume an interrupted upload with the missing chunks.
+    See document_catalogue.uploads
+    """
+
+    http_method_names = ["get", "post"]
+    check_upload_content_type = False  # checked when the chunks are assembled
+
+    def get_upload(self, params):
+        return uploads.ChunkedUpload(params.get("dzuuid", ""), self.request.user)
+
+    def save_chunk(self, request):
+        if self.upload_error:
+            raise uploads.InvalidChunk(", ".join(self.upload_error.messages))
+        file = request.FILES.get("file")
+        if file is None:
+            raise uploads.InvalidChunk("No chunk uploaded")
+        try:
+            index, total_chunks, total_size = (
+                int(request.POST[param])
+                for param in ("dzchunkindex", "dztotalchunkcount", "dztotalfilesize")
+            )
+        except (KeyError, ValueError) as e:
+            raise uploads.InvalidChunk("Invalid chunk parameters: %s" % e)
+        upload = self.get_upload(request.POST)
+        if index == 0:  # good time to clear out abandoned uploads
+            uploads.purge_expired()
+        upload.start(file.name, file.content_type, total_chunks, total_size)
+        upload.save_chunk(index, file)
+        return self.render_to_json_response({"success": True, "chunk": index})
+
+    def save_upload(self, request):
+        upload = self.get_upload(request.POST)
+        file = upload.assemble()
+        try:
+            # Use the Upload Form to validate the assembled file (mime type and size)
+            form = forms.DocumentUploadForm(files={"file": file})
+            if not form.is_valid():
+                return HttpResponseForbidden(
+                    "Invalid request: Form errors %s"
+                    % ", ".join(e.as_text() for e in form.errors.values())
+                )
+            document = self.save_document(file)
+        finally:
+            file.close()
+            upload.delete()
+        document_template = get_template("document_catalogue/include/documents.html")
+        html = document_template.render(
+            {"document_list": (document,), **get_permissions_context(self)}
+        )
+        return self.render_to_json_response({"success": True, "document_item": html})
+
+    def post(self, request, *args, **kwargs):
+        if not has_permission(
+            request.user, permissions.user_can_post_document, **self.kwargs
+        ):
+            return HttpResponseForbidden("Permission Denied")
+        try:
+            if "dzchunkindex" in request.POST:
+                return self.save_chunk(request)
+            if "file" in request.FILES:  # small enough to be sent whole
+                return super().post(request, *args, **kwargs)
+            return self.save_upload(request)
+        except uploads.InvalidChunk as e:
+            return HttpResponseBadRequest("Invalid request: %s" % e)
+
+    def get(self, request, *args, **kwargs):
+        """Report the chunks received so far for the upload given by ?dzuuid="""
+        if not has_permission(
+            request.user, permissions.user_can_post_document, **self.kwargs
+        ):
+            return HttpResponseForbidden("Permission Denied")
+        try:
+            upload = self.get_upload(request.GET)
+        except uploads.InvalidChunk as e:
+            return HttpResponseBadRequest("Invalid request: %s" % e)
+        meta = upload.meta
+        return self.render_to_json_response(
+            {
+                "received": upload.received_chunks(meta),
+                "total_chunks": meta["total_chunks"] if meta else None,
+                "complete": upload.is_complete(meta),
+            }
+        )
 
-        else:  # Recently updated documents.
-            recently_updated = Document.published.order_by("-update_date")[:10]
-            if recently_updated:
-                options = [format_select2(doc) for doc in recently_updated]
-                search_options = [
-                    {"text": "Recently Updated", "children": options},
-                ]
 
-        return self.render_to_json_response({"options": search_options})
+class MetricsView(generic.View):
+    """The catalogue's metrics, in Prometheus text format - see DOCUMENT_CATALOGUE_METRICS"""
+
+    http_method_names = ["get", "head"]
+
+    def get(self, request, *args, **kwargs):
+        if not metrics.is_enabled():
+            raise Http404("Metrics are not enabled")
+        if not metrics.is_authorized(request):
+            return HttpResponseForbidden("Permission Denied")
+        return HttpResponse(
+            metrics.registry.expose(), content_type=metrics.CONTENT_TYPE
+        )
@@ -1,6 +1,13 @@
 """ Re-usable generic views and view mixins """
+import asyncio
+import hashlib
+import inspect
+from calendar import timegm
+
 from django import http
 from django.template.loader import get_template
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
 from django.views import generic
 
 
@@ -67,3 +74,71 @@ class AjaxOnlyViewMixin(
                 context={"form": form, "strip_tags": strip_tags}
             ),
         }
+
+
+def mark_coroutine_view(view):
+    """Mark a view function that returns a coroutine, so Django's handlers await it"""
+    try:
+        from asgiref.sync import markcoroutinefunction
+    except ImportError:  # asgiref < 3.6
+        view._is_coroutine = asyncio.coroutines._is_coroutine
+    else:
+        markcoroutinefunction(view)
+    return view
+
+
+class AsyncViewMixin:
+    """
+    A mixin for Views whose HTTP method handlers are all coroutines (async def), served natively under ASGI.
+    Must come first in the view's bases:  dispatch awaits the handler, and returns any other response (e.g., from
+        http_method_not_allowed, or another mixin's dispatch) as-is.
+    Django < 4.1 treats every class-based view as sync, so as_view marks the view function as a coroutine function.
+    """
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        return mark_coroutine_view(super().as_view(**initkwargs))
+
+    async def dispatch(self, request, *args, **kwargs):
+        response = super().dispatch(request, *args, **kwargs)
+        if inspect.isawaitable(response):
+            response = await response
+        return response
+
+
+class ConditionalViewMixin:
+    """
+    A mixin that answers conditional GET requests with 304 Not Modified, before any rendering work is done.
+    Sub-classes supply cheap validators for the response by overriding get_etag_data and get_last_modified.
+    """
+
+    def get_etag_data(self):
+        """
+        Return a tuple of values that identify the content of the response, or None for no ETag.
+        Values must have a stable repr.
+        """
+        return None
+
+    def get_last_modified(self):
+        """Return the datetime the content of the response was last modified, or None for no Last-Modified"""
+        return None
+
+    def get_etag(self):
+        data = self.get_etag_data()
+        if data is None:
+            return None
+        # weak:  responses with the same validators are equivalent, but not byte-for-byte (e.g., csrf tokens)
+        return 'W/"%s"' % hashlib.md5(repr(data).encode("utf-8")).hexdigest()
+
+    def get(self, request, *args, **kwargs):
+        etag = self.get_etag()
+        last_modified = self.get_last_modified()
+        timestamp = timegm(last_modified.utctimetuple()) if last_modified else None
+        response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+        if response is None:
+            response = super().get(request, *args, **kwargs)
+        if etag and not response.has_header("ETag"):
+            response["ETag"] = etag
+        if timestamp and not response.has_header("Last-Modified"):
+            response["Last-Modified"] = http_date(timestamp)
+        return response
@@ -1,5 +1,5 @@
 from invoke import Collection, task
 
-from . import clean, deps, docs, pypi
+from . import bench, clean, deps, docs, pypi
 
-namespace = Collection(clean, deps, docs, pypi)
+namespace = Collection(bench, clean, deps, docs, pypi)
@@ -0,0 +1,16 @@
+from invoke import task
+
+
+@task(name="run")
+def bench_run(c, size="1k", shape="shallow", iterations=50, json=False):
+    """Run the view benchmarks against a synthetic catalogue"""
+    print("Running benchmarks...")
+    c.run(
+        "python -m benchmarks --size {size} --shape {shape} --iterations {iterations}{json}".format(
+            size=size,
+            shape=shape,
+            iterations=iterations,
+            json=" --json" if json else "",
+        )
+    )
+    print("Done.")
@@ -1,6 +1,8 @@
 """
      Base classes used to setup testing fixtures
 """
+from contextlib import contextmanager
+
 from django.apps import apps
 from django.conf import settings
 from django.contrib.auth.models import AnonymousUser, Permission, User
@@ -17,6 +19,17 @@ def null_object():
     return lambda: None
 
 
+@contextmanager
+def app_settings(**settings):
+    """Override the given document_catalogue app settings, e.g., app_settings(CACHE='other')"""
+    original = appConfig.settings
+    appConfig.settings = original._replace(**settings)
+    try:
+        yield
+    finally:
+        appConfig.settings = original
+
+
 def anonymous_user():
     return AnonymousUser()
 
@@ -109,11 +122,14 @@ def generate_simple_uploaded_file(filename, file_type="txt"):
     raise Exception("Don't know how to generate file of type %s" % file_type)
 
 
-def create_document(filename="hello.txt", file_type="txt", user=None, category=None):
+def create_document(
+    filename="hello.txt", file_type="txt", user=None, category=None, **kwargs
+):
     document = models.Document.objects.create(
         category=category or models.DocumentCategory.objects.all().first(),
         user=user or create_user(permissions=("Can add document")),
-        is_published=True,
+        is_published=kwargs.pop("is_published", True),
         file=generate_simple_uploaded_file(filename, file_type),
+        **kwargs,
     )
     return document
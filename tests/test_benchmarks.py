@@ -0,0 +1,58 @@
+from django.test import TestCase, TransactionTestCase
+
+from benchmarks import catalogue, runner
+from document_catalogue import models
+
+
+class BenchmarkRunnerTests(TestCase):
+    """
+    Smoke test the benchmark harness against a tiny catalogue so it doesn't rot
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.user, self.categories = catalogue.build_catalogue(
+            documents=20, depth=2, fanout=2
+        )
+
+    def test_build_catalogue(self):
+        self.assertEqual(len(self.categories), 6)
+        self.assertEqual(models.Document.published.count(), 20)
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(runner.percentile(values, 50), 50)
+        self.assertEqual(runner.percentile(values, 99), 99)
+        self.assertEqual(runner.percentile([7], 90), 7)
+
+    def test_run_benchmarks(self):
+        scenarios = runner.default_scenarios(self.user, self.categories)
+        results = runner.run_benchmarks(self.user, scenarios, iterations=2, warmup=1)
+        self.assertEqual(len(results), len(scenarios))
+        for result in results:
+            summary = result.summary()
+            self.assertEqual(summary["n"], 2)
+            self.assertEqual(summary["errors"], 0, "%s failed" % result.name)
+            self.assertGreater(summary["queries"], 0)
+        self.assertIn("api_search", runner.format_report(results))
+        # upload scenario cleans up after itself
+        self.assertEqual(models.Document.published.count(), 20)
+
+
+class ThroughputTests(TransactionTestCase):
+    """
+    Smoke test the WSGI / ASGI throughput comparison - requests are sent from other threads, so data is committed
+    """
+
+    def test_run_throughput(self):
+        user, categories = catalogue.build_catalogue(documents=20, depth=1, fanout=2)
+        results = runner.run_throughput(user, requests=6, concurrency=2)
+        self.assertEqual(
+            [result.name for result in results],
+            ["wsgi", "asgi_sync_view", "asgi_async_view"],
+        )
+        for result in results:
+            summary = result.summary()
+            self.assertEqual(summary["n"], 6)
+            self.assertEqual(summary["errors"], 0, "%s failed" % result.name)
+        self.assertIn("asgi_async_view", runner.format_throughput_report(results))
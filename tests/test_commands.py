@@ -0,0 +1,71 @@
+from io import StringIO
+
+from django.core.management import CommandError, call_command
+from django.test import TestCase
+
+from document_catalogue import models
+
+from . import base
+
+
+class GenerateCatalogueTests(TestCase):
+    """
+    Test the generate_catalogue management command
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.user = base.create_user()
+
+    def generate(self, **options):
+        out = StringIO()
+        call_command(
+            "generate_catalogue",
+            username=self.user.username,
+            no_files=True,
+            stdout=out,
+            **options,
+        )
+        return out.getvalue()
+
+    def test_generate_catalogue(self):
+        out = self.generate(depth=3, fanout=2, documents=50)
+        self.assertIn("Generated 14 categories and 50 documents", out)
+        self.assertEqual(models.DocumentCategory.objects.count(), 14)
+        self.assertEqual(models.Document.objects.count(), 50)
+
+    def test_mptt_fields_consistent(self):
+        base.create_document_categories()  # generated trees are appended to existing trees
+        self.generate(depth=3, fanout=3, documents=0)
+
+        def tree_fields():
+            # tree_id of each root may be renumbered by a rebuild, so compare tree membership by root slug
+            categories = models.DocumentCategory.objects.all()
+            roots = {c.tree_id: c.slug for c in categories if c.is_root_node()}
+            return {
+                c.slug: (roots[c.tree_id], c.lft, c.rght, c.level, c.parent_id)
+                for c in categories
+            }
+
+        generated = tree_fields()
+        models.DocumentCategory.objects.rebuild()
+        self.assertEqual(generated, tree_fields())
+
+    def test_sort_order_per_category(self):
+        self.generate(depth=1, fanout=3, documents=30)
+        for category in models.DocumentCategory.objects.all():
+            orders = list(
+                category.document_set.order_by("sort_order").values_list(
+                    "sort_order", flat=True
+                )
+            )
+            self.assertEqual(orders, list(range(1, len(orders) + 1)))
+
+    def test_prefix_conflict(self):
+        self.generate(depth=1, fanout=2)
+        with self.assertRaises(CommandError):
+            self.generate(depth=1, fanout=2)
+
+    def test_no_user(self):
+        with self.assertRaises(CommandError):
+            call_command("generate_catalogue", stdout=StringIO())
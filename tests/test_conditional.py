@@ -0,0 +1,91 @@
+from django.test import TestCase
+from django.urls import reverse
+
+from . import base
+
+
+class ConditionalGetTests(TestCase):
+    """
+    Test catalogue views answer conditional GET requests with 304 Not Modified
+    """
+
+    FUTURE = "Fri, 01 Jan 2100 00:00:00 GMT"
+
+    def setUp(self):
+        super().setUp()
+        self.categories = base.create_document_categories()
+        self.category = self.categories[1]
+        self.user = base.create_user()
+        self.document = base.create_document(user=self.user, category=self.category)
+        self.client.force_login(self.user)
+        self.category_url = reverse(
+            "document_catalogue:category_list", kwargs={"slug": self.category.slug}
+        )
+        self.detail_url = reverse(
+            "document_catalogue:document_detail", kwargs={"pk": self.document.pk}
+        )
+
+    def tearDown(self):
+        self.document.file.delete()
+        super().tearDown()
+
+    def assertNotModified(self, url, **headers):
+        response = self.client.get(url, **headers)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.templates, [])  # answered before any rendering
+        return response
+
+    def revalidate(self, url, response):
+        return self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+
+    def test_catalogue_list(self):
+        url = reverse("document_catalogue:catalogue_list")
+        response = self.client.get(url)
+        self.assertNotModified(url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.category.name = "Renamed"
+        self.category.save()
+        self.assertEqual(self.revalidate(url, response).status_code, 200)
+
+    def test_category_list(self):
+        response = self.client.get(self.category_url)
+        self.assertNotModified(self.category_url, HTTP_IF_NONE_MATCH=response["ETag"])
+
+    def test_no_last_modified(self):
+        """Last-Modified would be stale when a document is deleted, a category changes, or the user changes"""
+        for url in (self.category_url, self.detail_url):
+            response = self.client.get(url)
+            self.assertFalse(response.has_header("Last-Modified"))
+            response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=self.FUTURE)
+            self.assertEqual(response.status_code, 200)
+
+    def test_category_list_document_changed(self):
+        response = self.client.get(self.category_url)
+        self.document.title = "Changed"
+        self.document.save()
+        self.assertEqual(self.revalidate(self.category_url, response).status_code, 200)
+
+    def test_category_list_sub_category_changed(self):
+        parent_url = reverse(
+            "document_catalogue:category_list",
+            kwargs={"slug": self.category.parent.slug},
+        )
+        response = self.client.get(parent_url)
+        self.document.delete()
+        self.assertEqual(self.revalidate(parent_url, response).status_code, 200)
+
+    def test_category_list_ordering(self):
+        response = self.client.get(self.category_url)
+        self.client.get(self.category_url, {"dc_ordering": "title"})
+        self.assertEqual(self.revalidate(self.category_url, response).status_code, 200)
+
+    def test_category_list_user(self):
+        response = self.client.get(self.category_url)
+        self.client.force_login(base.create_user(username="other"))
+        self.assertEqual(self.revalidate(self.category_url, response).status_code, 200)
+
+    def test_document_detail(self):
+        response = self.client.get(self.detail_url)
+        self.assertNotModified(self.detail_url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.document.description = "Changed"
+        self.document.save()
+        self.assertEqual(self.revalidate(self.detail_url, response).status_code, 200)
@@ -0,0 +1,226 @@
+from asgiref.sync import async_to_sync
+from django.core.exceptions import ImproperlyConfigured, PermissionDenied
+from django.test import AsyncRequestFactory, RequestFactory, TestCase
+
+from document_catalogue import downloads, views
+
+from . import base
+
+
+class DownloadServerTests(TestCase):
+    """
+    Test download servers send the document file, or tell the web server to
+    """
+
+    def setUp(self):
+        super().setUp()
+        base.create_document_categories()
+        self.document = base.create_document(filename="report.txt")
+        self.request = RequestFactory().get("/")
+
+    def tearDown(self):
+        self.document.file.delete()
+        super().tearDown()
+
+    def serve(self, server_class):
+        return server_class().serve(self.request, self.document)
+
+    def assert_filename(self, response):
+        self.assertEqual(
+            response["Content-Disposition"],
+            "inline; filename*=UTF-8''%s" % self.document.filename(),
+        )
+
+    def test_redirect(self):
+        response = self.serve(downloads.RedirectDownloadServer)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response.url, self.document.file.url)
+
+    def test_nginx(self):
+        response = self.serve(downloads.XAccelRedirectDownloadServer)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response["X-Accel-Redirect"],
+            "/document-catalogue-internal/%s" % self.document.file.name,
+        )
+        self.assertEqual(response["Content-Type"], "text/plain")
+        self.assertEqual(response.content, b"")
+        self.assertIn("private", response["Cache-Control"])
+        self.assert_filename(response)
+
+    def test_apache(self):
+        response = self.serve(downloads.XSendfileDownloadServer)
+        self.assertEqual(response["X-Sendfile"], self.document.file.path)
+        self.assertEqual(response.content, b"")
+        self.assert_filename(response)
+
+    def test_content_disposition(self):
+        self.document.file.name = "documents/Résumé 2024.pdf"
+        self.assertEqual(
+            downloads.BaseDownloadServer.content_disposition(self.document),
+            "inline; filename*=UTF-8''R%C3%A9sum%C3%A9%202024.pdf",
+        )
+
+    def test_get_download_server_class(self):
+        get_class = downloads.get_download_server_class
+        self.assertIs(get_class("nginx"), downloads.XAccelRedirectDownloadServer)
+        self.assertIs(get_class("apache"), downloads.XSendfileDownloadServer)
+        self.assertIs(get_class("django"), downloads.StreamingDownloadServer)
+        self.assertIs(
+            get_class("document_catalogue.downloads.RedirectDownloadServer"),
+            downloads.RedirectDownloadServer,
+        )
+        with self.assertRaises(ImproperlyConfigured):
+            get_class("lighttpd")
+
+
+class StreamingDownloadServerTests(TestCase):
+    """
+    Test the streaming download server honours Range and If-Range requests
+    """
+
+    CONTENT = b"Hello World"  # see base.generate_simple_uploaded_file
+
+    def setUp(self):
+        super().setUp()
+        base.create_document_categories()
+        self.document = base.create_document(filename="report.txt")
+        self.server = downloads.StreamingDownloadServer()
+        self.server.chunk_size = 4
+
+    def tearDown(self):
+        self.document.file.delete()
+        super().tearDown()
+
+    def get(self, method="get", **headers):
+        request = getattr(RequestFactory(), method)("/", **headers)
+        return self.server.serve(request, self.document)
+
+    def content(self, response):
+        return b"".join(response.streaming_content)
+
+    def test_whole_file(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.content(response), self.CONTENT)
+        self.assertEqual(response["Content-Length"], str(len(self.CONTENT)))
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+        self.assertEqual(response["Content-Type"], "text/plain")
+        self.assertTrue(response["ETag"].startswith('"'))
+        self.assertEqual(
+            response["Content-Disposition"],
+            "inline; filename*=UTF-8''%s" % self.document.filename(),
+        )
+
+    def test_stable_etag(self):
+        self.assertEqual(self.get()["ETag"], self.get()["ETag"])
+
+    def test_range(self):
+        for header, expected, content_range in (
+            ("bytes=0-4", b"Hello", "bytes 0-4/11"),
+            ("bytes=6-", b"World", "bytes 6-10/11"),
+            ("bytes=-3", b"rld", "bytes 8-10/11"),
+            ("bytes=6-100", b"World", "bytes 6-10/11"),
+        ):
+            response = self.get(HTTP_RANGE=header)
+            self.assertEqual(response.status_code, 206, header)
+            self.assertEqual(self.content(response), expected)
+            self.assertEqual(response["Content-Range"], content_range)
+            self.assertEqual(response["Content-Length"], str(len(expected)))
+            self.assertIn(self.document.filename(), response["Content-Disposition"])
+
+    def test_unsatisfiable_range(self):
+        for header in ("bytes=11-", "bytes=5-2", "bytes=-0"):
+            response = self.get(HTTP_RANGE=header)
+            self.assertEqual(response.status_code, 416, header)
+            self.assertEqual(response["Content-Range"], "bytes */11")
+
+    def test_ignored_range(self):
+        for header in ("bytes=0-1,4-5", "lines=1-2", "bytes=a-b"):
+            response = self.get(HTTP_RANGE=header)
+            self.assertEqual(response.status_code, 200, header)
+            self.assertEqual(self.content(response), self.CONTENT)
+
+    def test_if_range(self):
+        etag = self.get()["ETag"]
+        last_modified = self.get()["Last-Modified"]
+        for if_range in (etag, last_modified):
+            response = self.get(HTTP_RANGE="bytes=6-", HTTP_IF_RANGE=if_range)
+            self.assertEqual(response.status_code, 206)
+        for if_range in ('"stale"', "Thu, 01 Jan 1970 00:00:00 GMT"):
+            response = self.get(HTTP_RANGE="bytes=6-", HTTP_IF_RANGE=if_range)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(self.content(response), self.CONTENT)
+
+    def test_not_modified(self):
+        etag = self.get()["ETag"]
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_head(self):
+        response = self.get("head", HTTP_RANGE="bytes=6-")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response["Content-Length"], "5")
+        self.assertEqual(response.content, b"")
+
+
+class AsyncDownloadTests(TestCase):
+    """
+    Test the async download view, and async streaming of document files
+    """
+
+    CONTENT = b"Hello World"  # see base.generate_simple_uploaded_file
+
+    def setUp(self):
+        super().setUp()
+        base.create_document_categories()
+        self.document = base.create_document(filename="report.txt")
+        self.user = self.document.user
+        self.server = downloads.StreamingDownloadServer()
+        self.server.chunk_size = 4
+
+    def tearDown(self):
+        self.document.file.delete()
+        super().tearDown()
+
+    def download(self, user, **headers):
+        request = AsyncRequestFactory().get("/")
+        request.META.update(headers)
+        request.user = user
+        view = views.DocumentAsyncDownloadView.as_view()
+        return async_to_sync(view)(request, pk=self.document.pk)
+
+    @async_to_sync
+    async def content(self, response):
+        if getattr(response, "is_async", False):
+            return b"".join([chunk async for chunk in response.streaming_content])
+        return b"".join(response.streaming_content)
+
+    @async_to_sync
+    async def astream(self, start, length):
+        file = self.document.file.storage.open(self.document.file.name, "rb")
+        return [chunk async for chunk in self.server.astream(file, start, length)]
+
+    def test_astream(self):
+        self.assertEqual(self.astream(0, 11), [b"Hell", b"o Wo", b"rld"])
+        self.assertEqual(self.astream(6, 5), [b"Worl", b"d"])
+
+    def test_aserve(self):
+        request = RequestFactory().get("/", HTTP_RANGE="bytes=6-")
+        response = async_to_sync(self.server.aserve)(request, self.document)
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(self.content(response), b"World")
+
+    def test_permission_denied(self):
+        with self.assertRaises(PermissionDenied):
+            self.download(base.anonymous_user())
+
+    def test_redirect(self):
+        response = self.download(self.user)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response.url, self.document.file.url)
+
+    def test_streaming(self):
+        with base.app_settings(DOWNLOAD_SERVER="django"):
+            response = self.download(self.user, HTTP_RANGE="bytes=0-4")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(self.content(response), b"Hello")
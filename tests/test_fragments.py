@@ -0,0 +1,111 @@
+from django.db import connection
+from django.test import RequestFactory, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from document_catalogue import fragments, plugins, views
+
+from . import base
+
+
+class DocumentListFragmentTests(TestCase):
+    """
+    Test rendered document lists are cached per category and invalidated when its documents change
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.categories = base.create_document_categories()
+        self.category = self.categories[1]
+        self.user = base.create_user()
+        self.editor = base.create_user(
+            username="editor", permissions=("Can change document",)
+        )
+        self.document = base.create_document(
+            user=self.user, category=self.category, title="Original Title"
+        )
+        self.client.force_login(self.user)
+
+    def tearDown(self):
+        self.document.file.delete()
+        super().tearDown()
+
+    def get(self, category=None, **params):
+        category = category or self.category
+        url = reverse(
+            "document_catalogue:category_list", kwargs={"slug": category.slug}
+        )
+        return self.client.get(url, params)
+
+    def test_cached(self):
+        self.get()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.get()
+        self.assertContains(response, "Original Title")
+        # only the conditional GET validators query the Document table
+        document_queries = [
+            q["sql"]
+            for q in queries
+            if 'FROM "document_catalogue_document"' in q["sql"]
+        ]
+        self.assertEqual([sql for sql in document_queries if "COUNT(" not in sql], [])
+
+    def test_invalidate_on_save(self):
+        self.get()
+        self.document.title = "New Title"
+        self.document.save()
+        self.assertContains(self.get(), "New Title")
+
+    def test_invalidate_on_move(self):
+        other = self.categories[2]
+        self.get()
+        self.get(other)
+        self.document.category = other
+        self.document.save()
+        self.assertNotContains(self.get(), "Original Title")
+        self.assertContains(self.get(other), "Original Title")
+
+    def test_invalidate_on_delete(self):
+        self.get()
+        self.document.delete()
+        self.assertNotContains(self.get(), "Original Title")
+
+    def test_variant_ordering(self):
+        second = base.create_document(
+            user=self.user, category=self.category, title="Another Document"
+        )
+        by_title = self.get(dc_ordering="title").content.decode()
+        self.assertLess(by_title.index("Another"), by_title.index("Original"))
+        by_default = self.get(dc_ordering="default").content.decode()
+        self.assertLess(by_default.index("Original"), by_default.index("Another"))
+        second.file.delete()
+
+    def test_variant_permissions(self):
+        self.assertNotContains(self.get(), "dc-document-edit")
+        self.client.force_login(self.editor)
+        self.assertContains(self.get(), "dc-document-edit")
+
+    def test_plugin_without_cache_key(self):
+        class FilterPlugin(plugins.AbstractViewPlugin):
+            def extend_qs(self, request, qs):
+                return qs.exclude(title=request.GET.get("exclude"))
+
+        @plugins.RegisterPlugins(FilterPlugin())
+        class ListView(views.CategoryDocumentListView):
+            pass
+
+        def get(**params):
+            request = RequestFactory().get("/", params)
+            request.user, request.session = self.user, {}
+            response = ListView.as_view()(request, slug=self.category.slug)
+            return response.render()
+
+        self.assertContains(get(), "Original Title")
+        self.assertNotContains(get(exclude="Original Title"), "Original Title")
+        self.assertFalse(get().has_header("ETag"))
+
+    def test_bump_generation(self):
+        generation = fragments.get_generation(self.category.pk)
+        self.assertEqual(fragments.get_generation(self.category.pk), generation)
+        fragments.bump_generation(self.category.pk)
+        self.assertNotEqual(fragments.get_generation(self.category.pk), generation)
@@ -0,0 +1,286 @@
+from asgiref.sync import async_to_sync
+from django.core.exceptions import PermissionDenied
+from django.core.files.uploadhandler import StopUpload
+from django.http import Http404, HttpResponse
+from django.template import TemplateDoesNotExist, engines
+from django.template.response import TemplateResponse
+from django.test import RequestFactory, TestCase
+from django.urls import include, path, reverse
+
+from document_catalogue import metrics, models, plugins, uploads, views
+
+from . import base
+
+
+class MetricTests(TestCase):
+    """
+    Test counters and histograms, and their Prometheus text exposition
+    """
+
+    def test_counter(self):
+        counter = metrics.Counter("test_requests", "Requests", ("method",))
+        counter.inc(method="GET")
+        counter.inc(2, method="GET")
+        self.assertEqual(counter.get(method="GET"), 3)
+        self.assertEqual(
+            counter.expose(),
+            "# HELP test_requests Requests\n"
+            "# TYPE test_requests counter\n"
+            'test_requests_total{method="GET"} 3',
+        )
+        with self.assertRaises(ValueError):
+            counter.inc(status=200)
+
+    def test_histogram(self):
+        histogram = metrics.Histogram("test_seconds", "Latency", buckets=(0.1, 1))
+        histogram.observe(0.05)
+        histogram.observe(0.5)
+        histogram.observe(5)
+        self.assertEqual(histogram.get_count(), 3)
+        self.assertEqual(histogram.get_sum(), 5.55)
+        lines = histogram.expose().splitlines()
+        self.assertEqual(lines[1], "# TYPE test_seconds histogram")
+        self.assertEqual(
+            lines[2:],
+            [
+                'test_seconds_bucket{le="0.1"} 1',
+                'test_seconds_bucket{le="1"} 2',
+                'test_seconds_bucket{le="+Inf"} 3',
+                "test_seconds_sum 5.55",
+                "test_seconds_count 3",
+            ],
+        )
+
+    def test_label_escaping(self):
+        counter = metrics.Counter("test_labels", "Labels", ("name",))
+        counter.inc(name='a "quoted"\\path\n')
+        self.assertIn(
+            r'test_labels_total{name="a \"quoted\"\\path\n"} 1', counter.expose()
+        )
+
+
+class InstrumentationTests(TestCase):
+    """
+    Test catalogue operations are recorded, only when metrics are enabled
+    """
+
+    def setUp(self):
+        super().setUp()
+        metrics.registry.clear()
+        self.categories = base.create_document_categories()
+        self.request = RequestFactory().get("/")
+
+    def test_sync_view(self):
+        def view(request):
+            list(models.DocumentCategory.objects.all())
+            return HttpResponse()
+
+        instrumented = metrics.instrument_view(view, "test_view")
+        self.assertEqual(instrumented.__name__, "view")
+        instrumented(self.request)
+        self.assertEqual(metrics.view_duration.get_count(url_name="test_view"), 1)
+        self.assertEqual(metrics.view_queries.get_sum(url_name="test_view"), 1)
+        self.assertEqual(
+            metrics.view_responses.get(url_name="test_view", status=200), 1
+        )
+
+    def test_lazy_template_response(self):
+        template = engines["django"].from_string(
+            "{% for category in categories %}{{ category.name }}{% endfor %}"
+        )
+
+        def view(request):
+            categories = models.DocumentCategory.objects.all()
+            return TemplateResponse(request, template, {"categories": categories})
+
+        response = metrics.instrument_view(view, "test_view")(self.request)
+        # recorded once rendered, so middleware may still change it
+        self.assertFalse(response.is_rendered)
+        self.assertEqual(metrics.view_duration.get_count(url_name="test_view"), 0)
+        response.context_data["categories"] = models.DocumentCategory.objects.filter(
+            pk=self.categories[0].pk
+        )
+        response = response.render()
+        self.assertEqual(response.content.decode(), self.categories[0].name)
+        self.assertEqual(metrics.view_duration.get_count(url_name="test_view"), 1)
+        self.assertEqual(metrics.view_queries.get_sum(url_name="test_view"), 1)
+        response.render()
+        self.assertEqual(metrics.view_duration.get_count(url_name="test_view"), 1)
+
+    def test_template_response_error(self):
+        def view(request):
+            return TemplateResponse(request, "no-such-template.html")
+
+        response = metrics.instrument_view(view, "test_view")(self.request)
+        with self.assertRaises(TemplateDoesNotExist):
+            response.render()
+        self.assertEqual(
+            metrics.view_responses.get(url_name="test_view", status=500), 1
+        )
+
+    def test_not_found(self):
+        view = metrics.instrument_view(
+            views.CategoryDocumentListView.as_view(), "category_list"
+        )
+        self.request.user = base.create_user()
+        self.request.session = {}
+        with self.assertRaises(Http404):
+            view(self.request, slug="no-such-category")
+        self.assertEqual(
+            metrics.view_responses.get(url_name="category_list", status=404), 1
+        )
+        self.assertEqual(metrics.view_duration.get_count(url_name="category_list"), 1)
+
+    def test_permission_denied(self):
+        document = base.create_document(filename="report.txt")
+        view = metrics.instrument_view(
+            views.DocumentEditView.as_view(), "document_edit"
+        )
+        self.request.user = base.create_user(username="restricted")
+        with self.assertRaises(PermissionDenied):
+            view(self.request, pk=document.pk)
+        document.file.delete()
+        self.assertEqual(
+            metrics.view_responses.get(url_name="document_edit", status=403), 1
+        )
+        self.assertEqual(metrics.view_queries.get_count(url_name="document_edit"), 1)
+
+    def test_server_error(self):
+        def view(request):
+            raise ValueError("broken")
+
+        with self.assertRaises(ValueError):
+            metrics.instrument_view(view, "test_view")(self.request)
+        self.assertEqual(
+            metrics.view_responses.get(url_name="test_view", status=500), 1
+        )
+
+    def test_async_view(self):
+        async def view(request):
+            return HttpResponse(status=204)
+
+        async_to_sync(metrics.instrument_view(view, "test_async"))(self.request)
+        self.assertEqual(metrics.view_duration.get_count(url_name="test_async"), 1)
+        self.assertEqual(
+            metrics.view_responses.get(url_name="test_async", status=204), 1
+        )
+
+    def test_urlpatterns(self):
+        urlpatterns = metrics.instrument_urlpatterns(
+            [
+                path("test/", views.MetricsView.as_view(), name="test_url"),
+                path("", include([])),
+            ]
+        )
+        self.assertTrue(hasattr(urlpatterns[0].callback, "__wrapped__"))
+        self.assertEqual(urlpatterns[0].callback.view_class, views.MetricsView)
+
+    def test_uploads(self):
+        content = b"Hello World" * 100
+        with base.app_settings(METRICS=True):
+            handler = uploads.DocumentUploadHandler()
+            handler.new_file("file", "upload.txt", "text/plain", len(content))
+            handler.receive_data_chunk(content, 0)
+            handler.file_complete(len(content))
+        self.assertEqual(metrics.upload_bytes.get_sum(), len(content))
+        self.assertEqual(metrics.upload_duration.get_count(), 1)
+
+    def test_upload_aborted(self):
+        html = b"<!DOCTYPE html><html><body>%s</body></html>" % (b"x" * 10000)
+        with base.app_settings(METRICS=True), self.assertRaises(StopUpload):
+            handler = uploads.DocumentUploadHandler(check_content_type=True)
+            handler.new_file("file", "upload.html", "text/html", len(html))
+            handler.receive_data_chunk(html, 0)
+        self.assertEqual(metrics.uploads_aborted.get(reason="invalid_content_type"), 1)
+
+    def test_search(self):
+        user = base.create_user()
+        models.Document.objects.create(
+            title="Safety Policy",
+            category=self.categories[1],
+            user=user,
+            is_published=True,
+            file="search-test.txt",
+        )
+        self.client.force_login(user)
+        url = reverse("document_catalogue:api_search")
+        with base.app_settings(METRICS=True):
+            self.client.get(
+                url,
+                {"q": "safety"},
+                HTTP_X_REQUESTED_WITH="XMLHttpRequest",
+            )
+        self.assertEqual(metrics.search_duration.get_count(), 1)
+        self.assertEqual(metrics.search_results.get_sum(), 1)
+
+    def test_download(self):
+        document = base.create_document(filename="report.txt")
+        self.client.force_login(document.user)
+        url = reverse("document_catalogue:document_download", args=[document.pk])
+        with base.app_settings(METRICS=True):
+            self.client.get(url)
+        document.file.delete()
+        self.assertEqual(metrics.downloads.get(server="redirect", status=302), 1)
+
+    def test_disabled(self):
+        handler = uploads.DocumentUploadHandler()
+        handler.new_file("file", "upload.txt", "text/plain", 10)
+        handler.receive_data_chunk(b"x" * 10, 0)
+        handler.file_complete(10)
+        self.assertEqual(metrics.upload_bytes.get_count(), 0)
+
+    def test_plugin_metrics(self):
+        collectors = list(metrics.registry.collectors)
+        try:
+            metrics.enable_plugin_metrics()
+            self.request.session = {}
+            views.CategoryDocumentListView.plugins_extend_qs(
+                self.request, models.Document.objects.all()
+            )
+            exposition = metrics.registry.expose()
+        finally:
+            plugins.ViewPluginManager.disable_plugin_timer()
+            metrics.registry.collectors = collectors
+        calls = {
+            hook: count
+            for (plugin, hook), count in metrics.plugin_calls._values.items()
+        }
+        self.assertEqual(calls["extend_qs"], 1)
+        self.assertIn("document_catalogue_plugin_seconds_total{plugin=", exposition)
+
+
+class MetricsViewTests(TestCase):
+    """
+    Test the metrics are served to staff and to scrapers with the token
+    """
+
+    def get(self, user, **headers):
+        request = RequestFactory().get("/documents/metrics/", **headers)
+        request.user = user
+        return views.MetricsView.as_view()(request)
+
+    def test_disabled(self):
+        with self.assertRaises(Http404):
+            self.get(base.anonymous_user())
+
+    def test_access(self):
+        user = base.create_user()
+        with base.app_settings(METRICS=True, METRICS_TOKEN="secret"):
+            self.assertEqual(self.get(base.anonymous_user()).status_code, 403)
+            self.assertEqual(self.get(user).status_code, 403)
+            response = self.get(
+                base.anonymous_user(), HTTP_AUTHORIZATION="Bearer wrong"
+            )
+            self.assertEqual(response.status_code, 403)
+            response = self.get(
+                base.anonymous_user(), HTTP_AUTHORIZATION="Bearer secret"
+            )
+            self.assertEqual(response.status_code, 200)
+            user.is_staff = True
+            response = self.get(user)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], metrics.CONTENT_TYPE)
+        self.assertIn(
+            "# TYPE document_catalogue_view_duration_seconds histogram",
+            response.content.decode(),
+        )
@@ -1,9 +1,14 @@
+import hashlib
 import os
+import threading
+import time
+from unittest import mock
 
 import django.conf
 from django import forms
-from django.core.files.uploadedfile import UploadedFile
-from django.test import TestCase
+from django.core.files.uploadedfile import SimpleUploadedFile, UploadedFile
+from django.db import IntegrityError, OperationalError, connection
+from django.test import TestCase, TransactionTestCase
 
 from document_catalogue import models
 
@@ -52,6 +57,59 @@ class CategoryTests(TestCase):
                 "Category with no documents returns non-zero get_document_count.",
             )
 
+    def test_with_document_counts(self):
+        user = base.create_user()
+        sub_category = models.DocumentCategory.objects.get(slug="sub-category-1a")
+        for is_published in (True, True, False):
+            base.create_document(
+                user=user, category=sub_category, is_published=is_published
+            )
+        base.create_document(user=user, category=sub_category.parent)
+        counts = {
+            cat.slug: (cat.document_count, cat.cumulative_document_count)
+            for cat in models.DocumentCategory.objects.with_document_counts()
+        }
+        self.assertEqual(counts["sub-category-1a"], (2, 2))
+        self.assertEqual(counts[sub_category.parent.slug], (1, 3))
+        self.assertEqual(counts["sub-category-1b"], (0, 0))
+
+    def test_subtrees(self):
+        top_1, sub_1a, sub_1b, top_2, sub_2a = self.categories
+        categories = models.DocumentCategory.objects
+
+        def slugs(qs):
+            return sorted(category.slug for category in qs)
+
+        self.assertEqual(
+            slugs(categories.in_subtrees([top_1])),
+            slugs([top_1, sub_1a, sub_1b]),
+        )
+        self.assertEqual(
+            slugs(categories.in_subtrees([sub_1a, top_2])),
+            slugs([sub_1a, top_2, sub_2a]),
+        )
+        self.assertEqual(slugs(categories.in_subtrees([])), [])
+        self.assertEqual(
+            slugs(categories.exclude_subtrees([top_1])), slugs([top_2, sub_2a])
+        )
+        self.assertEqual(slugs(categories.exclude_subtrees([])), slugs(self.categories))
+
+    def test_documents_in_category_trees(self):
+        top_1, sub_1a, sub_1b, top_2, sub_2a = self.categories
+        user = base.create_user()
+        documents = {
+            category.slug: base.create_document(
+                filename="%s.txt" % category.slug, user=user, category=category
+            )
+            for category in (sub_1a, sub_2a)
+        }
+        in_trees = models.Document.objects.in_category_trees([top_1])
+        self.assertEqual(list(in_trees), [documents[sub_1a.slug]])
+        excluded = models.Document.objects.exclude_category_trees([top_1])
+        self.assertEqual(list(excluded), [documents[sub_2a.slug]])
+        for document in documents.values():
+            document.file.delete()
+
 
 class DocumentTests(TestCase):
     """
@@ -111,6 +169,277 @@ class DocumentTests(TestCase):
         self.assertIn(base.appConfig.settings.MEDIA_ROOT, self.document.file.path)
 
 
+class ContentAddressedStorageTests(TestCase):
+    """
+    Test identical uploads share one stored file, which is deleted once no document refers to it
+    """
+
+    CONTENT = b"Hello World"  # see base.generate_simple_uploaded_file
+
+    def setUp(self):
+        super().setUp()
+        self.categories = base.create_document_categories()
+        self.user = base.create_user()
+        self.sha256 = hashlib.sha256(self.CONTENT).hexdigest()
+
+    def create_document(self, category, filename="handbook.txt"):
+        return base.create_document(
+            filename=filename, user=self.user, category=category
+        )
+
+    def delete(self, document):
+        with self.captureOnCommitCallbacks(execute=True):
+            document.delete()
+
+    def test_sha256(self):
+        document = self.create_document(self.categories[1])
+        self.assertEqual(document.sha256, self.sha256)
+        self.assertIn(self.categories[1].slug, document.file.name)
+        document.file.delete()
+
+    def test_shared_blob(self):
+        with base.app_settings(CONTENT_ADDRESSED_STORAGE=True):
+            first = self.create_document(self.categories[1])
+            second = self.create_document(self.categories[2], filename="copy.txt")
+            self.assertEqual(first.file.name, second.file.name)
+            self.assertEqual(
+                first.file.name, models.content_address(self.sha256, "handbook.txt")
+            )
+            with second.file.open("rb") as file:
+                self.assertEqual(file.read(), self.CONTENT)
+            self.delete(first)
+            self.assertTrue(second.file.storage.exists(second.file.name))
+            self.delete(second)
+            self.assertFalse(second.file.storage.exists(second.file.name))
+
+    def test_blob_released_during_upload(self):
+        with base.app_settings(CONTENT_ADDRESSED_STORAGE=True):
+            first = self.create_document(self.categories[1])
+            upload = models.Document(
+                title="Copy",
+                category=self.categories[2],
+                user=self.user,
+                file=base.generate_simple_uploaded_file("copy.txt"),
+            )
+            upload.prepare_file()  # matches the first document's blob
+            self.assertEqual(upload.file.name, first.file.name)
+            self.delete(first)  # releases the blob, before the upload is saved
+            self.assertFalse(upload.file.storage.exists(upload.file.name))
+            with self.captureOnCommitCallbacks(execute=True):
+                upload.save()
+            with upload.file.open("rb") as file:
+                self.assertEqual(file.read(), self.CONTENT)
+            self.delete(upload)
+
+    def test_replace_file(self):
+        with base.app_settings(CONTENT_ADDRESSED_STORAGE=True):
+            document = self.create_document(self.categories[1])
+            original = document.file.name
+            document.file = SimpleUploadedFile("other.txt", b"Other content")
+            with self.captureOnCommitCallbacks(execute=True):
+                document.save()
+            self.assertNotEqual(document.file.name, original)
+            self.assertFalse(document.file.storage.exists(original))
+            self.delete(document)
+
+    def rolled_back_upload(self, filename):
+        """Save a new upload whose insert fails, return the unsaved document"""
+        document = models.Document(
+            title="Rolled back",
+            category=self.categories[1],
+            user=self.user,
+            file=base.generate_simple_uploaded_file(filename),
+        )
+        # fails after the insert stored the file
+        with mock.patch.object(
+            models.Document, "keep_shared_blob", side_effect=IntegrityError
+        ):
+            with self.captureOnCommitCallbacks(execute=True):
+                with self.assertRaises(IntegrityError):
+                    document.save()
+        return document
+
+    def test_rolled_back_upload(self):
+        document = self.rolled_back_upload("rolled_back.txt")
+        self.assertIn("rolled_back", document.file.name)
+        self.assertFalse(document.file.storage.exists(document.file.name))
+
+    def test_rolled_back_blob(self):
+        with base.app_settings(CONTENT_ADDRESSED_STORAGE=True):
+            document = self.rolled_back_upload("rolled_back.txt")
+        self.assertTrue(models.is_content_addressed(document.file.name))
+        self.assertFalse(document.file.storage.exists(document.file.name))
+
+    def test_rolled_back_upload_shares_blob(self):
+        with base.app_settings(CONTENT_ADDRESSED_STORAGE=True):
+            first = self.create_document(self.categories[1])
+            document = self.rolled_back_upload("copy.txt")
+            self.assertEqual(document.file.name, first.file.name)
+            self.assertTrue(first.file.storage.exists(first.file.name))
+            self.delete(first)
+
+    def test_files_not_content_addressed(self):
+        document = self.create_document(self.categories[1])
+        with base.app_settings(CONTENT_ADDRESSED_STORAGE=True):
+            self.delete(document)
+        self.assertTrue(document.file.storage.exists(document.file.name))
+        document.file.delete()
+
+
+class SortOrderTests(TestCase):
+    """
+    Test sort_order is allocated per category from the category's sequence
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.categories = base.create_document_categories()
+        self.user = base.create_user()
+        self.documents = []
+
+    def tearDown(self):
+        for document in self.documents:
+            document.file.delete()
+
+    def create_document(self, category, **kwargs):
+        document = base.create_document(
+            filename="doc%s.txt" % len(self.documents),
+            user=self.user,
+            category=category,
+            **kwargs,
+        )
+        self.documents.append(document)
+        return document
+
+    def test_per_category(self):
+        first, second = self.categories[1], self.categories[2]
+        orders = [self.create_document(c).sort_order for c in (first, first, second)]
+        self.assertEqual(orders, [1, 2, 1])
+
+    def test_explicit_sort_order(self):
+        self.assertEqual(
+            self.create_document(self.categories[1], sort_order=42).sort_order, 42
+        )
+
+    def test_start_after_existing_documents(self):
+        category = self.categories[1]
+        self.create_document(
+            category, sort_order=41
+        )  # as for documents that pre-date the sequence
+        models.CategorySortOrder.objects.all().delete()
+        self.assertEqual(self.create_document(category).sort_order, 42)
+
+    def test_moved_document(self):
+        first, second = self.categories[1], self.categories[2]
+        self.create_document(first)
+        moved = self.create_document(second)
+        for _ in range(4):
+            self.create_document(second)
+        self.assertEqual(moved.sort_order, 1)
+        moved.category = first
+        moved.save()
+        self.assertEqual(moved.sort_order, 2)
+        start = models.CategorySortOrder.allocate(
+            first.pk, count=4
+        )  # as for a batch upload
+        self.assertEqual(start, 3)
+        self.create_document(first)
+        orders = list(first.document_set.values_list("sort_order", flat=True))
+        self.assertEqual(orders, [1, 2, 7])
+        moved.title = "Edited"
+        moved.save()  # not moved, keeps its place
+        self.assertEqual(moved.sort_order, 2)
+
+    def test_allocate_block(self):
+        category = self.categories[1]
+        self.assertEqual(models.CategorySortOrder.allocate(category.pk, count=10), 1)
+        self.assertEqual(models.CategorySortOrder.allocate(category.pk), 11)
+
+    def test_constant_queries(self):
+        category = self.categories[1]
+        self.create_document(category)
+        # independent of the number of documents:  savepoint, increment and read the sequence, release
+        with self.assertNumQueries(4):
+            models.CategorySortOrder.allocate(category.pk)
+
+
+class ConcurrentSortOrderTests(TransactionTestCase):
+    """
+    Test concurrent allocations in the same category never share a sort_order
+    Backend dependent:  SQLite allows one writer at a time, so there this only shows that serialized writes don't
+        share a sort_order - the row lock taken by allocate's UPDATE is only contended on databases with
+        concurrent writers, e.g., PostgreSQL.
+    """
+
+    THREADS = 8
+    ATTEMPTS = 50  # SQLite allows one writer at a time:  others retry, backing off, until they get the lock
+
+    def setUp(self):
+        super().setUp()
+        self.category = base.create_document_categories()[1]
+
+    def retry(self, fn):
+        for attempt in range(self.ATTEMPTS):
+            try:
+                return fn()
+            except OperationalError:  # SQLite:  database is locked by another writer
+                time.sleep(0.005 * (attempt + 1))
+        raise AssertionError("Still locked after %s attempts" % self.ATTEMPTS)
+
+    def run_concurrently(self, fn):
+        """Run fn in THREADS threads at once, return their results - fail if any thread fails"""
+        barrier = threading.Barrier(self.THREADS)
+        results, errors = [], []
+
+        def worker():
+            try:
+                barrier.wait()
+                results.append(self.retry(fn))
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if errors:
+            self.fail(errors)
+        return results
+
+    def test_concurrent_allocate(self):
+        allocated = self.run_concurrently(
+            lambda: models.CategorySortOrder.allocate(self.category.pk)
+        )
+        self.assertEqual(sorted(allocated), list(range(1, self.THREADS + 1)))
+
+    def test_concurrent_save(self):
+        user = base.create_user()
+
+        def save_document():
+            document = models.Document(
+                title="Concurrent",
+                category=self.category,
+                user=user,
+                file="concurrent.txt",
+            )
+            document.save()
+            return document.sort_order
+
+        allocated = self.run_concurrently(save_document)
+        self.assertEqual(sorted(allocated), list(range(1, self.THREADS + 1)))
+        self.assertEqual(
+            sorted(
+                models.Document.objects.filter(category=self.category).values_list(
+                    "sort_order", flat=True
+                )
+            ),
+            list(range(1, self.THREADS + 1)),
+        )
+
+
 class ConstrainedfileFieldTests(TestCase):
     """
     A few basic tests for common validation in both PrivateFileField and ConstrainedFileField
@@ -1,3 +1,5 @@
+from unittest import mock
+
 from django.test import TestCase
 
 from document_catalogue import plugins
@@ -109,6 +111,94 @@ class ViewPluginTests(TestCase):
         ctx = self.plugin_manager.plugins_get_context(None)
         self.assertTrue("plugin_context" in ctx)
 
+    def test_default_hooks_skipped(self):
+        class ContextPlugin(plugins.AbstractViewPlugin):
+            def get_context(self, request):
+                return {"context_plugin": True}
+
+        @plugins.RegisterPlugins(ContextPlugin(), self.TestViewPlugin())
+        class Subclass(self.TestViewPluginManager):
+            pass
+
+        self.assertEqual(len(Subclass.get_plugin_hooks("apply")), 1)
+        self.assertEqual(len(Subclass.get_plugin_hooks("extend_qs")), 1)
+        self.assertEqual(len(Subclass.get_plugin_hooks("get_context")), 2)
+
+    def test_compiled_at_registration(self):
+        @plugins.RegisterPlugins(self.TestViewPlugin())
+        class Subclass(self.TestViewPluginManager):
+            pass
+
+        class Inheriting(Subclass):
+            pass
+
+        compiled = Subclass._compiled_hooks
+        self.assertEqual(len(compiled[1]["extend_qs"]), 1)
+
+        @plugins.RegisterPlugins(self.TestViewPlugin())
+        class Other(self.TestViewPluginManager):
+            pass
+
+        # registration elsewhere doesn't re-compile this class's hooks
+        with mock.patch.object(Subclass, "compile_plugin_hooks") as compile_hooks:
+            Subclass.plugins_extend_qs(None, 0)
+        compile_hooks.assert_not_called()
+        self.assertIs(Subclass._compiled_hooks, compiled)
+        # sub-classes that inherit the plugins are re-compiled with them
+        Subclass.add_plugins([self.TestViewPlugin()])
+        self.assertEqual(len(Inheriting.get_plugin_hooks("extend_qs")), 2)
+
+    def test_attribute_error_raised(self):
+        class BrokenPlugin(plugins.AbstractViewPlugin):
+            def extend_qs(self, request, qs):
+                return qs.no_such_method()
+
+        @plugins.RegisterPlugins(BrokenPlugin())
+        class Subclass(self.TestViewPluginManager):
+            pass
+
+        with self.assertRaises(AttributeError):
+            Subclass.plugins_extend_qs(None, 0)
+
+    def test_plugin_timer(self):
+        manager = type(self.plugin_manager)
+        timer = manager.enable_plugin_timer()
+        try:
+            request = base.null_object()
+            request.count = 0
+            manager.plugins_apply(request)
+            self.assertEqual(manager.plugins_extend_qs(request, 0), 20)
+        finally:
+            manager.disable_plugin_timer()
+        counters = timer.get_counters()
+        name = timer.plugin_name(self.TestViewPlugin())
+        self.assertEqual(counters[(name, "apply")][0], 2)
+        self.assertEqual(counters[(name, "extend_qs")][0], 2)
+        self.assertGreaterEqual(counters[(name, "extend_qs")][1], 0)
+        self.assertEqual(counters[(name, "get_context")], (0, 0.0))
+        # hooks are re-compiled without the timer
+        manager.plugins_apply(request)
+        self.assertEqual(timer.get_counters()[(name, "apply")][0], 2)
+
+    def test_cache_key(self):
+        class KeyedPlugin(self.TestViewPlugin):
+            def get_cache_key(self, request):
+                return request.key
+
+        @plugins.RegisterPlugins(KeyedPlugin(), plugins.AbstractViewPlugin())
+        class Subclass(self.TestViewPluginManager):
+            pass
+
+        request = base.null_object()
+        request.key = "a"
+        self.assertEqual(Subclass.plugins_get_cache_key(request), ("a",))
+        request.key = "b"
+        self.assertEqual(Subclass.plugins_get_cache_key(request), ("b",))
+
+    def test_cache_key_required(self):
+        # TestViewPlugin changes the queryset and context, but supplies no cache key
+        self.assertIsNone(self.plugin_manager.plugins_get_cache_key(None))
+
 
 class OrderedViewPluginTestBase(TestCase):
     """
@@ -156,6 +246,10 @@ class OrderedViewPluginTests(OrderedViewPluginTestBase):
         qs = self.plugin_manager.plugins_extend_qs(self.request, self.qs)
         self.assertEqual(qs.ordering, self.ORDER_EXPERSSION)
 
+    def test_cache_key(self):
+        key = self.plugin_manager.plugins_get_cache_key(self.request)
+        self.assertEqual(key, (self.ORDER_FIELD,))
+
     def test_get_context(self):
         ctx = self.plugin_manager.plugins_get_context(self.request)
         self.assertTrue(self.ORDER_KEY in ctx)
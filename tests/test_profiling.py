@@ -0,0 +1,109 @@
+import marshal
+import os
+import tempfile
+
+from django.template import TemplateDoesNotExist
+from django.test import RequestFactory, TestCase
+from django.urls import path
+
+from document_catalogue import profiling, views
+
+from . import base
+
+
+class ProfilingTests(TestCase):
+    """
+    Test staff users can profile catalogue views on demand
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.categories = base.create_document_categories()
+        self.document = base.create_document(
+            filename="report.txt", category=self.categories[1]
+        )
+        self.user = self.document.user
+        self.user.is_staff = True
+        self.view = profiling.profile_view(
+            views.CategoryDocumentListView.as_view(), "category_list"
+        )
+
+    def tearDown(self):
+        self.document.file.delete()
+        super().tearDown()
+
+    def get(self, path="/", **headers):
+        request = RequestFactory().get(path, **headers)
+        request.user = self.user
+        request.session = {}
+        response = self.view(request, slug=self.categories[1].slug)
+        # rendered as Django renders template responses, after middleware
+        return response.render() if hasattr(response, "render") else response
+
+    def test_not_profiled(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.template_name[0], views.CategoryDocumentListView.template_name
+        )
+        self.user.is_staff = False
+        response = self.get("/?profile=1")
+        self.assertFalse(response["Content-Type"].startswith("text/plain"))
+
+    def test_report(self):
+        response = self.get("/?profile=1")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "text/plain; charset=utf-8")
+        report = response.content.decode()
+        self.assertTrue(
+            report.startswith("Profile of GET /?profile=1  (category_list)")
+        )
+        self.assertIn("Status: 200", report)
+        self.assertIn("SELECT", report)
+        self.assertIn("cumulative", report)
+        # the template response was rendered under the profiler
+        self.assertIn("(rendered_content)", report)
+
+    def test_rendered_after_middleware(self):
+        request = RequestFactory().get("/?profile=1")
+        request.user = self.user
+        request.session = {}
+        response = self.view(request, slug=self.categories[1].slug)
+        self.assertFalse(response.is_rendered)  # middleware may still change it
+        response.template_name = "no-such-template.html"
+        with self.assertRaises(TemplateDoesNotExist):
+            response.render()
+
+    def test_header(self):
+        response = self.get(HTTP_X_CATALOGUE_PROFILE="1")
+        self.assertTrue(response.content.startswith(b"Profile of GET /"))
+
+    def test_pstats(self):
+        response = self.get("/?profile=pstats")
+        self.assertEqual(
+            response["Content-Disposition"], 'attachment; filename="category_list.prof"'
+        )
+        stats = marshal.loads(response.content)
+        self.assertTrue(any(func[2] == "get_queryset" for func in stats))
+
+    def test_save(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with base.app_settings(PROFILING_DIR=directory):
+                self.get("/?profile=1")
+            (filename,) = os.listdir(directory)
+        self.assertTrue(filename.startswith("category_list-"))
+        self.assertTrue(filename.endswith(".prof"))
+
+    def test_urlpatterns(self):
+        async def async_view(request):
+            pass  # pragma: no cover
+
+        sync_view = views.DocumentDetailView.as_view()
+        urlpatterns = profiling.profile_urlpatterns(
+            [
+                path("sync/", sync_view, name="sync"),
+                path("async/", async_view, name="async"),
+            ]
+        )
+        self.assertIs(urlpatterns[0].callback.__wrapped__, sync_view)
+        self.assertIs(urlpatterns[1].callback, async_view)
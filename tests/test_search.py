@@ -0,0 +1,354 @@
+import asyncio
+import json
+import threading
+from unittest import mock
+from urllib.parse import urlencode
+
+from asgiref.sync import async_to_sync
+from django.core.exceptions import PermissionDenied
+from django.db import connection
+from django.db.models import FloatField
+from django.db.models.expressions import RawSQL
+from django.test import AsyncRequestFactory, TestCase, TransactionTestCase
+from django.urls import reverse
+
+from document_catalogue import models, search, views
+
+from . import base
+
+
+class SearchTestBase(TestCase):
+    """
+    Fixtures for search backend tests
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.categories = base.create_document_categories()
+        self.user = base.create_user()
+        self.policy = self.create_document(
+            "Safety Policy", "Rules for the workshop", self.categories[1]
+        )
+        self.budget = self.create_document(
+            "Annual Budget", "Includes safety equipment", self.categories[2]
+        )
+        self.minutes = self.create_document("Meeting Minutes", "", self.categories[4])
+
+    def create_document(self, title, description, category, is_published=True):
+        return models.Document.objects.create(
+            title=title,
+            description=description,
+            category=category,
+            user=self.user,
+            is_published=is_published,
+            file="search-test.txt",
+        )
+
+    def search(self, term, backend=None):
+        backend = backend or search.get_search_backend()
+        results = backend.search(models.Document.published.all(), term)
+        return list(results.order_by("-search_rank", "sort_order"))
+
+
+class FullTextSearchTests(SearchTestBase):
+    """
+    Test the default full-text search backend (SQLite FTS5 or PostgreSQL, depending on test database)
+    """
+
+    def setUp(self):
+        super().setUp()
+        if not isinstance(
+            search.get_search_backend(), search.FULL_TEXT_BACKENDS
+        ):  # pragma: no cover
+            self.skipTest("No full-text search available for %s" % connection.vendor)
+
+    def test_search_title(self):
+        self.assertEqual(self.search("minutes"), [self.minutes])
+
+    def test_search_prefix(self):
+        self.assertEqual(self.search("minu"), [self.minutes])
+
+    def test_search_all_words(self):
+        self.assertEqual(self.search("annual safety"), [self.budget])
+
+    def test_search_category_name(self):
+        self.assertEqual(self.search("sub category 2a"), [self.minutes])
+
+    def test_search_ranking(self):
+        # title match ranks above description match
+        self.assertEqual(self.search("safety"), [self.policy, self.budget])
+
+    def test_search_punctuation(self):
+        self.assertEqual(self.search('"minutes*'), [self.minutes])
+        self.assertEqual(self.search("!!"), [])
+
+    def test_unpublished(self):
+        self.create_document("Draft Minutes", "", self.categories[0], False)
+        self.assertEqual(self.search("minutes"), [self.minutes])
+
+    def test_update_document(self):
+        self.minutes.title = "Board Report"
+        self.minutes.save()
+        self.assertEqual(self.search("minutes"), [])
+        self.assertEqual(self.search("board"), [self.minutes])
+
+    def test_rename_category(self):
+        category = self.categories[4]
+        category.name = "Governance"
+        category.save()
+        self.assertEqual(self.search("governance"), [self.minutes])
+
+    def test_delete_document(self):
+        self.minutes.delete()
+        self.assertEqual(self.search("minutes"), [])
+
+    def test_rebuild(self):
+        backend = search.get_search_backend()
+        models.Document.objects.filter(pk=self.minutes.pk).update(title="Bulk Update")
+        backend.rebuild()
+        self.assertEqual(self.search("bulk"), [self.minutes])
+
+
+class IContainsSearchTests(SearchTestBase):
+    """
+    Test the fallback icontains search backend
+    """
+
+    def test_search(self):
+        backend = search.IContainsSearchBackend()
+        self.assertEqual(self.search("INUT", backend), [self.minutes])
+        self.assertEqual(self.search("sub-category-2", backend), [])
+        self.assertEqual(self.search("Sub-Category 2A", backend), [self.minutes])
+
+
+class PaginateTests(SearchTestBase):
+    """
+    Test search results are grouped by category and paged with cursors
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.notices = [
+            self.create_document("Safety Notice %s" % i, "", self.categories[0])
+            for i in range(3)
+        ]
+
+    def paginate(self, term, **kwargs):
+        results = search.get_search_backend().search(
+            models.Document.published.all(), term
+        )
+        return search.paginate(results, term, **kwargs)
+
+    def pks(self, groups):
+        return [result.pk for group in groups for result in group.results]
+
+    def test_grouped(self):
+        groups, cursor = self.paginate("safety")
+        self.assertIsNone(cursor)
+        self.assertEqual(
+            sorted((g.name, g.total, len(g.results)) for g in groups),
+            [
+                ("Sub-Category 1A", 1, 1),
+                ("Sub-Category 1B", 1, 1),
+                ("Top Level Category 1", 3, 3),
+            ],
+        )
+        self.assertEqual(
+            set(self.pks(groups)),
+            {d.pk for d in self.notices + [self.policy, self.budget]},
+        )
+
+    def test_per_category(self):
+        groups, cursor = self.paginate("safety", per_category=2)
+        group = next(g for g in groups if g.category_id == self.categories[0].pk)
+        self.assertEqual(group.total, 3)
+        self.assertEqual(len(group.results), 2)
+        self.assertEqual(len(self.pks(groups)), 4)
+
+    def test_paginate(self):
+        expected = self.pks(self.paginate("safety")[0])
+        pages, cursor = [], None
+        while True:
+            groups, cursor = self.paginate("safety", cursor=cursor, limit=2)
+            pages.append(self.pks(groups))
+            if not cursor:
+                break
+        self.assertEqual([len(page) for page in pages], [2, 2, 1])
+        self.assertEqual([pk for page in pages for pk in page], expected)
+
+    def test_inexact_rank(self):
+        # a rank that can't be represented exactly, e.g. a single precision real on PostgreSQL
+        results = models.Document.published.filter(title__icontains="notice").annotate(
+            search_rank=RawSQL("CAST(1 AS REAL) / 3", (), output_field=FloatField())
+        )
+        pages, cursor = [], None
+        while True:
+            groups, cursor = search.paginate(results, "notice", cursor=cursor, limit=2)
+            pages.append(self.pks(groups))
+            if not cursor:
+                break
+        self.assertEqual(
+            pages, [[n.pk for n in self.notices[:2]], [self.notices[2].pk]]
+        )
+
+    def test_grouped_in_python(self):
+        """databases grouped_results_sql isn't written for group the same results in python"""
+        for backend in (search.get_search_backend(), search.IContainsSearchBackend()):
+            results = backend.search(models.Document.published.all(), "safety")
+            pages = {}
+            for vendors in (search.GROUPED_SQL_VENDORS, ()):
+                pages[vendors], cursor = [], None
+                with mock.patch.object(search, "GROUPED_SQL_VENDORS", vendors):
+                    while True:
+                        groups, cursor = search.paginate(
+                            results, "safety", cursor=cursor, limit=2, per_category=2
+                        )
+                        pages[vendors].append(groups)
+                        if not cursor:
+                            break
+            self.assertEqual(pages[()], pages[search.GROUPED_SQL_VENDORS])
+            self.assertGreater(len(pages[()]), 1)
+        with mock.patch.object(search, "GROUPED_SQL_VENDORS", ()):
+            self.assertFalse(search.groups_in_database(connection))
+
+    def test_last_page(self):
+        groups, cursor = self.paginate("safety", limit=5)
+        self.assertEqual(len(self.pks(groups)), 5)
+        self.assertIsNone(cursor)
+
+    def test_page_size(self):
+        max_size = search.appConfig.settings.SEARCH_MAX_PAGE_SIZE
+        self.assertEqual(
+            search.page_size(None), search.appConfig.settings.SEARCH_PAGE_SIZE
+        )
+        self.assertEqual(search.page_size("junk"), search.page_size(None))
+        self.assertEqual(search.page_size("3"), 3)
+        self.assertEqual(search.page_size(0), 1)
+        self.assertEqual(search.page_size(max_size + 1), max_size)
+
+    def test_invalid_cursor(self):
+        groups, cursor = self.paginate("safety", limit=1)
+        with self.assertRaises(search.InvalidCursor):
+            self.paginate("safety", cursor=cursor + "x")
+        with self.assertRaises(search.InvalidCursor):
+            self.paginate("notice", cursor=cursor)
+
+
+class SearchApiTests(SearchTestBase):
+    """
+    Test the search API uses the search backend
+    """
+
+    def api_search(self, **params):
+        self.client.force_login(self.user)
+        return self.client.get(
+            reverse("document_catalogue:api_search"),
+            params,
+            HTTP_X_REQUESTED_WITH="XMLHttpRequest",
+        )
+
+    def test_api_search(self):
+        response = self.api_search(q="safety")
+        self.assertEqual(response.status_code, 200)
+        titles = [
+            child["text"]
+            for option in response.json()["options"]
+            for child in option["children"]
+        ]
+        self.assertIn("Safety Policy", titles)
+        self.assertIn("Annual Budget", titles)
+        self.assertEqual([o["total"] for o in response.json()["options"]], [1, 1])
+
+    def test_api_search_pages(self):
+        response = self.api_search(q="safety", limit=1)
+        pagination = response.json()["pagination"]
+        self.assertTrue(pagination["more"])
+        response = self.api_search(q="safety", limit=1, cursor=pagination["cursor"])
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data["options"][0]["children"][0]["text"], "Annual Budget")
+        self.assertEqual(data["pagination"], {"more": False, "cursor": None})
+
+    def test_api_search_invalid_cursor(self):
+        response = self.api_search(q="safety", cursor="not-a-cursor")
+        self.assertEqual(response.status_code, 400)
+
+
+class AsyncSearchApiTests(SearchApiTests):
+    """
+    Test the async search API answers as the search API does
+    """
+
+    def setUp(self):
+        super().setUp()
+        # the test's data is only visible on the test thread's connection, in the test's transaction
+        patcher = mock.patch.object(
+            views.DocumentAsyncSearchAPI, "thread_sensitive", True
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def request(self, user, ajax=True, **params):
+        request = AsyncRequestFactory().get("/?" + urlencode(params))
+        if ajax:
+            request.META["HTTP_X_REQUESTED_WITH"] = "XMLHttpRequest"
+        request.user = user
+        view = views.DocumentAsyncSearchAPI.as_view()
+        self.assertTrue(asyncio.iscoroutinefunction(view))
+        return async_to_sync(view)(request)
+
+    def api_search(self, **params):
+        response = self.request(self.user, **params)
+        response.json = lambda: json.loads(response.content)
+        return response
+
+    def test_permission_denied(self):
+        with self.assertRaises(PermissionDenied):
+            self.request(base.anonymous_user(), q="safety")
+
+    def test_ajax_only(self):
+        self.assertEqual(
+            self.request(self.user, ajax=False, q="safety").status_code, 405
+        )
+
+
+class ParallelAsyncSearchTests(TransactionTestCase):
+    """
+    Test async searches run in parallel, each in a worker thread with its own connection
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.user = base.create_user()
+        models.Document.objects.create(
+            title="Safety Policy",
+            category=base.create_document_categories()[1],
+            user=self.user,
+            is_published=True,
+            file="search-test.txt",
+        )
+
+    def test_parallel(self):
+        barrier = threading.Barrier(
+            2, timeout=5
+        )  # broken unless both searches run at once
+        search = views.DocumentAsyncSearchAPI.search
+
+        def parallel_search(view, request):
+            barrier.wait()
+            return search(view, request)
+
+        async def search_twice():
+            requests = []
+            for _ in range(2):
+                request = AsyncRequestFactory().get("/?q=safety")
+                request.META["HTTP_X_REQUESTED_WITH"] = "XMLHttpRequest"
+                request.user = self.user
+                requests.append(views.DocumentAsyncSearchAPI.as_view()(request))
+            return await asyncio.gather(*requests)
+
+        with mock.patch.object(views.DocumentAsyncSearchAPI, "search", parallel_search):
+            responses = async_to_sync(search_twice)()
+        for response in responses:
+            options = json.loads(response.content)["options"]
+            self.assertEqual(options[0]["children"][0]["text"], "Safety Policy")
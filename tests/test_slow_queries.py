@@ -0,0 +1,115 @@
+from unittest import mock
+
+from django.db import connection
+from django.template import engines
+from django.template.response import TemplateResponse
+from django.test import RequestFactory, TestCase
+from django.urls import path
+
+from document_catalogue import models, plugins, slow_queries, views
+
+from . import base
+
+
+class SlowQueryTests(TestCase):
+    """
+    Test slow queries made by catalogue views are logged, with their EXPLAIN plan and origin
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.categories = base.create_document_categories()
+        self.document = base.create_document(
+            filename="report.txt", category=self.categories[1]
+        )
+        self.user = self.document.user
+
+    def tearDown(self):
+        self.document.file.delete()
+        super().tearDown()
+
+    def get(self, view, threshold=0, **kwargs):
+        request = RequestFactory().get("/")
+        request.user = self.user
+        request.session = {}
+        view = slow_queries.log_slow_queries(view, "test_view")
+        with base.app_settings(SLOW_QUERY_THRESHOLD=threshold):
+            response = view(request, **kwargs)
+            response.render()
+        return response
+
+    def test_view(self):
+        with self.assertLogs(slow_queries.logger, "WARNING") as logs:
+            response = self.get(
+                views.CategoryDocumentListView.as_view(), slug=self.categories[1].slug
+            )
+        self.assertEqual(response.status_code, 200)
+        record = logs.records[0]
+        self.assertEqual(record.url_name, "test_view")
+        self.assertTrue(record.sql.startswith("SELECT"))
+        self.assertTrue(record.origin.startswith("document_catalogue/"))
+        self.assertTrue(record.plan)
+        self.assertNotIn("EXPLAIN failed", record.plan)
+        self.assertIn("EXPLAIN:\n%s" % record.plan, record.getMessage())
+
+    def test_threshold(self):
+        with mock.patch.object(slow_queries.logger, "warning") as warning:
+            self.get(
+                views.CategoryDocumentListView.as_view(),
+                threshold=60,
+                slug=self.categories[1].slug,
+            )
+        warning.assert_not_called()
+
+    def test_template_response(self):
+        template = engines["django"].from_string(
+            "{% for category in categories %}{{ category.name }}{% endfor %}"
+        )
+
+        def view(request):
+            categories = models.DocumentCategory.objects.filter(name__icontains="1")
+            return TemplateResponse(request, template, {"categories": categories})
+
+        with self.assertLogs(slow_queries.logger, "WARNING") as logs:
+            response = self.get(view)
+        self.assertIn(self.categories[0].name, response.content.decode())
+        self.assertEqual(len(logs.records), 1)
+        self.assertIn("LIKE", logs.records[0].sql)
+
+    def test_plugin(self):
+        class QueryPlugin(plugins.AbstractViewPlugin):
+            def extend_qs(self, request, qs):
+                return list(qs)
+
+        query_logger = slow_queries.SlowQueryLogger("test_view", 0)
+        with self.assertLogs(slow_queries.logger, "WARNING") as logs:
+            with connection.execute_wrapper(query_logger):
+                QueryPlugin().extend_qs(None, models.Document.objects.all())
+        record = logs.records[0]
+        self.assertEqual(record.plugin, plugins.PluginTimer.plugin_name(QueryPlugin()))
+
+    def test_explain(self):
+        query_logger = slow_queries.SlowQueryLogger("test_view", 0)
+        self.assertEqual(
+            query_logger.explain("INSERT INTO x VALUES (1)", (), False, connection),
+            "(not explained)",
+        )
+        self.assertIn(
+            "EXPLAIN failed",
+            query_logger.explain("SELECT * FROM no_such_table", (), False, connection),
+        )
+        self.assertFalse(query_logger.explaining)
+
+    def test_urlpatterns(self):
+        async def async_view(request):
+            pass  # pragma: no cover
+
+        sync_view = views.DocumentDetailView.as_view()
+        urlpatterns = slow_queries.log_urlpatterns(
+            [
+                path("sync/", sync_view, name="sync"),
+                path("async/", async_view, name="async"),
+            ]
+        )
+        self.assertIs(urlpatterns[0].callback.__wrapped__, sync_view)
+        self.assertIs(urlpatterns[1].callback, async_view)
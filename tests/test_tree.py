@@ -0,0 +1,137 @@
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from document_catalogue import models, tree
+
+from . import base
+
+
+class CategoryTreeTests(TestCase):
+    """
+    Test the cached category tree snapshot
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.categories = base.create_document_categories()
+
+    def slugs(self, nodes):
+        return [node.slug for node in nodes]
+
+    def test_snapshot(self):
+        category_tree = tree.get_category_tree()
+        for category in models.DocumentCategory.objects.all():
+            node = category_tree.get(category.slug)
+            self.assertEqual(node.pk, category.pk)
+            self.assertEqual(
+                self.slugs(category_tree.get_ancestors(node)),
+                self.slugs(category.get_ancestors()),
+            )
+            self.assertEqual(
+                self.slugs(category_tree.get_descendants(node)),
+                self.slugs(category.get_descendants()),
+            )
+        self.assertIsNone(category_tree.get("no-such-category"))
+
+    def test_cached(self):
+        tree.get_category_tree()
+        with self.assertNumQueries(0):
+            tree.get_category_tree()
+        tree._memo = (None, None)  # as for another process sharing the cache
+        with self.assertNumQueries(0):
+            tree.get_category_tree()
+
+    def test_nodes_copied(self):
+        node = tree.get_category_tree().get("sub-category-1a")
+        node.name = "Changed"
+        self.assertNotEqual(tree.get_category_tree().get(node.slug).name, "Changed")
+
+    def test_restrict(self):
+        top_1, sub_1a, sub_1b, top_2, sub_2a = self.categories
+        category_tree = tree.get_category_tree()
+        restricted = category_tree.restrict(
+            {top_1.pk, sub_1b.pk, sub_2a.pk}, {top_1.pk: 1, sub_1b.pk: 2}
+        )
+        # sub_2a is omitted with its parent
+        self.assertEqual(self.slugs(restricted.all()), self.slugs([top_1, sub_1b]))
+        node = restricted.get(top_1.slug)
+        self.assertEqual((node.document_count, node.cumulative_document_count), (1, 3))
+        self.assertEqual(self.slugs(restricted.get_descendants(node)), [sub_1b.slug])
+        self.assertEqual(category_tree.get(top_1.slug).cumulative_document_count, 0)
+        self.assertEqual(
+            self.slugs(category_tree.restrict().all()), self.slugs(category_tree.all())
+        )
+
+    def test_invalidate_on_save(self):
+        category = self.categories[1]
+        tree.get_category_tree()
+        category.name = "Renamed"
+        category.save()
+        self.assertEqual(tree.get_category_tree().get(category.slug).name, "Renamed")
+
+    def test_invalidate_on_move(self):
+        category = models.DocumentCategory.objects.get(slug="sub-category-1a")
+        target = self.categories[-1]
+        tree.get_category_tree()
+        category.move_to(target)
+        node = tree.get_category_tree().get(category.slug)
+        self.assertEqual(
+            self.slugs(tree.get_category_tree().get_ancestors(node)),
+            self.slugs(target.get_ancestors(include_self=True)),
+        )
+
+    def test_invalidate_on_delete(self):
+        category = self.categories[1]
+        tree.get_category_tree()
+        category.delete()
+        self.assertIsNone(tree.get_category_tree().get(category.slug))
+
+    def test_invalidate_on_document(self):
+        category = self.categories[1]
+        self.assertEqual(
+            tree.get_category_tree().get(category.slug).cumulative_document_count, 0
+        )
+        document = base.create_document(category=category)
+        self.assertEqual(
+            tree.get_category_tree().get(category.slug).cumulative_document_count, 1
+        )
+        document.file.delete()
+
+
+class CategoryTreeViewTests(TestCase):
+    """
+    Test catalogue views navigate the cached category tree
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.categories = base.create_document_categories()
+        self.user = base.create_user()
+        self.client.force_login(self.user)
+
+    def test_category_list_no_tree_queries(self):
+        url = reverse(
+            "document_catalogue:category_list", kwargs={"slug": "sub-category-1a"}
+        )
+        self.client.get(url)  # warm the cache
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [
+                q
+                for q in queries
+                if 'FROM "document_catalogue_documentcategory"' in q["sql"]
+            ],
+            [],
+        )
+        self.assertEqual(
+            [c.slug for c in response.context["category_ancestors"]],
+            [self.categories[0].slug],
+        )
+
+    def test_category_not_found(self):
+        url = reverse("document_catalogue:category_list", kwargs={"slug": "no-such"})
+        self.assertEqual(self.client.get(url).status_code, 404)
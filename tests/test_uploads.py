@@ -0,0 +1,506 @@
+import hashlib
+import uuid
+from contextlib import contextmanager
+from unittest import mock
+
+import django.conf
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files.uploadhandler import StopUpload
+from django.db import DatabaseError, connection
+from django.test import Client, RequestFactory, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from document_catalogue import forms, models, search, tree, uploads, views
+
+from . import base
+
+
+class UploadHandlerTests(TestCase):
+    """
+    Test uploads are measured in a single pass, as they stream in
+    """
+
+    CONTENT = b"Hello World" * 1000
+
+    def upload(self, content=CONTENT, name="measured.txt", chunk_size=1000):
+        handler = uploads.DocumentUploadHandler()
+        handler.new_file("file", name, "text/plain", len(content))
+        for start in range(0, len(content), chunk_size):
+            handler.receive_data_chunk(content[start : start + chunk_size], start)
+        return handler.file_complete(len(content))
+
+    def test_measured(self):
+        with base.app_settings(SNIFF_UPLOAD_CONTENT_TYPE=True):
+            file = self.upload()
+        self.assertTrue(uploads.is_measured(file))
+        self.assertEqual(file.sha256, hashlib.sha256(self.CONTENT).hexdigest())
+        self.assertEqual(file.size, len(self.CONTENT))
+        self.assertEqual(file.sniffed_content_type, "text/plain")
+        self.assertEqual(file.read(), self.CONTENT)
+        file.close()
+
+    def test_not_measured(self):
+        self.assertFalse(uploads.is_measured(SimpleUploadedFile("a.txt", b"a")))
+
+    def test_validate(self):
+        file = self.upload()
+        uploads.validate_measured_file(file)
+        file.content_type = file.sniffed_content_type = "text/html"
+        with self.assertRaises(ValidationError):
+            uploads.validate_measured_file(file)
+        file.close()
+
+    def test_validate_size(self):
+        file = self.upload()
+        file.size = uploads.get_max_upload_size() + 1
+        with self.assertRaises(ValidationError):
+            uploads.validate_measured_file(file)
+        file.close()
+
+    def test_form(self):
+        file = self.upload()
+        file.content_type = file.sniffed_content_type = "text/html"
+        form = forms.DocumentUploadForm(files={"file": file})
+        self.assertFalse(form.is_valid())
+        self.assertIn("Unsupported file type: text/html", form.errors["file"][0])
+        file.close()
+
+    def test_sniff_length(self):
+        field = models.Document._meta.get_field("file")
+        self.assertEqual(
+            uploads.UploadMeter().sniff_length,
+            getattr(field, "mime_lookup_length", uploads.SNIFF_LENGTH),
+        )
+
+    def post(self, name, content, content_type="text/plain"):
+        if not models.DocumentCategory.objects.exists():
+            base.create_document_categories()
+            self.client.force_login(base.create_user(permissions=("Can add document",)))
+        category = models.DocumentCategory.objects.first()
+        url = reverse("document_catalogue:api_post", kwargs={"slug": category.slug})
+        upload = SimpleUploadedFile(name, content, content_type=content_type)
+        return self.client.post(url, {"file": upload})
+
+    def test_declared_content_type(self):
+        """private-storage validates the content type declared by the client, unless uploads are sniffed"""
+        if not base.appConfig.settings.USE_PRIVATE_FILES:
+            self.skipTest("public files are always sniffed")
+        response = self.post("data.csv", b"name,size\nreport,10\nsummary,20\n")
+        self.assertEqual(response.status_code, 200)
+        models.Document.objects.get().file.delete()
+        self.assertEqual(self.post("data.csv", b"x", "text/csv").status_code, 403)
+
+    def test_sniffed_content_type(self):
+        with base.app_settings(SNIFF_UPLOAD_CONTENT_TYPE=True):
+            response = self.post("page.html", b"<!DOCTYPE html><html></html>")
+        self.assertEqual(response.status_code, 403)
+        self.assertIn(b"Unsupported file type: text/html", response.content)
+
+    def test_form_upload_error(self):
+        error = ValidationError("Upload aborted")
+        form = forms.DocumentUploadForm(files={}, upload_error=error)
+        self.assertFalse(form.is_valid())
+        self.assertEqual(form.errors["file"], ["Upload aborted"])
+
+    def test_view(self):
+        categories = base.create_document_categories()
+        user = base.create_user(permissions=("Can add document",))
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(user)
+        url = reverse(
+            "document_catalogue:api_post", kwargs={"slug": categories[1].slug}
+        )
+        upload = SimpleUploadedFile("measured.txt", self.CONTENT)
+        # the view checks the csrf token itself, after installing the upload handler
+        self.assertEqual(client.post(url, {"file": upload}).status_code, 403)
+        token = "a" * 64
+        client.cookies[django.conf.settings.CSRF_COOKIE_NAME] = token
+        upload.seek(0)
+        response = client.post(url, {"file": upload}, HTTP_X_CSRFTOKEN=token)
+        self.assertEqual(response.status_code, 200)
+        document = models.Document.objects.get()
+        self.assertEqual(document.sha256, hashlib.sha256(self.CONTENT).hexdigest())
+        document.file.delete()
+
+
+@contextmanager
+def max_file_size(size):
+    """Override the max. file size enforced by the Document file field"""
+    field = models.Document._meta.get_field("file")
+    missing = object()
+    original = field.__dict__.get("max_file_size", missing)
+    field.max_file_size = size
+    try:
+        yield
+    finally:
+        if original is missing:
+            del field.max_file_size
+        else:
+            field.max_file_size = original
+
+
+class EarlyAbortTests(TestCase):
+    """
+    Test invalid uploads are aborted while they stream in, before they are spooled to disk in full
+    """
+
+    MAX_SIZE = 5000
+
+    def setUp(self):
+        super().setUp()
+        self.handler = uploads.DocumentUploadHandler(
+            max_files=1, check_content_type=True
+        )
+
+    def stream(self, content, chunk_size=1000, content_type="text/plain"):
+        """Stream content to the handler, return the number of bytes it received before aborting"""
+        self.handler.new_file("file", "upload.txt", content_type, len(content))
+        for start in range(0, len(content), chunk_size):
+            self.handler.receive_data_chunk(content[start : start + chunk_size], start)
+            received = start + chunk_size
+        self.handler.file_complete(len(content))
+        return received
+
+    def test_oversized(self):
+        with max_file_size(self.MAX_SIZE), self.assertRaises(StopUpload):
+            self.stream(b"x" * self.MAX_SIZE * 10)
+        self.assertEqual(self.handler.error.code, "file_too_large")
+        self.assertLessEqual(self.handler.file.tell(), self.MAX_SIZE)
+
+    def test_content_type(self):
+        html = b"<!DOCTYPE html><html><body>%s</body></html>" % (b"x" * 10000)
+        with self.assertRaises(StopUpload):
+            self.stream(html, content_type="text/html")
+        self.assertEqual(self.handler.error.code, "invalid_content_type")
+        self.assertLess(self.handler.file.tell(), len(html))
+
+    def test_content_type_not_checked(self):
+        html = b"<!DOCTYPE html><html><body>%s</body></html>" % (b"x" * 10000)
+        self.handler.check_content_type = False
+        self.stream(html, content_type="text/html")
+        self.assertIsNone(self.handler.error)
+        self.assertEqual(self.handler.file.size, len(html))
+
+    def test_abort_disallowed_uploads(self):
+        request = RequestFactory().post("/")
+        view = views.DocumentAjaxAPI()
+        view.setup(request)
+        self.assertFalse(view.upload_handler.check_content_type)
+        with base.app_settings(ABORT_DISALLOWED_UPLOADS=True):
+            view.setup(request)
+        self.assertTrue(view.upload_handler.check_content_type)
+
+    def test_content_length(self):
+        with max_file_size(self.MAX_SIZE):
+            self.handler.handle_raw_input(None, {}, self.MAX_SIZE * 100, b"boundary")
+            with self.assertRaises(StopUpload):
+                self.handler.new_file("file", "upload.txt", "text/plain", None)
+        self.assertEqual(self.handler.error.code, "file_too_large")
+
+    def test_api_post(self):
+        categories = base.create_document_categories()
+        user = base.create_user(permissions=("Can add document",))
+        self.client.force_login(user)
+        url = reverse(
+            "document_catalogue:api_post", kwargs={"slug": categories[1].slug}
+        )
+        upload = SimpleUploadedFile("big.txt", b"x" * self.MAX_SIZE * 2)
+        with max_file_size(self.MAX_SIZE):
+            response = self.client.post(url, {"file": upload})
+        self.assertEqual(response.status_code, 403)
+        self.assertIn(b"File size exceeds limit", response.content)
+        self.assertFalse(models.Document.objects.exists())
+
+    def test_edit_form(self):
+        categories = base.create_document_categories()
+        user = base.create_user(permissions=("Can add document", "Can change document"))
+        self.client.force_login(user)
+        document = base.create_document(user=user, category=categories[1])
+        url = reverse("document_catalogue:document_edit", kwargs={"pk": document.pk})
+        data = {
+            "title": "Edited",
+            "category": categories[1].pk,
+            "file": SimpleUploadedFile("big.txt", b"x" * self.MAX_SIZE * 2),
+        }
+        with max_file_size(self.MAX_SIZE):
+            response = self.client.post(url, data)
+        self.assertEqual(response.status_code, 200)  # form re-displayed with the error
+        self.assertIn(
+            "File size exceeds limit", response.context["form"].errors["file"][0]
+        )
+        document.refresh_from_db()
+        self.assertNotEqual(document.title, "Edited")
+        document.file.delete()
+
+
+class BatchUploadTests(TestCase):
+    """
+    Test many documents uploaded to a category in a single request
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.categories = base.create_document_categories()
+        self.category = self.categories[1]
+        self.user = base.create_user(
+            username="privileged", permissions=("Can add document",)
+        )
+        self.client.force_login(self.user)
+        self.url = reverse(
+            "document_catalogue:api_post_batch", kwargs={"slug": self.category.slug}
+        )
+
+    def tearDown(self):
+        for document in models.Document.objects.all():
+            document.file.delete()
+
+    @staticmethod
+    def files(names):
+        return [base.generate_simple_uploaded_file(name) for name in names]
+
+    def post(self, files):
+        return self.client.post(self.url, {"file": files})
+
+    def test_batch_upload(self):
+        existing = base.create_document(user=self.user, category=self.category)
+        names = ["batch%s.txt" % i for i in range(5)]
+        response = self.post(self.files(names))
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data["document_count"], 5)
+        documents = models.Document.objects.filter(category=self.category).exclude(
+            pk=existing.pk
+        )
+        self.assertEqual([d.title for d in documents], names)
+        self.assertEqual(
+            [d.sort_order for d in documents],
+            list(range(existing.sort_order + 1, existing.sort_order + 6)),
+        )
+        for document in documents:
+            self.assertIn(document.get_absolute_url(), data["document_items"])
+            self.assertIn(self.category.slug, document.file.name)
+
+    def test_batch_excludes_other_documents(self):
+        first = base.create_document(user=self.user, category=self.category)
+        # e.g., a document given a sort_order by hand, in the block allocated to the next batch
+        other = base.create_document(
+            user=self.user, category=self.category, sort_order=first.sort_order + 3
+        )
+        response = self.post(self.files(["batch%s.txt" % i for i in range(4)]))
+        data = response.json()
+        self.assertEqual(data["document_count"], 4)
+        self.assertNotIn(other.get_absolute_url(), data["document_items"])
+
+    def test_derived_data_updated(self):
+        category_tree = tree.get_category_tree()
+        self.assertEqual(
+            category_tree.get(self.category.slug).cumulative_document_count, 0
+        )
+        category_url = reverse(
+            "document_catalogue:category_list", kwargs={"slug": self.category.slug}
+        )
+        self.client.get(category_url)  # cache the category's document list
+        self.post(self.files(["alpha.txt", "beta.txt"]))
+        self.assertEqual(
+            tree.get_category_tree().get(self.category.slug).cumulative_document_count,
+            2,
+        )
+        results = search.get_search_backend().search(
+            models.Document.objects.all(), "beta"
+        )
+        self.assertEqual([d.title for d in results], ["beta.txt"])
+        self.assertContains(self.client.get(category_url), "alpha.txt")
+
+    def test_constant_queries(self):
+        def count_queries(n):
+            with CaptureQueriesContext(connection) as queries:
+                self.post(self.files(["doc%s.txt" % i for i in range(n)]))
+            return len(queries)
+
+        count_queries(1)  # start the category's sort_order sequence
+        self.assertEqual(count_queries(2), count_queries(10))
+
+    def test_content_addressed_batch(self):
+        with base.app_settings(CONTENT_ADDRESSED_STORAGE=True):
+            self.post(self.files(["one.txt", "two.txt"]))  # identical content
+        first, second = models.Document.objects.filter(category=self.category)
+        self.assertEqual(first.file.name, second.file.name)
+        self.assertEqual(first.sha256, second.sha256)
+
+    def test_rolled_back_batch(self):
+        names = ["rolled_back%s.txt" % i for i in range(3)]
+        backend = mock.Mock(**{"index_documents.side_effect": DatabaseError})
+        with mock.patch.object(search, "get_search_backend", return_value=backend):
+            with self.assertRaises(DatabaseError):
+                self.post(self.files(names))
+        self.assertFalse(models.Document.objects.exists())
+        storage = models.Document._meta.get_field("file").storage
+        for name in names:  # stored by bulk_create, before the batch was rolled back
+            path = models.document_upload_path_callback(
+                models.Document(category=self.category), name
+            )
+            self.assertFalse(storage.exists(path))
+
+    def test_invalid_file_rejects_batch(self):
+        html = SimpleUploadedFile(
+            "bad.html", b"<html></html>", content_type="text/html"
+        )
+        files = self.files(["good.txt"]) + [html]
+        response = self.post(files)
+        self.assertEqual(response.status_code, 403)
+        self.assertIn(b"Unsupported file type", response.content)
+        self.assertFalse(models.Document.objects.exists())
+
+    def test_no_files(self):
+        self.assertEqual(self.client.post(self.url).status_code, 403)
+
+    def test_permission_denied(self):
+        self.client.force_login(base.create_user(username="restricted"))
+        self.assertEqual(self.post(self.files(["doc.txt"])).status_code, 403)
+        self.assertFalse(models.Document.objects.exists())
+
+
+class ChunkedUploadTests(TestCase):
+    """
+    Test large documents uploaded in chunks, which may arrive in any order or be resumed
+    """
+
+    CONTENT = b"Hello World, this file is uploaded in chunks."
+    CHUNK_SIZE = 10
+
+    def setUp(self):
+        super().setUp()
+        self.categories = base.create_document_categories()
+        self.category = self.categories[1]
+        self.user = base.create_user(
+            username="privileged", permissions=("Can add document",)
+        )
+        self.client.force_login(self.user)
+        self.url = reverse(
+            "document_catalogue:api_post_chunked", kwargs={"slug": self.category.slug}
+        )
+        self.upload_id = str(uuid.uuid4())
+        self.chunks = [
+            self.CONTENT[i : i + self.CHUNK_SIZE]
+            for i in range(0, len(self.CONTENT), self.CHUNK_SIZE)
+        ]
+
+    def tearDown(self):
+        uploads.ChunkedUpload(self.upload_id, self.user).delete()
+        for document in models.Document.objects.all():
+            document.file.delete()
+
+    def post_chunk(self, index, **params):
+        data = {
+            "file": SimpleUploadedFile("chunked.txt", self.chunks[index]),
+            "dzuuid": self.upload_id,
+            "dzchunkindex": index,
+            "dztotalchunkcount": len(self.chunks),
+            "dztotalfilesize": len(self.CONTENT),
+            **params,
+        }
+        return self.client.post(self.url, data)
+
+    def finish(self):
+        return self.client.post(self.url, {"dzuuid": self.upload_id})
+
+    def status(self):
+        return self.client.get(self.url, {"dzuuid": self.upload_id}).json()
+
+    def test_chunked_upload(self):
+        for index in reversed(
+            range(len(self.chunks))
+        ):  # chunks may arrive in any order
+            self.assertEqual(self.post_chunk(index).status_code, 200)
+        response = self.finish()
+        self.assertEqual(response.status_code, 200)
+        document = models.Document.objects.get()
+        self.assertEqual(document.title, "chunked.txt")
+        self.assertEqual(document.category, self.category)
+        with document.file.open("rb") as file:
+            self.assertEqual(file.read(), self.CONTENT)
+        self.assertIn(document.get_absolute_url(), response.json()["document_item"])
+        self.assertEqual(self.status()["received"], [])  # staging area is cleaned up
+
+    def test_resume(self):
+        self.post_chunk(0)
+        self.post_chunk(2)
+        status = self.status()
+        self.assertEqual(status["received"], [0, 2])
+        self.assertEqual(status["total_chunks"], len(self.chunks))
+        self.assertFalse(status["complete"])
+        self.assertEqual(self.finish().status_code, 400)  # incomplete
+        for index in set(range(len(self.chunks))) - set(status["received"]):
+            self.post_chunk(index)
+        self.post_chunk(0)  # re-sent chunks replace the earlier copy
+        self.assertTrue(self.status()["complete"])
+        self.assertEqual(self.finish().status_code, 200)
+        with models.Document.objects.get().file.open("rb") as file:
+            self.assertEqual(file.read(), self.CONTENT)
+
+    def test_whole_file(self):
+        upload = SimpleUploadedFile("small.txt", b"Small enough to send whole")
+        response = self.client.post(self.url, {"file": upload})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(models.Document.objects.get().title, "small.txt")
+
+    def test_invalid_upload_id(self):
+        self.upload_id = "../../etc"
+        self.assertEqual(self.post_chunk(0).status_code, 400)
+        self.upload_id = str(uuid.uuid4())
+
+    def test_file_too_large(self):
+        response = self.post_chunk(0, dztotalfilesize=10**15)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.status()["received"], [])
+
+    def test_chunks_exceed_total_size(self):
+        response = self.post_chunk(0, dztotalfilesize=self.CHUNK_SIZE - 1)
+        self.assertEqual(response.status_code, 400)
+
+    def test_user_limit(self):
+        other_user = base.create_user(username="other")
+        other_upload = uploads.ChunkedUpload(uuid.uuid4(), other_user)
+        other_upload.start("other.txt", "", 1, 100)
+        self.assertEqual(self.post_chunk(0).status_code, 200)
+        another_id = str(uuid.uuid4())
+        with base.app_settings(CHUNKED_UPLOAD_USER_LIMIT=len(self.CONTENT) * 2 - 1):
+            response = self.post_chunk(0, dzuuid=another_id)
+            self.assertEqual(response.status_code, 400)
+            self.assertIn(b"Incomplete uploads exceed limit", response.content)
+            self.assertEqual(self.post_chunk(1).status_code, 200)  # started already
+        self.assertEqual(self.post_chunk(0, dzuuid=another_id).status_code, 200)
+        uploads.ChunkedUpload(another_id, self.user).delete()
+        other_upload.delete()
+
+    def test_invalid_file(self):
+        self.chunks = [b"<html></html>"]
+        self.client.post(
+            self.url,
+            {
+                "file": SimpleUploadedFile(
+                    "chunked.html", self.chunks[0], content_type="text/html"
+                ),
+                "dzuuid": self.upload_id,
+                "dzchunkindex": 0,
+                "dztotalchunkcount": 1,
+                "dztotalfilesize": len(self.chunks[0]),
+            },
+        )
+        self.assertEqual(self.finish().status_code, 403)
+        self.assertFalse(models.Document.objects.exists())
+        self.assertEqual(self.status()["received"], [])
+
+    def test_permission_denied(self):
+        self.client.force_login(base.create_user(username="restricted"))
+        self.assertEqual(self.post_chunk(0).status_code, 403)
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+    def test_purge_expired(self):
+        self.post_chunk(0)
+        uploads.purge_expired(expiry=60 * 60)
+        self.assertEqual(self.status()["received"], [0])
+        uploads.purge_expired(expiry=-1)
+        self.assertEqual(self.status()["received"], [])
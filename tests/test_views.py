@@ -1,9 +1,13 @@
 import os
+from collections import Counter
+from types import ModuleType
+from unittest import mock
 
+from django.contrib.auth.models import User
 from django.test import TestCase
 from django.urls import reverse
 
-from document_catalogue import models, permissions
+from document_catalogue import models, permission_resolver, permissions
 
 from . import base
 
@@ -61,6 +65,210 @@ class PermissionsTests(BaseTestWithUsers):
         self.assertTrue(permissions.user_can_delete_document(self.privilegedUser))
 
 
+class PermissionResolverTests(BaseTestWithUsers):
+    """
+    Test permissions are evaluated at most once per request
+    """
+
+    def test_memoised(self):
+        calls = []
+
+        def permission_fn(user, **kwargs):
+            calls.append(kwargs)
+            return True
+
+        resolver = permission_resolver.get_permission_resolver(self.restrictedUser)
+        self.assertTrue(resolver.check(permission_fn, pk=1))
+        self.assertTrue(resolver.check(permission_fn, pk=1))
+        self.assertTrue(resolver.check(permission_fn, pk=2))
+        self.assertEqual(calls, [{"pk": 1}, {"pk": 2}])
+
+    def test_per_user(self):
+        get_resolver = permission_resolver.get_permission_resolver
+        self.assertIs(
+            get_resolver(self.restrictedUser), get_resolver(self.restrictedUser)
+        )
+        user = User.objects.get(
+            pk=self.restrictedUser.pk
+        )  # as loaded for the next request
+        self.assertIsNot(get_resolver(user), get_resolver(self.restrictedUser))
+
+    def test_has_perm(self):
+        resolver = permission_resolver.get_permission_resolver(self.privilegedUser)
+        self.assertTrue(resolver.has_perm("user_can_edit_document"))
+        self.assertFalse(resolver.has_perm("no_such_permission"))
+        self.assertIn(("user_can_edit_document", True), resolver.get_state())
+
+    def test_custom_permissions(self):
+        module = ModuleType("custom_permissions")
+        module.user_can_view_document_catalogue = lambda user, **kwargs: True
+        module.user_is_author = lambda user, **kwargs: "author"
+        module._private = lambda user: True
+        module.settings = {}
+        functions = permission_resolver.get_permission_functions(module)
+        self.assertEqual(
+            sorted(functions), ["user_can_view_document_catalogue", "user_is_author"]
+        )
+        resolver = permission_resolver.get_permission_resolver(self.privilegedUser)
+        with mock.patch.dict(permission_resolver.PERMISSION_FUNCTIONS, functions):
+            self.assertEqual(resolver.get_context(pk=1)["user_is_author"](), "author")
+            self.assertTrue(resolver.has_perm("user_is_author", pk=1))
+            self.assertNotIn("user_is_author", dict(resolver.get_state(pk=1)))
+
+    def test_category_list_view(self):
+        category = self.categories[1]
+        documents = [
+            base.create_document(
+                filename="doc%s.txt" % i, user=self.privilegedUser, category=category
+            )
+            for i in range(3)
+        ]
+        self.login(self.privilegedUser)
+        url = reverse(
+            "document_catalogue:category_list", kwargs={"slug": category.slug}
+        )
+        with mock.patch.object(
+            User, "has_perm", autospec=True, side_effect=User.has_perm
+        ) as has_perm:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        perms = Counter(call.args[1] for call in has_perm.call_args_list)
+        self.assertTrue(perms)
+        self.assertEqual(max(perms.values()), 1, perms)
+        for document in documents:
+            document.file.delete()
+
+
+class QuerysetPermissionTests(BaseTestWithUsers):
+    """
+    Test the filter_viewable_ permission hooks restrict every list, search and count, for restricted users only
+    """
+
+    def setUp(self):
+        super().setUp()
+        top_1, sub_1a, sub_1b, top_2, sub_2a = self.categories
+        self.hidden_tree = top_1
+        self.hidden_title = "Secret"
+        self.documents = {
+            "visible": self.create_document("Visible Policy", sub_2a),
+            "secret": self.create_document("Secret Policy", sub_2a),
+            "hidden": self.create_document("Hidden Policy", sub_1a),
+        }
+
+    def tearDown(self):
+        for document in self.documents.values():
+            document.file.delete()
+        super().tearDown()
+
+    def create_document(self, title, category):
+        return base.create_document(
+            filename="%s.txt" % title.split()[0].lower(),
+            user=self.privilegedUser,
+            category=category,
+            title=title,
+        )
+
+    def filter_categories(self, user, queryset):
+        if user.pk != self.restrictedUser.pk:
+            return queryset
+        return queryset.exclude_subtrees([self.hidden_tree])
+
+    def filter_documents(self, user, queryset):
+        if user.pk != self.restrictedUser.pk:
+            return queryset
+        return queryset.exclude(title__startswith=self.hidden_title)
+
+    def get(self, user, url, **params):
+        self.login(user)
+        with mock.patch.multiple(
+            permissions,
+            filter_viewable_categories=self.filter_categories,
+            filter_viewable_documents=self.filter_documents,
+        ):
+            return self.client.get(url, params, HTTP_X_REQUESTED_WITH="XMLHttpRequest")
+
+    def category_counts(self, user):
+        response = self.get(user, reverse("document_catalogue:catalogue_list"))
+        return {
+            category.slug: category.cumulative_document_count
+            for category in response.context["object_list"]
+        }
+
+    def search_titles(self, user, term):
+        response = self.get(user, reverse("document_catalogue:api_search"), q=term)
+        return sorted(
+            child["text"]
+            for option in response.json()["options"]
+            for child in option["children"]
+        )
+
+    def test_catalogue_list(self):
+        self.assertEqual(
+            self.category_counts(self.privilegedUser),
+            {
+                "top-level-category-1": 1,
+                "sub-category-1a": 1,
+                "sub-category-1b": 0,
+                "top-level-category-2": 2,
+                "sub-category-2a": 2,
+            },
+        )
+        self.assertEqual(
+            self.category_counts(self.restrictedUser),
+            {"top-level-category-2": 1, "sub-category-2a": 1},
+        )
+
+    def test_category_list(self):
+        url = reverse(
+            "document_catalogue:category_list", kwargs={"slug": "sub-category-2a"}
+        )
+        # render the shared fragment first - the restricted user must not be served it
+        response = self.get(self.privilegedUser, url)
+        self.assertContains(response, "Secret Policy")
+        response = self.get(self.restrictedUser, url)
+        self.assertNotContains(response, "Secret Policy")
+        self.assertContains(response, "Visible Policy")
+        self.assertEqual(
+            list(response.context["document_list"]), [self.documents["visible"]]
+        )
+
+    def test_visibility_changed(self):
+        url = reverse(
+            "document_catalogue:category_list", kwargs={"slug": "sub-category-2a"}
+        )
+        response = self.get(self.restrictedUser, url)
+        self.assertContains(response, "Visible Policy")
+        # one document hidden and another shown in the same category - the count doesn't change
+        self.hidden_title = "Visible"
+        response = self.get(self.restrictedUser, url)
+        self.assertNotContains(response, "Visible Policy")
+        self.assertContains(response, "Secret Policy")
+
+    def test_hidden_category(self):
+        url = reverse(
+            "document_catalogue:category_list", kwargs={"slug": "sub-category-1a"}
+        )
+        self.assertEqual(self.get(self.privilegedUser, url).status_code, 200)
+        self.assertEqual(self.get(self.restrictedUser, url).status_code, 404)
+        url = reverse(
+            "document_catalogue:document_detail",
+            kwargs={"pk": self.documents["hidden"].pk},
+        )
+        self.assertEqual(self.get(self.restrictedUser, url).status_code, 404)
+
+    def test_search(self):
+        self.assertEqual(
+            self.search_titles(self.privilegedUser, "policy"),
+            ["Hidden Policy", "Secret Policy", "Visible Policy"],
+        )
+        self.assertEqual(
+            self.search_titles(self.restrictedUser, "policy"), ["Visible Policy"]
+        )
+        self.assertEqual(
+            self.search_titles(self.restrictedUser, ""), ["Visible Policy"]
+        )
+
+
 class SuccessDocumentViewTests(BaseTestWithUsers):
     """
     SUCCESS -- test privileged user makes perfectly reasonable requests
@@ -78,6 +286,19 @@ class SuccessDocumentViewTests(BaseTestWithUsers):
             "Catalogue view returned non-success status code.",
         )
 
+    def test_catalogue_list_view_document_counts(self):
+        self.login(self.restrictedUser)
+        document = base.create_document(user=self.privilegedUser)
+        url = reverse("document_catalogue:catalogue_list")
+        response = self.client.get(url)
+        counts = {
+            category.slug: category.cumulative_document_count
+            for category in response.context["object_list"]
+        }
+        self.assertEqual(counts[document.category.slug], 1)
+        self.assertContains(response, '<span class="badge">1</span>')
+        os.remove(document.file.path)
+
     def test_category_list_view(self):
         self.login(
             self.restrictedUser